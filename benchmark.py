@@ -0,0 +1,238 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import database
+from database import Database
+from engine import Engine
+from metrics import QUANTILES
+
+DEFAULT_SOURCE = 'synthetic://1920x1080@25'
+'''Источник кадров для камер по умолчанию'''
+DEFAULT_CAMERAS = (1, 4, 16)
+'''Число камер в сценариях по умолчанию'''
+
+REPORTED_STAGES = (
+    ('capture_read_seconds', 'read+wait'),
+    ('motion_seconds', 'motion'),
+    ('display_prepare_seconds', 'display'),
+    ('record_encode_seconds', 'encode'),
+    ('stream_copy_mux_seconds', 'mux'),
+    ('retention_seconds', 'retention'),
+)
+'''Этапы конвейера в отчёте: метрика и короткое название'''
+
+
+class DisplayConsumer(threading.Thread):
+    '''Имитация интерфейса: забирает кадры просмотра всех камер с частотой отображения'''
+
+    def __init__(self, engine, display_fps):
+        '''Инициализация потока'''
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.interval = 1.0 / display_fps
+        self.stop_event = threading.Event()
+        self.frames_shown = 0
+
+    def run(self):
+        '''Основной метод потока'''
+        while not self.stop_event.wait(self.interval):
+            for pipeline in list(self.engine.pipelines.values()):
+                if pipeline.mailbox is not None and pipeline.mailbox.take() is not None:
+                    self.frames_shown += 1
+
+    def stop(self):
+        '''Остановка потока'''
+        self.stop_event.set()
+        self.join()
+
+
+class ResourceSampler(threading.Thread):
+    '''Замер процессорного времени и пикового RSS текущего процесса вместе с процессами камер'''
+
+    INTERVAL = 0.5
+
+    def __init__(self):
+        '''Инициализация потока'''
+        super().__init__(daemon=True)
+        self.stop_event = threading.Event()
+        self.peak_rss = 0
+
+    def run(self):
+        '''Основной метод потока: периодический замер RSS'''
+        while not self.stop_event.wait(self.INTERVAL):
+            self.peak_rss = max(self.peak_rss, process_tree_usage()[1])
+
+    def stop(self):
+        '''Остановка потока'''
+        self.stop_event.set()
+        self.join()
+
+
+def process_tree_usage():
+    '''Процессорное время (секунды) и RSS (байты) текущего процесса и его дочерних процессов.
+    Без psutil дочерние процессы учитываются только на Linux через /proc'''
+    pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+    if psutil is not None:
+        cpu = rss = 0
+        for pid in pids:
+            try:
+                process = psutil.Process(pid)
+                times = process.cpu_times()
+                cpu += times.user + times.system
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return cpu, rss
+
+    if not os.path.exists('/proc/self/stat'):
+        times = os.times()
+        return times.user + times.system, 0
+
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    cpu = rss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # Имя процесса в скобках может содержать пробелы, поля считаются после него
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/statm') as f:
+                rss += int(f.read().split()[1]) * page_size
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+        except (OSError, IndexError, ValueError):
+            pass
+    return cpu, rss
+
+
+def samples_by_camera(samples, name):
+    '''Значения метрики по камерам: первая метрика с этим именем для каждой камеры'''
+    values = {}
+    for sample_name, labels, value in samples:
+        if sample_name == name and 'camera' in labels:
+            values.setdefault(labels['camera'], value)
+    return values
+
+
+def counter_delta(before, after, name, **labels):
+    '''Прирост счётчика за окно измерения, суммарно по камерам'''
+    def total(samples):
+        return sum(value for sample_name, sample_labels, value in samples
+                   if sample_name == name and all(sample_labels.get(k) == v for k, v in labels.items()))
+    return total(after) - total(before)
+
+
+def stage_quantiles(samples, name):
+    '''Квантили времени этапа (секунды) по худшей камере'''
+    result = {}
+    for sample_name, labels, value in samples:
+        if sample_name != name:
+            continue
+        for quantile, seconds in value[2].items():
+            result[quantile] = max(result.get(quantile, 0.0), seconds)
+    return result
+
+
+def run_scenario(cameras, source, duration, warmup, workdir, use_processes=False, display_fps=15,
+                 retention_interval=5):
+    '''Запуск конвейера на cameras камерах с источником source и замер показателей за duration секунд'''
+    scenario_dir = os.path.join(workdir, f'cameras_{cameras}')
+    destination = os.path.join(scenario_dir, 'records')
+    os.makedirs(destination)
+
+    Database.close()
+    database.DATABASE_PATH = os.path.join(scenario_dir, 'bench.db')
+    Database.start_database()
+    # Записи удаляются сразу после закрытия сегмента, чтобы служба хранения работала и диск не заполнялся
+    Database.insert_recording_settings(destination, 1, True, 0, True)
+    for index in range(cameras):
+        Database.insert_camera_settings('127.0.0.1', '', '', name=f'bench{index + 1}', record_url=source)
+
+    engine = Engine(display_fps, use_processes=use_processes, retention_interval=retention_interval)
+    consumer = DisplayConsumer(engine, display_fps) if display_fps else None
+    sampler = ResourceSampler()
+    try:
+        engine.start()
+        if consumer is not None:
+            consumer.start()
+        sampler.start()
+        time.sleep(warmup)
+
+        before = engine.collect_metrics()
+        cpu_before, _ = process_tree_usage()
+        started = time.monotonic()
+        time.sleep(duration)
+        after = engine.collect_metrics()
+        cpu_after, _ = process_tree_usage()
+        elapsed = time.monotonic() - started
+    finally:
+        sampler.stop()
+        if consumer is not None:
+            consumer.stop()
+        engine.stop()
+        Database.close()
+
+    read_before = samples_by_camera(before, 'frames_read_total')
+    read_after = samples_by_camera(after, 'frames_read_total')
+    camera_fps = [(read_after.get(camera, 0) - read_before.get(camera, 0)) / elapsed for camera in read_after]
+
+    return {
+        'cameras': cameras,
+        'source': source,
+        'processes': use_processes,
+        'duration': elapsed,
+        'fps_mean': sum(camera_fps) / len(camera_fps) if camera_fps else 0.0,
+        'fps_min': min(camera_fps) if camera_fps else 0.0,
+        'written_fps': counter_delta(before, after, 'record_frames_total', outcome='written') / elapsed,
+        'dropped': counter_delta(before, after, 'record_frames_total', outcome='dropped'),
+        'cpu_percent': 100.0 * (cpu_after - cpu_before) / elapsed,
+        'peak_rss_mb': sampler.peak_rss / 1024 ** 2,
+        'latency_ms': {
+            label: {str(q): seconds * 1000 for q, seconds in stage_quantiles(after, name).items()}
+            for name, label in REPORTED_STAGES if stage_quantiles(after, name)
+        },
+    }
+
+
+def format_result(result):
+    '''Текстовый отчёт по сценарию'''
+    lines = [
+        f"{result['cameras']} camera(s), {result['source']}{', processes' if result['processes'] else ''}: "
+        f"{result['fps_mean']:.1f} fps/camera (min {result['fps_min']:.1f}), written {result['written_fps']:.1f} fps, "
+        f"dropped {result['dropped']}, CPU {result['cpu_percent']:.0f}%, peak RSS {result['peak_rss_mb']:.0f} MB",
+    ]
+    quantile_names = '/'.join(f'p{int(q * 100)}' for q in QUANTILES)
+    for label, quantiles in result['latency_ms'].items():
+        values = '/'.join(f"{quantiles.get(str(q), 0.0):.2f}" for q in QUANTILES)
+        lines.append(f"    {label:<10} {quantile_names} ms: {values}")
+    return '\n'.join(lines)
+
+
+def run_benchmark(camera_counts=DEFAULT_CAMERAS, source=DEFAULT_SOURCE, duration=30, warmup=5,
+                  use_processes=False, display_fps=15, json_path=None):
+    '''Последовательный запуск сценариев и вывод отчёта; возвращает результаты сценариев'''
+    workdir = tempfile.mkdtemp(prefix='pydvr-bench-')
+    results = []
+    try:
+        for cameras in camera_counts:
+            logging.info(f"Benchmark: {cameras} camera(s), {duration} s")
+            result = run_scenario(cameras, source, duration, warmup, workdir, use_processes, display_fps)
+            print(format_result(result), flush=True)
+            results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
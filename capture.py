@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+
+try:
+    import av
+except ImportError:
+    av = None
+
+TRANSPORT_TCP = 'tcp'
+'''RTSP через TCP: без потерь пакетов на ненадёжных каналах'''
+TRANSPORT_UDP = 'udp'
+'''RTSP через UDP: меньше задержка, но пакеты могут теряться'''
+TRANSPORT_AUTO = 'auto'
+'''Сначала TCP, при неудаче UDP (поведение OpenCV по умолчанию)'''
+TRANSPORTS = (TRANSPORT_TCP, TRANSPORT_UDP, TRANSPORT_AUTO)
+
+BACKEND_FFMPEG = 'ffmpeg'
+BACKEND_GSTREAMER = 'gstreamer'
+BACKEND_ANY = 'any'
+'''Первый подходящий бэкенд OpenCV'''
+BACKENDS = {BACKEND_FFMPEG: cv2.CAP_FFMPEG, BACKEND_GSTREAMER: cv2.CAP_GSTREAMER, BACKEND_ANY: cv2.CAP_ANY}
+'''Бэкенды захвата OpenCV по названию в настройках камеры'''
+
+CaptureOptions = namedtuple('CaptureOptions', (
+    'transport', 'buffer_size', 'low_latency', 'open_timeout', 'read_timeout', 'decoder_threads', 'backend',
+))
+'''Параметры подключения к потоку камеры (столбцы camera_settings с теми же именами).
+buffer_size — кадров в буфере бэкенда (0 — по умолчанию), таймауты — секунды, decoder_threads — 0 для автовыбора'''
+
+DEFAULT_CAPTURE_OPTIONS = CaptureOptions(TRANSPORT_TCP, 0, False, 10, 10, 0, BACKEND_FFMPEG)
+'''Параметры подключения по умолчанию'''
+
+MIN_STREAM_FPS = 1
+MAX_STREAM_FPS = 120
+'''Пределы правдоподобной частоты кадров: некоторые камеры сообщают 0 или частоту тактов RTP'''
+
+FFMPEG_OPTIONS_VARIABLE = 'OPENCV_FFMPEG_CAPTURE_OPTIONS'
+'''Переменная окружения, из которой бэкенд FFmpeg OpenCV читает параметры при открытии потока'''
+
+
+def capture_options(camera):
+    '''Параметры подключения из настроек камеры'''
+    return CaptureOptions(*(getattr(camera, field) for field in CaptureOptions._fields))
+
+
+def ffmpeg_options(options, low_latency=None):
+    '''Параметры демультиплексора FFmpeg для подключения; low_latency переопределяет настройку камеры'''
+    result = {}
+    if options.transport == TRANSPORT_UDP:
+        result['rtsp_transport'] = 'udp'
+    elif options.transport == TRANSPORT_AUTO:
+        result['rtsp_flags'] = 'prefer_tcp'
+    else:
+        result['rtsp_transport'] = 'tcp'
+
+    if options.low_latency if low_latency is None else low_latency:
+        # Кадр отдаётся сразу после получения, без накопления для анализа и переупорядочивания
+        result['fflags'] = 'nobuffer'
+        result['max_delay'] = '0'
+        result['reorder_queue_size'] = '0'
+    return result
+
+
+class SharedEnvironment:
+    '''Переменная окружения, общая для потоков захвата: одновременно открываются только потоки
+    с одинаковым значением, остальные ждут, пока те откроются, но не дольше max_wait'''
+
+    MAX_WAIT = 1.0
+    '''Предельное ожидание (секунды). OpenCV читает переменную в самом начале открытия, поэтому после этого
+    недоступная камера, которая ждёт таймаута подключения, не должна задерживать остальные'''
+
+    def __init__(self, name, max_wait=MAX_WAIT):
+        '''Инициализация'''
+        self.name = name
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.value = None
+        self.users = 0
+
+    @contextmanager
+    def use(self, value):
+        '''Установка значения на время открытия потока'''
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.users == 0 or self.value == value, self.max_wait):
+                logging.warning(f"Capture options of another camera are still in use after {self.max_wait:.0f} s, "
+                                f"opening the stream anyway")
+            if self.value != value:
+                os.environ[self.name] = value
+                self.value = value
+            self.users += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.users -= 1
+                self.condition.notify_all()
+
+
+ffmpeg_environment = SharedEnvironment(FFMPEG_OPTIONS_VARIABLE)
+'''Параметры FFmpeg не передаются в cv2.VideoCapture напрямую, только через окружение процесса'''
+
+
+class PyAVCapture:
+    '''Захват потока через PyAV с интерфейсом cv2.VideoCapture (isOpened, read, get, set, release).
+    Параметры FFmpeg передаются при каждом открытии, а не через общее окружение процесса,
+    поэтому камеры с разными параметрами открываются независимо друг от друга'''
+
+    def __init__(self, url, options=DEFAULT_CAPTURE_OPTIONS):
+        '''Открытие потока; при ошибке isOpened() возвращает False'''
+        self.container = None
+        self.stream = None
+        self.frames = None
+        try:
+            self.container = av.open(url, options=ffmpeg_options(options),
+                                     timeout=(options.open_timeout, options.read_timeout))
+            self.stream = self.container.streams.video[0]
+            if options.decoder_threads > 0:
+                self.stream.codec_context.thread_count = options.decoder_threads
+            # Потоки по кадрам задерживают выдачу кадра на число потоков, по срезам — нет
+            self.stream.thread_type = 'SLICE' if options.low_latency else 'AUTO'
+            self.frames = self.container.decode(self.stream)
+        except Exception as e:
+            logging.error(f"Error opening the video stream: {str(e)}")
+            self.release()
+
+    def isOpened(self):
+        '''Открыт ли поток'''
+        return self.frames is not None
+
+    def read(self):
+        '''Следующий кадр BGR: (True, кадр) или (False, None) при ошибке или конце потока'''
+        if self.frames is None:
+            return False, None
+        try:
+            frame = next(self.frames)
+        except StopIteration:
+            return False, None
+        except Exception as e:
+            logging.error(f"Error reading the video stream: {str(e)}")
+            return False, None
+        return True, frame.to_ndarray(format='bgr24')
+
+    def get(self, prop):
+        '''Свойства потока в терминах cv2.CAP_PROP_*; неизвестные — 0'''
+        if self.stream is None:
+            return 0.0
+        if prop == cv2.CAP_PROP_FPS:
+            rate = self.stream.average_rate or self.stream.guessed_rate
+            return float(rate) if rate else 0.0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.stream.codec_context.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.stream.codec_context.height)
+        return 0.0
+
+    def set(self, prop, value):
+        '''Свойства не меняются: буферизацию задают параметры демультиплексора'''
+        return False
+
+    def getBackendName(self):
+        '''Название бэкенда'''
+        return 'PyAV'
+
+    def release(self):
+        '''Закрытие потока'''
+        self.frames = None
+        if self.container is not None:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+            self.container = None
+
+
+def stream_fps(capture):
+    '''Частота кадров, заявленная открытым потоком, или None, если она неизвестна или неправдоподобна'''
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    except Exception:
+        return None
+    return fps if MIN_STREAM_FPS <= fps <= MAX_STREAM_FPS else None
+
+
+def open_video_capture(url, options=DEFAULT_CAPTURE_OPTIONS):
+    '''Открытие потока камеры с транспортом, таймаутами, буфером и числом потоков декодера из options.
+    Бэкенд FFmpeg открывается через PyAV, если он установлен, иначе через OpenCV с параметрами в окружении'''
+    backend = BACKENDS.get(options.backend, cv2.CAP_FFMPEG)
+    if backend == cv2.CAP_FFMPEG and av is not None:
+        return PyAVCapture(url, options)
+    if backend != cv2.CAP_FFMPEG:
+        # Таймауты и число потоков другие бэкенды могут не поддерживать, а неподдержанный параметр отменяет открытие
+        capture = cv2.VideoCapture(url, backend)
+    else:
+        environment = '|'.join(f'{key};{value}' for key, value in ffmpeg_options(options).items())
+        with ffmpeg_environment.use(environment):
+            if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+                params = [
+                    cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, options.open_timeout * 1000,
+                    cv2.CAP_PROP_READ_TIMEOUT_MSEC, options.read_timeout * 1000,
+                ]
+                if options.decoder_threads > 0 and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+                    params += [cv2.CAP_PROP_N_THREADS, options.decoder_threads]
+                capture = cv2.VideoCapture(url, backend, params)
+            else:
+                capture = cv2.VideoCapture(url)
+
+    if options.buffer_size > 0 and capture.isOpened():
+        if not capture.set(cv2.CAP_PROP_BUFFERSIZE, options.buffer_size):
+            logging.debug(f"Capture backend {capture.getBackendName()} ignores the buffer size")
+    return capture
@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+from database import Database
+from thumbnails import THUMBNAIL_INTERVAL, unpack_offsets, find_keyframe
+
+PlaybackPosition = namedtuple('PlaybackPosition', ('segment', 'offset'))
+'''Сегмент и смещение от его начала (секунды), с которого начинается воспроизведение'''
+
+
+def find_recordings(camera_id, start_time, end_time):
+    '''Поиск сегментов камеры, пересекающихся с интервалом времени (секунды Unix)'''
+    return Database.get_segments_in_range(camera_id, start_time, end_time)
+
+
+def resolve_position(camera_id, timestamp):
+    '''Определение сегмента и смещения в нём для момента времени.
+    Если в этот момент записи нет, возвращается начало следующего сегмента, а если записей позже нет — None'''
+    segment = Database.get_segment_at(camera_id, timestamp)
+    if segment is not None and segment.end_time >= timestamp:
+        return PlaybackPosition(segment, timestamp - segment.start_time)
+
+    segment = Database.get_next_segment(camera_id, timestamp)
+    if segment is not None:
+        return PlaybackPosition(segment, 0.0)
+    return None
+
+
+def next_segment(segment):
+    '''Сегмент той же камеры, следующий за указанным, или None'''
+    return Database.get_next_segment(segment.camera_id, segment.start_time)
+
+
+def keyframe_position(position):
+    '''Позиция, перенесённая на ближайший предшествующий ключевой кадр по таблице сегмента:
+    воспроизведение начинается без декодирования кадров до нужного момента'''
+    offsets = unpack_offsets(Database.get_segment_keyframes(position.segment.path))
+    return PlaybackPosition(position.segment, find_keyframe(offsets, position.offset))
+
+
+def thumbnail_at(camera_id, timestamp, max_age=2 * THUMBNAIL_INTERVAL):
+    '''Миниатюра записи камеры на момент времени: (timestamp, JPEG) или None, если ближайшая предшествующая
+    миниатюра старше max_age секунд (в этот момент запись, скорее всего, не велась)'''
+    thumbnail = Database.get_thumbnail_at(camera_id, timestamp)
+    if thumbnail is None or timestamp - thumbnail[0] > max_age:
+        return None
+    return thumbnail
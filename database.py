@@ -1,92 +1,454 @@
 import sqlite3
+import threading
+from collections import namedtuple
+
+DATABASE_PATH = 'PyDVR.db'
+
+CAMERA_SETTINGS_COLUMNS = (
+    'id', 'name', 'ip', 'login', 'password', 'preview_url', 'record_url',
+    'transport', 'buffer_size', 'low_latency', 'open_timeout', 'read_timeout', 'decoder_threads', 'backend',
+)
+CameraSettings = namedtuple('CameraSettings', CAMERA_SETTINGS_COLUMNS)
+'''Настройки одной камеры в порядке столбцов таблицы camera_settings'''
+
+RECORDING_SETTINGS_COLUMNS = (
+    'destination', 'record_length', 'auto_delete', 'auto_delete_days', 'enable_record',
+    'recording_mode', 'container', 'max_storage_gb', 'min_free_gb',
+    'motion_recording', 'motion_sensitivity', 'motion_threshold', 'pre_roll', 'post_roll',
+)
+RecordingSettings = namedtuple('RecordingSettings', RECORDING_SETTINGS_COLUMNS)
+'''Настройки записи в порядке столбцов таблицы recording_settings'''
+
+SEGMENT_COLUMNS = ('id', 'camera_id', 'path', 'start_time', 'end_time', 'size')
+Segment = namedtuple('Segment', SEGMENT_COLUMNS)
+'''Записанный сегмент в порядке столбцов таблицы segments (время — секунды Unix)'''
 
 class Database:
+    _connection = None
+    _lock = threading.RLock()
+    _cache = {}
+    _subscribers = {'camera_settings': [], 'recording_settings': []}
+
+    @staticmethod
+    def get_connection():
+        """
+        Возвращает единственное долгоживущее соединение с базой данных, открывая его в режиме WAL при первом обращении.
+        """
+        with Database._lock:
+            if Database._connection is None:
+                conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                Database._connection = conn
+            return Database._connection
+
+    @staticmethod
+    def close():
+        """
+        Закрывает соединение с базой данных и сбрасывает кэш настроек.
+        """
+        with Database._lock:
+            if Database._connection is not None:
+                Database._connection.close()
+                Database._connection = None
+            Database._cache.clear()
+
     @staticmethod
     def start_database():
         """
         Инициализирует базу данных и вставляет значения настроек записи по умолчанию, если записей нет.
         """
         Database.initialize_database()
-        with sqlite3.connect('PyDVR.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM recording_settings')
-            count = cursor.fetchone()[0]
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*) FROM recording_settings')
+                count = cursor.fetchone()[0]
 
-            if count == 0:
-                conn.execute('''
-                    INSERT INTO recording_settings (id, destination, record_length, auto_delete, auto_delete_days, enable_record)
-                    VALUES (1, 'C:\\RecVid', 60, FALSE, 7, FALSE)
-                ''')
+                if count == 0:
+                    conn.execute('''
+                        INSERT INTO recording_settings (id, destination, record_length, auto_delete, auto_delete_days, enable_record)
+                        VALUES (1, 'C:\\RecVid', 60, FALSE, 7, FALSE)
+                    ''')
+
+            Database.load_cache()
 
     @staticmethod
     def initialize_database():
         """
         Инициализирует базу данных, создавая таблицы, если они не существуют.
         """
-        with sqlite3.connect('PyDVR.db') as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS camera_settings (
-                    id INTEGER PRIMARY KEY,
-                    ip TEXT NOT NULL,
-                    login TEXT NOT NULL,
-                    password TEXT NOT NULL
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS recording_settings (
-                    id INTEGER PRIMARY KEY,
-                    destination TEXT NOT NULL DEFAULT 'C:\\RecVid',
-                    record_length INTEGER NOT NULL DEFAULT 60,
-                    auto_delete BOOLEAN NOT NULL DEFAULT "TRUE",
-                    auto_delete_days INTEGER NOT NULL DEFAULT 7,
-                    enable_record BOOLEAN NOT NULL DEFAULT "TRUE"
-                )
-            ''')
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS camera_settings (
+                        id INTEGER PRIMARY KEY,
+                        ip TEXT NOT NULL,
+                        login TEXT NOT NULL,
+                        password TEXT NOT NULL
+                    )
+                ''')
+                Database.add_missing_columns(conn, 'camera_settings', {
+                    'name': "TEXT NOT NULL DEFAULT ''",
+                    'preview_url': "TEXT NOT NULL DEFAULT ''",
+                    'record_url': "TEXT NOT NULL DEFAULT ''",
+                    'transport': "TEXT NOT NULL DEFAULT 'tcp'",
+                    'buffer_size': "INTEGER NOT NULL DEFAULT 0",
+                    'low_latency': "BOOLEAN NOT NULL DEFAULT FALSE",
+                    'open_timeout': "INTEGER NOT NULL DEFAULT 10",
+                    'read_timeout': "INTEGER NOT NULL DEFAULT 10",
+                    'decoder_threads': "INTEGER NOT NULL DEFAULT 0",
+                    'backend': "TEXT NOT NULL DEFAULT 'ffmpeg'",
+                })
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS recording_settings (
+                        id INTEGER PRIMARY KEY,
+                        destination TEXT NOT NULL DEFAULT 'C:\\RecVid',
+                        record_length INTEGER NOT NULL DEFAULT 60,
+                        auto_delete BOOLEAN NOT NULL DEFAULT "TRUE",
+                        auto_delete_days INTEGER NOT NULL DEFAULT 7,
+                        enable_record BOOLEAN NOT NULL DEFAULT "TRUE"
+                    )
+                ''')
+                Database.add_missing_columns(conn, 'recording_settings', {
+                    'recording_mode': "TEXT NOT NULL DEFAULT 'transcode'",
+                    'container': "TEXT NOT NULL DEFAULT 'mp4'",
+                    'max_storage_gb': "INTEGER NOT NULL DEFAULT 0",
+                    'min_free_gb': "INTEGER NOT NULL DEFAULT 0",
+                    'motion_recording': "BOOLEAN NOT NULL DEFAULT FALSE",
+                    'motion_sensitivity': "INTEGER NOT NULL DEFAULT 25",
+                    'motion_threshold': "REAL NOT NULL DEFAULT 1.0",
+                    'pre_roll': "INTEGER NOT NULL DEFAULT 5",
+                    'post_roll': "INTEGER NOT NULL DEFAULT 10",
+                })
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS segments (
+                        id INTEGER PRIMARY KEY,
+                        camera_id INTEGER,
+                        path TEXT NOT NULL UNIQUE,
+                        start_time REAL NOT NULL,
+                        end_time REAL NOT NULL,
+                        size INTEGER NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS segments_start_time ON segments (start_time)')
+                conn.execute('CREATE INDEX IF NOT EXISTS segments_camera_start_time ON segments (camera_id, start_time)')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS segment_keyframes (
+                        path TEXT PRIMARY KEY,
+                        offsets BLOB NOT NULL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS thumbnails (
+                        id INTEGER PRIMARY KEY,
+                        camera_id INTEGER,
+                        timestamp REAL NOT NULL,
+                        image BLOB NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS thumbnails_camera_timestamp ON thumbnails (camera_id, timestamp)')
 
     @staticmethod
-    def insert_camera_settings(ip, login, password):
+    def add_missing_columns(conn, table, columns):
         """
-        Вставляет или заменяет настройки камеры в базе данных.
+        Добавляет в существующую таблицу столбцы, появившиеся в новых версиях схемы.
         """
-        with sqlite3.connect('PyDVR.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO camera_settings (id, ip, login, password)
-                VALUES (1, ?, ?, ?)
-            ''', (ip, login, password))
-            conn.commit()
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for name, definition in columns.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
     @staticmethod
-    def get_camera_settings():
+    def load_cache():
         """
-        Получает последние настройки камеры из базы данных.
+        Загружает текущие настройки из базы данных в кэш в памяти.
         """
-        with sqlite3.connect('PyDVR.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT ip, login, password FROM camera_settings ORDER BY id DESC LIMIT 1")
-            result = cursor.fetchone()
-            return result
+        with Database._lock:
+            cursor = Database.get_connection().cursor()
+            cursor.execute(f"SELECT {', '.join(CAMERA_SETTINGS_COLUMNS)} FROM camera_settings ORDER BY id")
+            Database._cache['camera_settings'] = [CameraSettings(*row) for row in cursor.fetchall()]
+            cursor.execute(f"SELECT {', '.join(RECORDING_SETTINGS_COLUMNS)} FROM recording_settings ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+            Database._cache['recording_settings'] = RecordingSettings(*row) if row else None
 
     @staticmethod
-    def insert_recording_settings(destination, record_length, auto_delete, auto_delete_days, enable_record):
+    def subscribe(key, callback):
+        """
+        Подписывает callback на изменение настроек ('camera_settings' или 'recording_settings').
+        Callback вызывается с новыми настройками в потоке, сохранившем их.
+        """
+        with Database._lock:
+            Database._subscribers[key].append(callback)
+
+    @staticmethod
+    def unsubscribe(key, callback):
+        """
+        Отменяет подписку на изменение настроек.
+        """
+        with Database._lock:
+            if callback in Database._subscribers[key]:
+                Database._subscribers[key].remove(callback)
+
+    @staticmethod
+    def notify(key, settings):
+        """
+        Обновляет кэш и оповещает подписчиков об изменении настроек.
+        """
+        with Database._lock:
+            Database._cache[key] = settings
+            subscribers = list(Database._subscribers[key])
+
+        for callback in subscribers:
+            callback(settings)
+
+    @staticmethod
+    def get_cached(key):
+        """
+        Возвращает настройки из кэша, загружая их из базы данных при первом обращении.
+        """
+        if key not in Database._cache:
+            Database.load_cache()
+        return Database._cache[key]
+
+    @staticmethod
+    def insert_camera_settings(ip, login, password, camera_id=None, name='', preview_url='', record_url='',
+                               transport='tcp', buffer_size=0, low_latency=False, open_timeout=10, read_timeout=10,
+                               decoder_threads=0, backend='ffmpeg'):
+        """
+        Добавляет новую камеру (camera_id=None) или заменяет настройки существующей.
+        Параметры подключения (transport ... backend) описаны в capture.CaptureOptions.
+        Возвращает идентификатор камеры.
+        """
+        settings = CameraSettings(camera_id, name, ip, login, password, preview_url, record_url,
+                                  transport, buffer_size, low_latency, open_timeout, read_timeout, decoder_threads, backend)
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                cursor = conn.execute(f'''
+                    INSERT OR REPLACE INTO camera_settings ({', '.join(CAMERA_SETTINGS_COLUMNS)})
+                    VALUES ({', '.join('?' * len(CAMERA_SETTINGS_COLUMNS))})
+                ''', settings)
+                camera_id = cursor.lastrowid if camera_id is None else camera_id
+
+            Database.load_cache()
+            cameras = Database._cache['camera_settings']
+
+        Database.notify('camera_settings', cameras)
+        return camera_id
+
+    @staticmethod
+    def delete_camera_settings(camera_id):
+        """
+        Удаляет камеру из базы данных.
+        """
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.execute('DELETE FROM camera_settings WHERE id = ?', (camera_id,))
+
+            cameras = [camera for camera in Database._cache.get('camera_settings', []) if camera.id != camera_id]
+
+        Database.notify('camera_settings', cameras)
+
+    @staticmethod
+    def get_cameras():
+        """
+        Получает настройки всех камер из кэша.
+        """
+        return Database.get_cached('camera_settings')
+
+    @staticmethod
+    def get_camera_settings(camera_id):
+        """
+        Получает настройки камеры из кэша или None, если камера не найдена.
+        """
+        for camera in Database.get_cameras():
+            if camera.id == camera_id:
+                return camera
+        return None
+
+    @staticmethod
+    def insert_recording_settings(destination, record_length, auto_delete, auto_delete_days, enable_record,
+                                  recording_mode='transcode', container='mp4', max_storage_gb=0, min_free_gb=0,
+                                  motion_recording=False, motion_sensitivity=25, motion_threshold=1.0, pre_roll=5, post_roll=10):
         """
         Вставляет или заменяет настройки записи в базе данных.
         """
-        with sqlite3.connect('PyDVR.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO recording_settings (id, destination, record_length, auto_delete, auto_delete_days, enable_record)
-                VALUES ((SELECT id FROM recording_settings LIMIT 1), ?, ?, ?, ?, ?)
-            ''', (destination, record_length, auto_delete, auto_delete_days, enable_record))
-            conn.commit()
+        settings = RecordingSettings(destination, record_length, auto_delete, auto_delete_days, enable_record,
+                                     recording_mode, container, max_storage_gb, min_free_gb,
+                                     motion_recording, motion_sensitivity, motion_threshold, pre_roll, post_roll)
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO recording_settings (id, {', '.join(RECORDING_SETTINGS_COLUMNS)})
+                    VALUES ((SELECT id FROM recording_settings LIMIT 1), {', '.join('?' * len(RECORDING_SETTINGS_COLUMNS))})
+                ''', settings)
+
+        Database.notify('recording_settings', settings)
 
     @staticmethod
     def get_recording_settings():
         """
-        Получает последние настройки записи из базы данных.
+        Получает последние настройки записи из кэша.
+        """
+        return Database.get_cached('recording_settings')
+
+    @staticmethod
+    def insert_segment(camera_id, path, start_time, end_time, size):
+        """
+        Добавляет законченный сегмент записи в индекс (время — секунды Unix).
+        """
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO segments (camera_id, path, start_time, end_time, size)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (camera_id, path, start_time, end_time, size))
+
+    @staticmethod
+    def has_segment(path):
+        """
+        Проверяет, есть ли в индексе сегмент с указанным файлом.
+        """
+        with Database._lock:
+            cursor = Database.get_connection().execute('SELECT 1 FROM segments WHERE path = ?', (path,))
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def index_segments(segments):
+        """
+        Добавляет в индекс сегменты (camera_id, path, start_time, end_time, size), пропуская уже проиндексированные пути.
+        """
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO segments (camera_id, path, start_time, end_time, size)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', segments)
+
+    @staticmethod
+    def query_segments(condition, parameters):
+        """
+        Выполняет запрос к индексу сегментов с указанным условием и возвращает список Segment.
+        """
+        with Database._lock:
+            cursor = Database.get_connection().execute(
+                f"SELECT {', '.join(SEGMENT_COLUMNS)} FROM segments {condition}", parameters)
+            return [Segment(*row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def get_segments_in_range(camera_id, start_time, end_time):
+        """
+        Получает сегменты камеры, пересекающиеся с интервалом [start_time, end_time], в порядке времени.
+        """
+        # Нижняя граница — начало последнего сегмента, начавшегося не позже start_time,
+        # чтобы оба условия по start_time использовали индекс (camera_id, start_time)
+        return Database.query_segments('''
+            WHERE camera_id = ?
+              AND start_time >= COALESCE((SELECT MAX(start_time) FROM segments WHERE camera_id = ? AND start_time <= ?), 0)
+              AND start_time <= ? AND end_time >= ?
+            ORDER BY start_time
+        ''', (camera_id, camera_id, start_time, end_time, start_time))
+
+    @staticmethod
+    def get_segment_at(camera_id, timestamp):
+        """
+        Получает сегмент камеры, начавшийся последним не позже указанного времени, или None.
+        """
+        segments = Database.query_segments('WHERE camera_id = ? AND start_time <= ? ORDER BY start_time DESC LIMIT 1',
+                                           (camera_id, timestamp))
+        return segments[0] if segments else None
+
+    @staticmethod
+    def get_next_segment(camera_id, timestamp):
+        """
+        Получает первый сегмент камеры, начавшийся позже указанного времени, или None.
+        """
+        segments = Database.query_segments('WHERE camera_id = ? AND start_time > ? ORDER BY start_time LIMIT 1',
+                                           (camera_id, timestamp))
+        return segments[0] if segments else None
+
+    @staticmethod
+    def get_segments_ended_before(timestamp, limit):
+        """
+        Получает самые старые сегменты, закончившиеся раньше указанного времени.
+        """
+        return Database.query_segments('WHERE start_time < ? AND end_time < ? ORDER BY start_time LIMIT ?',
+                                       (timestamp, timestamp, limit))
+
+    @staticmethod
+    def get_oldest_segments(limit):
+        """
+        Получает самые старые сегменты.
+        """
+        return Database.query_segments('ORDER BY start_time LIMIT ?', (limit,))
+
+    @staticmethod
+    def get_segments_total_size():
+        """
+        Получает суммарный размер проиндексированных сегментов в байтах.
+        """
+        with Database._lock:
+            cursor = Database.get_connection().execute('SELECT COALESCE(SUM(size), 0) FROM segments')
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def delete_segments(segment_ids):
+        """
+        Удаляет сегменты из индекса вместе с их ключевыми кадрами и миниатюрами.
+        """
+        parameters = [(segment_id,) for segment_id in segment_ids]
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.executemany('DELETE FROM segment_keyframes WHERE path = (SELECT path FROM segments WHERE id = ?)',
+                                 parameters)
+                conn.executemany('''
+                    DELETE FROM thumbnails WHERE id IN (
+                        SELECT thumbnails.id FROM segments JOIN thumbnails
+                            ON thumbnails.camera_id IS segments.camera_id
+                           AND thumbnails.timestamp BETWEEN segments.start_time AND segments.end_time
+                        WHERE segments.id = ?
+                    )
+                ''', parameters)
+                conn.executemany('DELETE FROM segments WHERE id = ?', parameters)
+
+    @staticmethod
+    def insert_segment_index(camera_id, path, keyframes, thumbnails):
+        """
+        Сохраняет таблицу ключевых кадров сегмента и его миниатюры [(timestamp, JPEG)] одной транзакцией.
+        """
+        with Database._lock:
+            conn = Database.get_connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO segment_keyframes (path, offsets) VALUES (?, ?)', (path, keyframes))
+                conn.executemany('INSERT INTO thumbnails (camera_id, timestamp, image) VALUES (?, ?, ?)',
+                                 [(camera_id, timestamp, image) for timestamp, image in thumbnails])
+
+    @staticmethod
+    def get_segment_keyframes(path):
+        """
+        Получает таблицу ключевых кадров сегмента или None, если она не сохранялась.
+        """
+        with Database._lock:
+            cursor = Database.get_connection().execute('SELECT offsets FROM segment_keyframes WHERE path = ?', (path,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    @staticmethod
+    def get_thumbnail_at(camera_id, timestamp):
+        """
+        Получает последнюю миниатюру камеры не позже указанного времени: (timestamp, JPEG) или None.
         """
-        with sqlite3.connect('PyDVR.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT destination, record_length, auto_delete, auto_delete_days, enable_record FROM recording_settings ORDER BY id DESC LIMIT 1")
-            result = cursor.fetchone()
-            return result
\ No newline at end of file
+        with Database._lock:
+            cursor = Database.get_connection().execute('''
+                SELECT timestamp, image FROM thumbnails WHERE camera_id = ? AND timestamp <= ?
+                ORDER BY timestamp DESC LIMIT 1
+            ''', (camera_id, timestamp))
+            return cursor.fetchone()
@@ -0,0 +1,401 @@
+import logging
+import os
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QGridLayout, QWidget, QLabel, QLineEdit, QPushButton, QMessageBox, QSpinBox, QDoubleSpinBox, QCheckBox, QFileDialog, QComboBox, QListWidget, QListWidgetItem
+from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, pyqtSignal
+from database import Database
+from recorder import RECORDING_MODE_TRANSCODE, RECORDING_MODE_STREAM_COPY
+from remux import STREAM_COPY_CONTAINERS
+from engine import DEFAULT_STREAM_URL
+from capture import DEFAULT_CAPTURE_OPTIONS, TRANSPORT_TCP, TRANSPORT_UDP, TRANSPORT_AUTO, BACKEND_FFMPEG, BACKEND_GSTREAMER, BACKEND_ANY
+
+class CameraSettingsDialog(QMainWindow):
+    '''Диалоговое окно для настроек камер'''
+    camera_saved_signal = pyqtSignal(int)
+    '''Сигнал о сохранении настроек камеры (передаётся идентификатор камеры)'''
+    camera_removed_signal = pyqtSignal(int)
+    '''Сигнал об удалении камеры (передаётся идентификатор камеры)'''
+
+    def __init__(self, parent=None):
+        '''Инициализация диалогового окна'''
+        super().__init__(parent)
+        
+        self.setWindowTitle("Настройки камер")
+        self.setGeometry(100, 100, 500, 300)
+        self.setFixedSize(300, 760)
+        
+        self.central_widget = QWidget(self)
+        self.setCentralWidget(self.central_widget)
+        
+        self.main_layout = QVBoxLayout()
+        
+        self.setup_camera_tab()
+        
+        self.central_widget.setLayout(self.main_layout)
+
+        self.load_cameras()
+        
+        icon = QIcon('icons/settings_icon.ico')
+        self.setWindowIcon(icon)
+
+    def setup_camera_tab(self):
+        '''Настройка внешнего вида вкладки с настройками камеры'''
+        self.camera_list = QListWidget()
+        self.camera_list.currentRowChanged.connect(self.load_selected_camera)
+
+        self.new_button = QPushButton("Новая камера", self)
+        self.new_button.clicked.connect(self.new_camera)
+
+        self.name_label = QLabel("Название:")
+        self.name_edit = QLineEdit()
+        self.ip_label = QLabel("IP-адрес:")
+        self.ip_edit = QLineEdit()
+        self.login_label = QLabel("Логин:")
+        self.login_edit = QLineEdit()
+        self.password_label = QLabel("Пароль:")
+        self.password_edit = QLineEdit()
+        self.password_edit.setEchoMode(QLineEdit.Password)
+
+        url_hint = "Можно использовать {ip}, {login} и {password}"
+        self.record_url_label = QLabel("Поток записи (пусто — по умолчанию):")
+        self.record_url_edit = QLineEdit()
+        self.record_url_edit.setPlaceholderText(DEFAULT_STREAM_URL)
+        self.record_url_edit.setToolTip(url_hint)
+        self.preview_url_label = QLabel("Поток просмотра (пусто — как у записи):")
+        self.preview_url_edit = QLineEdit()
+        self.preview_url_edit.setPlaceholderText("rtsp://{login}:{password}@{ip}:554/onvif2")
+        self.preview_url_edit.setToolTip(url_hint)
+
+        self.transport_combobox = QComboBox()
+        self.transport_combobox.addItem("TCP", TRANSPORT_TCP)
+        self.transport_combobox.addItem("UDP", TRANSPORT_UDP)
+        self.transport_combobox.addItem("Авто (сначала TCP)", TRANSPORT_AUTO)
+        self.transport_combobox.setToolTip("UDP теряет пакеты на ненадёжных каналах, TCP их переотправляет")
+
+        self.low_latency_checkbox = QCheckBox("Минимальная задержка просмотра")
+        self.low_latency_checkbox.setToolTip("Кадры выдаются без буферизации демультиплексора FFmpeg")
+
+        self.buffer_size_spinbox = QSpinBox()
+        self.buffer_size_spinbox.setRange(0, 100)
+        self.buffer_size_spinbox.setSpecialValueText("по умолчанию")
+        self.buffer_size_spinbox.setToolTip("Учитывается бэкендами, которые его поддерживают (например, GStreamer)")
+
+        self.open_timeout_spinbox = QSpinBox()
+        self.open_timeout_spinbox.setRange(1, 120)
+        self.read_timeout_spinbox = QSpinBox()
+        self.read_timeout_spinbox.setRange(1, 120)
+
+        self.decoder_threads_spinbox = QSpinBox()
+        self.decoder_threads_spinbox.setRange(0, 64)
+        self.decoder_threads_spinbox.setSpecialValueText("авто")
+
+        self.backend_combobox = QComboBox()
+        self.backend_combobox.addItem("FFmpeg", BACKEND_FFMPEG)
+        self.backend_combobox.addItem("GStreamer", BACKEND_GSTREAMER)
+        self.backend_combobox.addItem("Любой", BACKEND_ANY)
+
+        capture_layout = QGridLayout()
+        capture_layout.addWidget(QLabel("Транспорт RTSP:"), 0, 0)
+        capture_layout.addWidget(self.transport_combobox, 0, 1)
+        capture_layout.addWidget(QLabel("Бэкенд:"), 1, 0)
+        capture_layout.addWidget(self.backend_combobox, 1, 1)
+        capture_layout.addWidget(QLabel("Буфер (кадры):"), 2, 0)
+        capture_layout.addWidget(self.buffer_size_spinbox, 2, 1)
+        capture_layout.addWidget(QLabel("Таймаут открытия (с):"), 3, 0)
+        capture_layout.addWidget(self.open_timeout_spinbox, 3, 1)
+        capture_layout.addWidget(QLabel("Таймаут чтения (с):"), 4, 0)
+        capture_layout.addWidget(self.read_timeout_spinbox, 4, 1)
+        capture_layout.addWidget(QLabel("Потоки декодера:"), 5, 0)
+        capture_layout.addWidget(self.decoder_threads_spinbox, 5, 1)
+
+        self.connect_button = QPushButton("Подключиться", self)
+        self.connect_button.clicked.connect(self.connect_to_camera)
+
+        self.remove_button = QPushButton("Удалить камеру", self)
+        self.remove_button.clicked.connect(self.remove_camera)
+        
+        self.main_layout.addWidget(self.camera_list)
+        self.main_layout.addWidget(self.new_button)
+        self.main_layout.addWidget(self.name_label)
+        self.main_layout.addWidget(self.name_edit)
+        self.main_layout.addWidget(self.ip_label)
+        self.main_layout.addWidget(self.ip_edit)
+        self.main_layout.addWidget(self.login_label)
+        self.main_layout.addWidget(self.login_edit)
+        self.main_layout.addWidget(self.password_label)
+        self.main_layout.addWidget(self.password_edit)
+        self.main_layout.addWidget(self.record_url_label)
+        self.main_layout.addWidget(self.record_url_edit)
+        self.main_layout.addWidget(self.preview_url_label)
+        self.main_layout.addWidget(self.preview_url_edit)
+        self.main_layout.addLayout(capture_layout)
+        self.main_layout.addWidget(self.low_latency_checkbox)
+        self.main_layout.addWidget(self.connect_button)
+        self.main_layout.addWidget(self.remove_button)
+
+    def load_cameras(self, selected_id=None):
+        '''Заполнение списка камер из базы данных'''
+        self.camera_list.blockSignals(True)
+        self.camera_list.clear()
+        for camera in Database.get_cameras():
+            item = QListWidgetItem(camera.name or camera.ip)
+            item.setData(Qt.UserRole, camera.id)
+            self.camera_list.addItem(item)
+            if camera.id == selected_id:
+                self.camera_list.setCurrentItem(item)
+        self.camera_list.blockSignals(False)
+
+        if self.camera_list.currentRow() < 0 and self.camera_list.count() > 0:
+            self.camera_list.setCurrentRow(0)
+        else:
+            self.load_selected_camera(self.camera_list.currentRow())
+
+    def current_camera_id(self):
+        '''Идентификатор выбранной камеры или None для новой камеры'''
+        item = self.camera_list.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+
+    def load_selected_camera(self, row):
+        '''Отображение настроек выбранной камеры'''
+        camera = Database.get_camera_settings(self.current_camera_id()) if row >= 0 else None
+        self.name_edit.setText(camera.name if camera else "")
+        self.ip_edit.setText(camera.ip if camera else "")
+        self.login_edit.setText(camera.login if camera else "")
+        self.password_edit.setText(camera.password if camera else "")
+        self.record_url_edit.setText(camera.record_url if camera else "")
+        self.preview_url_edit.setText(camera.preview_url if camera else "")
+
+        options = camera if camera else DEFAULT_CAPTURE_OPTIONS
+        self.transport_combobox.setCurrentIndex(max(0, self.transport_combobox.findData(options.transport)))
+        self.backend_combobox.setCurrentIndex(max(0, self.backend_combobox.findData(options.backend)))
+        self.buffer_size_spinbox.setValue(options.buffer_size)
+        self.open_timeout_spinbox.setValue(options.open_timeout)
+        self.read_timeout_spinbox.setValue(options.read_timeout)
+        self.decoder_threads_spinbox.setValue(options.decoder_threads)
+        self.low_latency_checkbox.setChecked(bool(options.low_latency))
+        self.remove_button.setEnabled(camera is not None)
+
+    def new_camera(self):
+        '''Очистка полей для добавления новой камеры'''
+        self.camera_list.setCurrentRow(-1)
+        self.load_selected_camera(-1)
+
+    def connect_to_camera(self):
+        '''Метод для сохранения настроек и подключения камеры по указанным параметрам'''
+        try:
+            name = self.name_edit.text()
+            ip = self.ip_edit.text()
+            login = self.login_edit.text()
+            password = self.password_edit.text()
+            record_url = self.record_url_edit.text().strip()
+            preview_url = self.preview_url_edit.text().strip()
+            
+            if not ip or not login or not password:
+                QMessageBox.warning(self, "Предупреждение", "Введите IP, логин и пароль.")
+                return
+
+            camera_id = Database.insert_camera_settings(
+                ip, login, password, self.current_camera_id(), name, preview_url, record_url,
+                transport=self.transport_combobox.currentData(),
+                buffer_size=self.buffer_size_spinbox.value(),
+                low_latency=self.low_latency_checkbox.isChecked(),
+                open_timeout=self.open_timeout_spinbox.value(),
+                read_timeout=self.read_timeout_spinbox.value(),
+                decoder_threads=self.decoder_threads_spinbox.value(),
+                backend=self.backend_combobox.currentData(),
+            )
+            self.load_cameras(camera_id)
+            self.camera_saved_signal.emit(camera_id)
+            self.hide()
+        except Exception as e:
+            logging.error(f"Unexpected error connecting to the camera: {str(e)}")
+            QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
+
+    def remove_camera(self):
+        '''Метод для удаления выбранной камеры'''
+        camera_id = self.current_camera_id()
+        if camera_id is None:
+            return
+
+        try:
+            Database.delete_camera_settings(camera_id)
+            self.load_cameras()
+            self.camera_removed_signal.emit(camera_id)
+        except Exception as e:
+            logging.error(f"Ошибка удаления камеры: {str(e)}")
+            QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
+
+class RecordingSettingsDialog(QMainWindow):
+    '''Диалоговое окно для настроек записи видео'''
+    def __init__(self, parent=None):
+        '''Инициализация диалогового окна'''
+        super().__init__(parent)
+
+        self.setWindowTitle("Настройки записи")
+        self.setGeometry(100, 100, 500, 300)
+        self.setFixedSize(300, 760)
+
+        self.central_widget = QWidget(self)
+        self.setCentralWidget(self.central_widget)
+
+        self.main_layout = QVBoxLayout()
+
+        self.setup_recording_tab()
+
+        self.central_widget.setLayout(self.main_layout)
+
+        self.load_recording_settings()
+        icon = QIcon('icons/settings_icon.ico')
+        self.setWindowIcon(icon)
+
+    def setup_recording_tab(self):
+        '''Настройка внешнего вида вкладки с настройками записи видео'''
+        self.destination_label = QLabel("Место хранения:")
+        self.destination_edit = QLineEdit()
+        self.browse_button = QPushButton("Обзор", self)
+        self.browse_button.clicked.connect(self.browse_destination)
+
+        self.record_length_label = QLabel("Длительность видео (минуты):")
+        self.record_length_spinbox = QSpinBox()
+        self.record_length_spinbox.setMinimum(1)
+        self.record_length_spinbox.setMaximum(600)
+
+        self.auto_delete_checkbox = QCheckBox("Включить автоматическое удаление")
+        self.auto_delete_days_label = QLabel("Автоматическое удаление через (дни):")
+        self.auto_delete_days_spinbox = QSpinBox()
+        self.auto_delete_days_spinbox.setMinimum(1)
+        self.auto_delete_days_spinbox.setMaximum(365)
+
+        self.motion_recording_checkbox = QCheckBox("Записывать только при движении")
+        self.motion_sensitivity_label = QLabel("Чувствительность к изменению яркости (1-255, меньше — чувствительнее):")
+        self.motion_sensitivity_label.setWordWrap(True)
+        self.motion_sensitivity_spinbox = QSpinBox()
+        self.motion_sensitivity_spinbox.setMinimum(1)
+        self.motion_sensitivity_spinbox.setMaximum(255)
+        self.motion_threshold_label = QLabel("Порог движения (% изменившихся пикселей):")
+        self.motion_threshold_spinbox = QDoubleSpinBox()
+        self.motion_threshold_spinbox.setMinimum(0.1)
+        self.motion_threshold_spinbox.setMaximum(100)
+        self.motion_threshold_spinbox.setSingleStep(0.1)
+        self.pre_roll_label = QLabel("Предзапись (секунды):")
+        self.pre_roll_spinbox = QSpinBox()
+        self.pre_roll_spinbox.setMaximum(30)
+        self.post_roll_label = QLabel("Запись после окончания движения (секунды):")
+        self.post_roll_spinbox = QSpinBox()
+        self.post_roll_spinbox.setMinimum(1)
+        self.post_roll_spinbox.setMaximum(600)
+
+        self.max_storage_label = QLabel("Максимальный объём записей (ГБ, 0 — без ограничения):")
+        self.max_storage_label.setWordWrap(True)
+        self.max_storage_spinbox = QSpinBox()
+        self.max_storage_spinbox.setMaximum(1000000)
+
+        self.min_free_label = QLabel("Минимум свободного места (ГБ, 0 — не проверять):")
+        self.min_free_label.setWordWrap(True)
+        self.min_free_spinbox = QSpinBox()
+        self.min_free_spinbox.setMaximum(1000000)
+
+        self.enable_record_checkbox = QCheckBox("Включить запись")
+
+        self.recording_mode_label = QLabel("Режим записи:")
+        self.recording_mode_combobox = QComboBox()
+        self.recording_mode_combobox.addItem("Перекодирование (MPEG-4)", RECORDING_MODE_TRANSCODE)
+        self.recording_mode_combobox.addItem("Без перекодирования (H.264/H.265)", RECORDING_MODE_STREAM_COPY)
+
+        self.container_label = QLabel("Контейнер (без перекодирования):")
+        self.container_combobox = QComboBox()
+        for container in STREAM_COPY_CONTAINERS:
+            self.container_combobox.addItem(container.upper(), container)
+
+        self.apply_button = QPushButton("Применить", self)
+        self.apply_button.clicked.connect(self.apply_recording_settings)
+
+        self.main_layout.addWidget(self.destination_label)
+        self.main_layout.addWidget(self.destination_edit)
+        self.main_layout.addWidget(self.browse_button)
+        self.main_layout.addWidget(self.record_length_label)
+        self.main_layout.addWidget(self.record_length_spinbox)
+        self.main_layout.addWidget(self.enable_record_checkbox)        
+        self.main_layout.addWidget(self.recording_mode_label)
+        self.main_layout.addWidget(self.recording_mode_combobox)
+        self.main_layout.addWidget(self.container_label)
+        self.main_layout.addWidget(self.container_combobox)
+        self.main_layout.addWidget(self.auto_delete_days_label)
+        self.main_layout.addWidget(self.auto_delete_days_spinbox)
+        self.main_layout.addWidget(self.auto_delete_checkbox)
+        self.main_layout.addWidget(self.motion_recording_checkbox)
+        self.main_layout.addWidget(self.motion_sensitivity_label)
+        self.main_layout.addWidget(self.motion_sensitivity_spinbox)
+        self.main_layout.addWidget(self.motion_threshold_label)
+        self.main_layout.addWidget(self.motion_threshold_spinbox)
+        self.main_layout.addWidget(self.pre_roll_label)
+        self.main_layout.addWidget(self.pre_roll_spinbox)
+        self.main_layout.addWidget(self.post_roll_label)
+        self.main_layout.addWidget(self.post_roll_spinbox)
+        self.main_layout.addWidget(self.max_storage_label)
+        self.main_layout.addWidget(self.max_storage_spinbox)
+        self.main_layout.addWidget(self.min_free_label)
+        self.main_layout.addWidget(self.min_free_spinbox)
+        self.main_layout.addWidget(self.apply_button)
+
+    def browse_destination(self):
+        '''Метод для выбора папки для сохранения записей'''
+        folder_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
+        if folder_path:
+            folder_path = folder_path.replace("/", "\\")  
+            self.destination_edit.setText(folder_path)
+
+    def apply_recording_settings(self):
+        '''Метод для применения настроек записи'''
+        try:
+            destination = self.destination_edit.text()
+
+            if not os.path.exists(destination):
+                QMessageBox.warning(self, "Ошибка", "Путь не существует или программа не имеет доступа.")
+                return
+
+            record_length = self.record_length_spinbox.value()
+            auto_delete = self.auto_delete_checkbox.isChecked()
+            auto_delete_days = self.auto_delete_days_spinbox.value()
+            enable_record = self.enable_record_checkbox.isChecked()
+            recording_mode = self.recording_mode_combobox.currentData()
+            container = self.container_combobox.currentData()
+            max_storage_gb = self.max_storage_spinbox.value()
+            min_free_gb = self.min_free_spinbox.value()
+            motion_recording = self.motion_recording_checkbox.isChecked()
+            motion_sensitivity = self.motion_sensitivity_spinbox.value()
+            motion_threshold = self.motion_threshold_spinbox.value()
+            pre_roll = self.pre_roll_spinbox.value()
+            post_roll = self.post_roll_spinbox.value()
+
+            Database.insert_recording_settings(destination, record_length, auto_delete, auto_delete_days, enable_record,
+                                               recording_mode, container, max_storage_gb, min_free_gb,
+                                               motion_recording, motion_sensitivity, motion_threshold, pre_roll, post_roll)
+
+            QMessageBox.information(self, "Успешно!", "Настройки записи применены.")
+            self.close()
+        except Exception as e:
+            logging.error(f"Ошибка сохранения настроек: {str(e)}")
+            QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
+
+    def load_recording_settings(self):
+        '''Метод для загрузки текущих настроек записи'''
+        try:
+            settings = Database.get_recording_settings()
+
+            self.destination_edit.setText(settings.destination)
+            self.record_length_spinbox.setValue(settings.record_length)
+            self.auto_delete_checkbox.setChecked(bool(settings.auto_delete))
+            self.auto_delete_days_spinbox.setValue(settings.auto_delete_days)
+            self.enable_record_checkbox.setChecked(bool(settings.enable_record))
+            self.recording_mode_combobox.setCurrentIndex(max(0, self.recording_mode_combobox.findData(settings.recording_mode)))
+            self.container_combobox.setCurrentIndex(max(0, self.container_combobox.findData(settings.container)))
+            self.max_storage_spinbox.setValue(settings.max_storage_gb)
+            self.min_free_spinbox.setValue(settings.min_free_gb)
+            self.motion_recording_checkbox.setChecked(bool(settings.motion_recording))
+            self.motion_sensitivity_spinbox.setValue(settings.motion_sensitivity)
+            self.motion_threshold_spinbox.setValue(settings.motion_threshold)
+            self.pre_roll_spinbox.setValue(settings.pre_roll)
+            self.post_roll_spinbox.setValue(settings.post_roll)
+        except Exception as e:
+            logging.error(f"Ошибка загрузки настроек записи: {str(e)}")
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import cv2
+
+from metrics import StageTimer
+
+
+def prepare_display_frame(frame, width, height):
+    '''Уменьшение кадра BGR до размера области просмотра с сохранением пропорций и перевод в RGB'''
+    h, w = frame.shape[:2]
+
+    aspect_ratio = w / h
+
+    new_width = max(1, min(width, int(height * aspect_ratio)))
+    new_height = max(1, min(height, int(width / aspect_ratio)))
+
+    # Сначала уменьшаем, затем конвертируем цвета: конвертация идёт по уже маленькому кадру
+    scaled_frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(scaled_frame, cv2.COLOR_BGR2RGB)
+
+
+class FrameMailbox:
+    '''Ячейка на один кадр для просмотра: поток захвата кладёт последний кадр, таймер интерфейса забирает его.
+    Новый кадр заменяет непрочитанный, поэтому очередь кадров не накапливается'''
+
+    def __init__(self, display_fps=15):
+        '''Инициализация ячейки'''
+        self.lock = threading.Lock()
+        self.frame = None
+        self.min_interval = 1.0 / display_fps
+        self.last_put = 0.0
+        self.target_size = (640, 360)
+
+        self.frames_put = 0
+        self.frames_taken = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.prepare_timer = StageTimer()
+
+    def set_target_size(self, width, height):
+        '''Размер области просмотра, под который готовятся кадры (вызывается из интерфейса)'''
+        self.target_size = (max(1, width), max(1, height))
+
+    def offer(self, frame):
+        '''Подготовка и размещение кадра BGR из потока захвата.
+        Кадры, пришедшие чаще частоты отображения, пропускаются без конвертации'''
+        now = time.monotonic()
+        if now - self.last_put < self.min_interval:
+            with self.lock:
+                self.frames_skipped += 1
+            return False
+
+        self.last_put = now
+        width, height = self.target_size
+        started = time.perf_counter()
+        prepared = prepare_display_frame(frame, width, height)
+        self.prepare_timer.add(time.perf_counter() - started)
+        self.put(prepared)
+        return True
+
+    def put(self, frame):
+        '''Размещение готового кадра RGB с заменой непрочитанного'''
+        with self.lock:
+            if self.frame is not None:
+                self.frames_dropped += 1
+            self.frame = frame
+            self.frames_put += 1
+
+    def take(self):
+        '''Получение последнего кадра или None, если нового кадра нет'''
+        with self.lock:
+            frame, self.frame = self.frame, None
+            if frame is not None:
+                self.frames_taken += 1
+            return frame
+
+    def clear(self):
+        '''Сброс непрочитанного кадра'''
+        with self.lock:
+            self.frame = None
+
+    def get_counters(self):
+        '''Получение счётчиков кадров: размещено, показано, пропущено по частоте, вытеснено непрочитанными'''
+        with self.lock:
+            return {
+                'put': self.frames_put,
+                'taken': self.frames_taken,
+                'skipped': self.frames_skipped,
+                'dropped': self.frames_dropped,
+            }
@@ -0,0 +1,524 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+from database import Database
+from recorder import RecorderWorker, OVERFLOW_DROP_OLDEST, RECORDING_MODE_STREAM_COPY, RECORDING_MODE_TRANSCODE
+from remux import STREAM_COPY_AVAILABLE, StreamCopyRecorder
+from retention import RetentionService
+from motion import MotionGate
+from display import FrameMailbox
+from reconnect import Backoff, STATE_CONNECTING, STATE_STREAMING, STATE_BACKOFF, STATE_FAILED, STATE_STOPPED
+from workers import CameraProcess, WorkerSupervisor
+from metrics import MetricsServer, StageTimer
+from sources import open_source
+from relay import DEFAULT_RELAY_HOST, JpegPreview, PacketRelay, RelayServer
+from capture import DEFAULT_CAPTURE_OPTIONS, capture_options, open_video_capture, stream_fps
+
+DEFAULT_STREAM_URL = "rtsp://{login}:{password}@{ip}:554/onvif1"
+'''Шаблон адреса потока камеры по умолчанию'''
+
+
+def camera_stream_url(template, camera):
+    '''Адрес потока камеры по шаблону с подстановкой {ip}, {login} и {password}'''
+    url = template or DEFAULT_STREAM_URL
+    return url.replace('{ip}', camera.ip).replace('{login}', camera.login).replace('{password}', camera.password)
+
+
+class CaptureWorker(threading.Thread):
+    '''Поток захвата видеопотока: подключение, чтение кадров и переподключение с экспоненциальной задержкой.
+    Все ожидания выполняются в этом потоке, интерфейс и другие камеры не блокируются'''
+
+    BACKOFF_BASE = 1
+    '''Начальная задержка перед переподключением (секунды)'''
+    BACKOFF_MAX = 60
+    '''Максимальная задержка перед переподключением (секунды)'''
+    MAX_ATTEMPTS = 0
+    '''Число неудачных попыток подряд до перехода в состояние failed (0 — без ограничения)'''
+
+    def __init__(self, url, recorder=None, motion_gate=None, mailbox=None, on_state_changed=None, preview=None,
+                 options=DEFAULT_CAPTURE_OPTIONS):
+        '''Инициализация потока захвата; on_state_changed(state, message) вызывается из потока захвата,
+        options — параметры подключения камеры (транспорт, таймауты, буфер, бэкенд)'''
+        super().__init__(daemon=True)
+        self.cap = None
+        self.running = False
+        self.stop_event = threading.Event()
+        self.state = STATE_STOPPED
+        self.backoff = Backoff(self.BACKOFF_BASE, self.BACKOFF_MAX, self.MAX_ATTEMPTS)
+        self.recorder = recorder
+        self.motion_gate = motion_gate
+        self.mailbox = mailbox
+        self.preview = preview
+        self.on_state_changed = on_state_changed
+        self.current_url = url
+        self.options = options
+
+        self.counters_lock = threading.Lock()
+        self.frames_read = 0
+        self.connects = 0
+        self.read_timer = StageTimer()
+
+    def set_state(self, state, message=""):
+        '''Смена состояния подключения с уведомлением подписчика'''
+        self.state = state
+        if self.on_state_changed is not None:
+            self.on_state_changed(state, message)
+
+    def start(self):
+        '''Запуск потока захвата'''
+        self.running = True
+        super().start()
+
+    def run(self):
+        '''Основной метод потока: конечный автомат connecting → streaming → backoff → connecting'''
+        while self.running:
+            self.set_state(STATE_CONNECTING, "Подключение...")
+            with self.counters_lock:
+                self.connects += 1
+            try:
+                self.cap = self.open_capture(self.current_url)
+                opened = self.cap.isOpened()
+            except Exception as e:
+                logging.error(f"Error connecting to the camera: {str(e)}")
+                opened = False
+
+            if opened:
+                self.backoff.reset()
+                if self.recorder is not None:
+                    self.recorder.set_nominal_fps(stream_fps(self.cap))
+                self.set_state(STATE_STREAMING)
+                self.read_frames()
+            self.release_capture()
+
+            if not self.running:
+                break
+            if self.backoff.exhausted():
+                logging.error(f"Giving up connecting to the video stream after {self.backoff.attempts} attempts")
+                self.set_state(STATE_FAILED, "Нет подключения")
+                self.running = False
+                return
+
+            delay = self.backoff.next_delay()
+            logging.warning(f"Reconnecting to the video stream in {delay:.1f} s...")
+            self.set_state(STATE_BACKOFF, f"Нет сигнала, повтор через {delay:.0f} с")
+            self.stop_event.wait(delay)
+
+        self.set_state(STATE_STOPPED)
+
+    def read_frames(self):
+        '''Чтение кадров до ошибки или остановки потока'''
+        try:
+            while self.running:
+                started = time.perf_counter()
+                ret, frame = self.cap.read()
+                if not ret:
+                    logging.error("Failed to read frame")
+                    return
+                self.read_timer.add(time.perf_counter() - started)
+                with self.counters_lock:
+                    self.frames_read += 1
+
+                timestamp = time.time()
+                if self.motion_gate is not None:
+                    self.motion_gate.update(frame)
+                if self.recorder is not None:
+                    self.recorder.enqueue(frame, timestamp)
+                if self.mailbox is not None:
+                    self.mailbox.offer(frame)
+                if self.preview is not None:
+                    self.preview.offer(frame)
+        except Exception as e:
+            logging.error(f"Error in CaptureWorker: {str(e)}")
+
+    def open_capture(self, url):
+        '''Открытие потока с параметрами подключения камеры; file:// и synthetic:// открываются как тестовые источники'''
+        source = open_source(url)
+        if source is not None:
+            return source
+        return open_video_capture(url, self.options)
+
+    def release_capture(self):
+        '''Освобождение захвата и завершение текущего сегмента записи'''
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.mailbox is not None:
+            self.mailbox.clear()
+        if self.preview is not None:
+            self.preview.clear()
+        if self.recorder is not None:
+            # После разрыва запись продолжается в новый сегмент
+            self.recorder.end_segment()
+
+    def get_counters(self):
+        '''Получение счётчиков: прочитано кадров и попыток подключения'''
+        with self.counters_lock:
+            return {'read': self.frames_read, 'connects': self.connects}
+
+    def request_stop(self):
+        '''Запрос остановки потока без ожидания завершения'''
+        self.running = False
+        self.stop_event.set()
+
+    def stop(self):
+        '''Остановка потока и ожидание освобождения ресурсов захвата видео'''
+        self.request_stop()
+        if self.is_alive():
+            self.join()
+
+
+class CameraPipeline:
+    '''Независимый конвейер захвата и записи одной камеры.
+    Если у камеры задан отдельный поток просмотра, просмотр и запись идут по разным подключениям.
+    Без display_fps кадры для просмотра не готовятся (режим без интерфейса)'''
+
+    def __init__(self, camera, queue_size, overflow_policy, display_fps=None, on_state_changed=None, mailbox=None):
+        '''Создание потоков захвата и записи для камеры'''
+        self.camera = camera
+        self.record_url = camera_stream_url(camera.record_url, camera)
+        self.preview_url = camera_stream_url(camera.preview_url, camera) if camera.preview_url else self.record_url
+        self.on_state_changed = on_state_changed
+        self.capture_options = capture_options(camera)
+        self.lock = threading.Lock()
+
+        if mailbox is None and display_fps:
+            mailbox = FrameMailbox(display_fps)
+        self.mailbox = mailbox
+
+        self.motion_gate = MotionGate()
+
+        self.recorder = RecorderWorker(camera.id, queue_size, overflow_policy)
+        self.recorder.motion_gate = self.motion_gate
+        # Ретрансляция зрителям того, что уже получено от камеры, без дополнительных подключений к ней
+        self.preview = JpegPreview()
+        self.preview.on_viewers_changed = self.update_capture
+        self.packet_relay = PacketRelay()
+
+        self.stream_copy_recorder = StreamCopyRecorder(camera.id, self.capture_options)
+        self.stream_copy_recorder.motion_gate = self.motion_gate
+        self.stream_copy_recorder.relay = self.packet_relay
+
+        self.dual_stream = self.preview_url != self.record_url
+        if not self.dual_stream:
+            # При одном потоке запись без перекодирования сама отдаёт кадры и состояние подключения
+            self.stream_copy_recorder.frame_sink = self
+            self.stream_copy_recorder.on_state_changed = on_state_changed
+        self.recording_settings = None
+        self.running = False
+        self.video_thread = None
+        self.record_thread = None
+        self.retired_threads = []
+
+    def start(self):
+        '''Запуск записи и видеопотока камеры'''
+        self.recorder.start()
+        self.stream_copy_recorder.set_url(self.record_url)
+        self.stream_copy_recorder.start()
+        self.running = True
+
+        Database.subscribe('recording_settings', self.on_recording_settings_changed)
+        self.on_recording_settings_changed(Database.get_recording_settings())
+
+    def on_recording_settings_changed(self, settings):
+        '''Запуск или остановка захвата при смене настроек записи'''
+        self.recording_settings = settings
+        self.update_capture()
+
+    def video_frames_needed(self):
+        '''Нужен ли поток захвата для просмотра: кадры нужны для показа, зрителей предпросмотра,
+        детектора движения или перекодирования (при одном потоке) и не декодируются из пакетов записи'''
+        if self.frames_from_stream_copy():
+            return False
+        return self.frames_needed() or (not self.dual_stream and self.recording_enabled(RECORDING_MODE_TRANSCODE))
+
+    def recording_enabled(self, mode):
+        '''Включена ли запись в режиме mode'''
+        settings = self.recording_settings
+        return settings is not None and bool(settings.enable_record) and settings.recording_mode == mode
+
+    def frames_from_stream_copy(self):
+        '''Кадры одного потока камеры декодируются из пакетов записи без перекодирования:
+        второе подключение к камере не открывается'''
+        return not self.dual_stream and STREAM_COPY_AVAILABLE and self.recording_enabled(RECORDING_MODE_STREAM_COPY)
+
+    def frames_needed(self):
+        '''Нужны ли декодированные кадры для показа, зрителей предпросмотра или детектора движения'''
+        if self.mailbox is not None or self.preview.viewers > 0:
+            return True
+        settings = self.recording_settings
+        return settings is not None and bool(settings.enable_record) and bool(settings.motion_recording)
+
+    def offer_frame(self, frame):
+        '''Кадр, декодированный из пакетов записи без перекодирования'''
+        self.motion_gate.update(frame)
+        if self.mailbox is not None:
+            self.mailbox.offer(frame)
+        self.preview.offer(frame)
+
+    def clear_frames(self):
+        '''Сброс последних кадров при потере связи потоком записи'''
+        if self.mailbox is not None:
+            self.mailbox.clear()
+        self.preview.clear()
+
+    def record_frames_needed(self):
+        '''Нужен ли отдельный захват основного потока для перекодирования'''
+        return self.dual_stream and self.recording_enabled(RECORDING_MODE_TRANSCODE)
+
+    def update_capture(self):
+        '''Запуск потоков захвата, чьи кадры кому-то нужны, и остановка остальных: запись без перекодирования
+        на узле без интерфейса не открывает второе подключение к камере и не декодирует кадры'''
+        with self.lock:
+            if not self.running:
+                return
+            # Остановленный поток нельзя запустить повторно, поэтому создаётся новый
+            if self.video_frames_needed():
+                if self.video_thread is None:
+                    self.video_thread = self.create_video_thread()
+                    self.video_thread.start()
+            elif self.video_thread is not None:
+                self.retire_thread(self.video_thread)
+                self.video_thread = None
+
+            if self.record_frames_needed():
+                if self.record_thread is None:
+                    self.record_thread = CaptureWorker(self.record_url, recorder=self.recorder, options=self.capture_options)
+                    self.record_thread.start()
+            elif self.record_thread is not None:
+                self.retire_thread(self.record_thread)
+                self.record_thread = None
+
+    def create_video_thread(self):
+        '''Поток захвата для просмотра; при одном потоке он же передаёт кадры на запись'''
+        if self.dual_stream:
+            return CaptureWorker(self.preview_url, motion_gate=self.motion_gate, mailbox=self.mailbox,
+                                 on_state_changed=self.on_state_changed, preview=self.preview,
+                                 options=self.capture_options)
+        return CaptureWorker(self.record_url, recorder=self.recorder, motion_gate=self.motion_gate,
+                             mailbox=self.mailbox, on_state_changed=self.on_state_changed,
+                             preview=self.preview, options=self.capture_options)
+
+    def retire_thread(self, thread):
+        '''Остановка потока захвата без ожидания: он может ждать таймаута камеры, а вызывающий поток
+        (интерфейс, настройки, HTTP) ждать не должен; завершение дожидается stop'''
+        thread.request_stop()
+        self.retired_threads = [t for t in self.retired_threads if t.is_alive()] + [thread]
+
+    def get_metrics(self):
+        '''Метрики камеры для render_metrics: (имя, метки, значение)'''
+        camera = str(self.camera.id)
+        samples = []
+        capture_threads = [('live' if self.dual_stream else 'main', self.video_thread), ('main', self.record_thread)]
+        for stream, thread in capture_threads:
+            if thread is None:
+                continue
+            labels = {'camera': camera, 'stream': stream}
+            counters = thread.get_counters()
+            samples.append(('frames_read_total', labels, counters['read']))
+            samples.append(('capture_connects_total', labels, counters['connects']))
+            samples.append(('capture_read_seconds', labels, thread.read_timer.snapshot()))
+
+        labels = {'camera': camera}
+        samples.append(('motion_seconds', labels, self.motion_gate.analysis_timer.snapshot()))
+
+        if self.mailbox is not None:
+            counters = self.mailbox.get_counters()
+            for outcome in ('put', 'skipped', 'dropped'):
+                samples.append(('display_frames_total', {'camera': camera, 'outcome': outcome}, counters[outcome]))
+            samples.append(('display_prepare_seconds', labels, self.mailbox.prepare_timer.snapshot()))
+
+        counters = self.recorder.get_counters()
+        for outcome in ('enqueued', 'written', 'dropped', 'skipped'):
+            samples.append(('record_frames_total', {'camera': camera, 'outcome': outcome}, counters[outcome]))
+        samples.append(('record_queue_depth', labels, counters['queued']))
+        samples.append(('record_encode_seconds', labels, self.recorder.encode_timer.snapshot()))
+
+        counters = self.stream_copy_recorder.get_counters()
+        samples.append(('stream_copy_packets_total', labels, counters['packets_written']))
+        samples.append(('stream_copy_segments_total', labels, counters['segments_written']))
+        samples.append(('stream_copy_mux_seconds', labels, self.stream_copy_recorder.mux_timer.snapshot()))
+
+        samples.append(('preview_frames_encoded_total', labels, self.preview.frames_encoded))
+        samples.append(('relay_viewers', {'camera': camera, 'stream': 'preview'}, self.preview.viewers))
+        samples.append(('relay_viewers', {'camera': camera, 'stream': 'compressed'}, len(self.packet_relay.clients)))
+        samples.append(('relay_packets_total', labels, self.packet_relay.packets_relayed))
+        return samples
+
+    def request_stop(self):
+        '''Запрос остановки потоков захвата без ожидания, чтобы камеры останавливались параллельно'''
+        with self.lock:
+            self.running = False
+            threads = [self.video_thread, self.record_thread]
+        for thread in threads:
+            if thread is not None:
+                thread.request_stop()
+
+    def stop(self):
+        '''Остановка видеопотока и записи камеры'''
+        Database.unsubscribe('recording_settings', self.on_recording_settings_changed)
+        with self.lock:
+            self.running = False
+            threads = [self.video_thread, self.record_thread] + self.retired_threads
+            video_thread = self.video_thread
+            self.video_thread = self.record_thread = None
+            self.retired_threads = []
+        for thread in threads:
+            if thread is not None:
+                thread.stop()
+        self.recorder.stop()
+        self.stream_copy_recorder.stop()
+        if video_thread is not None:
+            logging.info(f"Camera {self.camera.id} capture counters: {video_thread.get_counters()}")
+        logging.info(f"Camera {self.camera.id} recorder counters: {self.recorder.get_counters()}")
+        logging.info(f"Camera {self.camera.id} stream copy counters: {self.stream_copy_recorder.get_counters()}")
+        if self.mailbox is not None:
+            logging.info(f"Camera {self.camera.id} display counters: {self.mailbox.get_counters()}")
+
+
+class Engine:
+    '''Движок записи без интерфейса: конвейеры всех камер и служба хранения.
+    Используется и демоном записи, и приложением Qt.
+    С use_processes каждая камера работает в своём процессе и может занимать отдельное ядро'''
+
+    RECORDER_QUEUE_SIZE = 50
+    '''Максимальное число кадров, ожидающих записи (на каждую камеру)'''
+    RECORDER_OVERFLOW_POLICY = OVERFLOW_DROP_OLDEST
+    '''Поведение при переполнении очереди записи'''
+
+    def __init__(self, display_fps=None, queue_size=RECORDER_QUEUE_SIZE, overflow_policy=RECORDER_OVERFLOW_POLICY,
+                 use_processes=False, metrics_port=None, retention_interval=RetentionService.INTERVAL, relay_port=None,
+                 relay_host=DEFAULT_RELAY_HOST):
+        '''Инициализация движка; display_fps задаётся, только если кадры нужно показывать,
+        metrics_port — только если нужна страница /metrics, relay_port — только если нужна ретрансляция зрителям,
+        relay_host — адрес, на котором она принимает подключения'''
+        self.display_fps = display_fps
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.use_processes = use_processes
+        self.pipelines = {}
+        self.retention_service = None
+        self.supervisor = None
+        self.process_context = None
+        self.state_queue = None
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.retention_interval = retention_interval
+        self.relay_port = relay_port
+        self.relay_host = relay_host
+        self.relay_server = None
+        self.cameras_lock = threading.Lock()
+        '''Последовательный запуск и остановка камер: их могут перезапускать из разных потоков'''
+        self.state_listener = None
+        '''Вызывается как state_listener(camera_id, state, message) из потоков захвата'''
+
+    def start(self):
+        '''Запуск службы хранения и всех камер из базы данных'''
+        self.retention_service = RetentionService(self.retention_interval)
+        self.retention_service.start()
+        if self.use_processes:
+            # spawn: процесс камеры не наследует потоки и состояние Qt родителя
+            self.process_context = multiprocessing.get_context('spawn')
+            self.state_queue = self.process_context.Queue()
+            self.supervisor = WorkerSupervisor(self.state_queue, lambda: list(self.pipelines.values()), self.notify_state)
+            self.supervisor.start()
+        for camera in Database.get_cameras():
+            self.start_camera(camera)
+        if self.metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self.collect_metrics, self.metrics_port)
+                self.metrics_server.start()
+                logging.info(f"Metrics are available at http://127.0.0.1:{self.metrics_server.port}/metrics")
+            except OSError as e:
+                logging.error(f"Не удалось открыть порт метрик {self.metrics_port}: {str(e)}")
+                self.metrics_server = None
+        if self.relay_port is not None:
+            if self.use_processes:
+                # Кадры и пакеты камер находятся в их процессах и недоступны серверу основного процесса
+                logging.error("Ретрансляция недоступна в режиме отдельных процессов камер")
+            else:
+                try:
+                    self.relay_server = RelayServer(self.pipelines.get, self.relay_port, self.relay_host)
+                    self.relay_server.start()
+                    logging.info(f"Relay is available at http://{self.relay_host}:{self.relay_server.port}/cameras/<id>/preview.mjpg")
+                    if self.relay_host != DEFAULT_RELAY_HOST:
+                        logging.warning(f"Relay is open to the network on {self.relay_host} without authentication")
+                except OSError as e:
+                    logging.error(f"Не удалось открыть порт ретрансляции {self.relay_port}: {str(e)}")
+                    self.relay_server = None
+
+    def collect_metrics(self):
+        '''Метрики всех камер и службы хранения'''
+        samples = []
+        for pipeline in list(self.pipelines.values()):
+            samples.extend(pipeline.get_metrics())
+
+        retention_service = self.retention_service
+        if retention_service is not None:
+            counters = retention_service.get_counters()
+            samples.append(('retention_seconds', {}, retention_service.pass_timer.snapshot()))
+            samples.append(('retention_deleted_segments_total', {}, counters['segments_deleted']))
+            samples.append(('retention_deleted_bytes_total', {}, counters['bytes_deleted']))
+        return samples
+
+    def notify_state(self, camera_id, state, message):
+        '''Передача состояния подключения камеры подписчику'''
+        if self.state_listener is not None:
+            self.state_listener(camera_id, state, message)
+
+    def start_camera(self, camera):
+        '''Запуск конвейера камеры'''
+        if self.use_processes:
+            pipeline = CameraProcess(camera, self.queue_size, self.overflow_policy, self.display_fps,
+                                     self.state_queue, self.process_context)
+        else:
+            def on_state_changed(state, message, camera_id=camera.id):
+                self.notify_state(camera_id, state, message)
+
+            pipeline = CameraPipeline(camera, self.queue_size, self.overflow_policy, self.display_fps, on_state_changed)
+        self.pipelines[camera.id] = pipeline
+        pipeline.start()
+        return pipeline
+
+    def stop_camera(self, camera_id):
+        '''Остановка конвейера камеры'''
+        with self.cameras_lock:
+            pipeline = self.pipelines.pop(camera_id, None)
+            if pipeline is not None:
+                pipeline.stop()
+
+    def restart_camera(self, camera_id):
+        '''Перезапуск камеры после изменения её настроек, возвращает новый конвейер или None.
+        Ждёт остановки потоков захвата, поэтому вызывается не из потока интерфейса'''
+        with self.cameras_lock:
+            pipeline = self.pipelines.pop(camera_id, None)
+            if pipeline is not None:
+                pipeline.stop()
+            camera = Database.get_camera_settings(camera_id)
+            if camera is None:
+                return None
+            return self.start_camera(camera)
+
+    def request_stop(self):
+        '''Запрос остановки всех камер без ожидания'''
+        for pipeline in self.pipelines.values():
+            pipeline.request_stop()
+
+    def stop(self):
+        '''Остановка всех камер и службы хранения'''
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.relay_server is not None:
+            self.relay_server.stop()
+            self.relay_server = None
+        self.request_stop()
+        for camera_id in list(self.pipelines):
+            self.stop_camera(camera_id)
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+        if self.retention_service is not None:
+            self.retention_service.stop()
+            self.retention_service = None
@@ -0,0 +1,177 @@
+import logging
+import os
+from collections import namedtuple
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from catalog import find_recordings
+
+EXPORT_CONTAINERS = ('mkv', 'mp4', 'ts')
+'''Контейнеры, в которые можно выгрузить фрагмент'''
+
+ExportResult = namedtuple('ExportResult', ('path', 'segments', 'packets', 'start_time', 'end_time'))
+'''Итог выгрузки: файл, число использованных сегментов и пакетов, фактическое начало и конец (секунды Unix)'''
+
+
+class ExportError(Exception):
+    '''Фрагмент не может быть выгружен'''
+
+
+def export_clip(camera_id, start_time, end_time, output_path, progress=None):
+    '''Выгрузка записей камеры за интервал [start_time, end_time] в один файл без перекодирования.
+    Фрагмент начинается с ближайшего предшествующего ключевого кадра; progress(доля) вызывается по сегментам'''
+    if av is None:
+        raise ExportError("Выгрузка требует пакет PyAV (pip install av)")
+    if end_time <= start_time:
+        raise ExportError("Конец интервала должен быть позже начала")
+
+    segments = find_recordings(camera_id, start_time, end_time)
+    if not segments:
+        raise ExportError("За указанный интервал записей нет")
+
+    extension = os.path.splitext(output_path)[1].lstrip('.').lower()
+    if extension not in EXPORT_CONTAINERS:
+        raise ExportError(f"Неподдерживаемый формат файла: {extension or '?'} (доступны {', '.join(EXPORT_CONTAINERS)})")
+
+    writer = ClipWriter(output_path, 'mpegts' if extension == 'ts' else None)
+    used_segments = 0
+    try:
+        for index, segment in enumerate(segments):
+            try:
+                if writer.copy_segment(segment, start_time, end_time):
+                    used_segments += 1
+            except ExportError:
+                raise
+            except Exception as e:
+                # Незакрытый или повреждённый сегмент не должен прерывать выгрузку остальных
+                logging.error(f"Сегмент {segment.path} пропущен при выгрузке: {str(e)}")
+            if progress is not None:
+                progress((index + 1) / len(segments))
+    except ExportError:
+        # Ошибка записи выходного файла: обрезанный фрагмент не выдаётся за выгруженный
+        try:
+            writer.close()
+        except Exception:
+            pass
+        remove_output(output_path)
+        raise
+    writer.close()
+
+    if writer.packets == 0:
+        remove_output(output_path)
+        raise ExportError("В записях за указанный интервал нет видео")
+    return ExportResult(output_path, used_segments, writer.packets, writer.clip_start, writer.clip_end)
+
+
+def remove_output(output_path):
+    '''Удаление незавершённого выходного файла'''
+    try:
+        os.remove(output_path)
+    except OSError:
+        pass
+
+
+class ClipWriter:
+    '''Склейка пакетов нескольких сегментов в один файл с непрерывной шкалой времени'''
+
+    def __init__(self, output_path, container_format=None):
+        '''Открытие выходного файла'''
+        self.output = av.open(output_path, mode='w', format=container_format)
+        self.out_stream = None
+        self.codec_key = None
+        self.clip_start = None
+        self.clip_end = None
+        self.last_dts = None
+        self.packets = 0
+
+    def copy_segment(self, segment, start_time, end_time):
+        '''Копирование пакетов сегмента, попадающих в интервал; False, если сегмент не подошёл'''
+        with av.open(segment.path) as source:
+            if not source.streams.video:
+                return False
+            in_stream = source.streams.video[0]
+            time_base = in_stream.time_base
+            codec = in_stream.codec_context
+            codec_key = (codec.name, codec.width, codec.height)
+
+            if self.out_stream is None:
+                if hasattr(self.output, 'add_stream_from_template'):
+                    self.out_stream = self.output.add_stream_from_template(in_stream)
+                else:
+                    self.out_stream = self.output.add_stream(template=in_stream)
+                self.codec_key = codec_key
+            elif codec_key != self.codec_key:
+                logging.warning(f"Сегмент {segment.path} пропущен при выгрузке: другой кодек или размер кадра")
+                return False
+
+            # Время пакета в сегменте отсчитывается от первого пакета, а сегмент начинается в segment.start_time
+            stream_start = in_stream.start_time or 0
+            offset = start_time - segment.start_time
+            if offset > 0:
+                # backward=True ставит чтение на ключевой кадр не позже нужного момента
+                source.seek(stream_start + int(offset / time_base), stream=in_stream, backward=True, any_frame=False)
+
+            started = False
+            shift = None
+            for packet in source.demux(in_stream):
+                # MKV хранит только pts: у первых пакетов потока с B-кадрами демультиплексор не знает dts
+                dts = packet.dts if packet.dts is not None else packet.pts
+                pts = packet.pts if packet.pts is not None else dts
+                if dts is None:
+                    continue
+
+                packet_time = segment.start_time + float((pts - stream_start) * time_base)
+                if float((dts - stream_start) * time_base) + segment.start_time > end_time:
+                    break
+                if not started:
+                    if not packet.is_keyframe:
+                        continue
+                    started = True
+                if self.clip_start is None:
+                    self.clip_start = packet_time
+                if shift is None:
+                    shift = self.segment_shift(segment.start_time, stream_start, dts, time_base)
+
+                self.write_packet(packet, pts + shift, None if packet.dts is None else dts + shift, time_base)
+                self.clip_end = max(self.clip_end or packet_time, packet_time)
+            return started
+
+    def segment_shift(self, segment_start, stream_start, first_dts, time_base):
+        '''Сдвиг времени пакетов сегмента к шкале фрагмента: перерывы между сегментами сохраняются'''
+        shift = int(round((segment_start - self.clip_start) / time_base)) - stream_start
+        if self.last_dts is not None:
+            last_dts = int(self.last_dts / time_base)
+            if first_dts + shift <= last_dts:
+                # Время начала сегмента известно с точностью до секунды — соседние сегменты не должны перекрываться
+                shift = last_dts + 1 - first_dts
+        return shift
+
+    def write_packet(self, packet, pts, dts, time_base):
+        '''Запись пакета с уже пересчитанным временем; неизвестный dts (None) выводится из предыдущего'''
+        if self.last_dts is not None:
+            last_dts = int(self.last_dts / time_base)
+            if dts is None or dts <= last_dts:
+                # dts должен строго возрастать и не превышать pts
+                dts = min(last_dts + 1, pts)
+        elif dts is None:
+            dts = pts
+        if self.last_dts is not None and dts * time_base <= self.last_dts:
+            logging.warning(f"Пакет с pts {pts} пропущен при выгрузке: нельзя сохранить порядок декодирования")
+            return
+
+        packet.pts = pts
+        packet.dts = dts
+        packet.stream = self.out_stream
+        try:
+            self.output.mux(packet)
+        except Exception as e:
+            raise ExportError(f"Ошибка записи выходного файла: {str(e)}")
+        self.last_dts = dts * time_base
+        self.packets += 1
+
+    def close(self):
+        '''Закрытие выходного файла'''
+        self.output.close()
@@ -1,272 +1,39 @@
 import sys
 import time
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QLineEdit, QPushButton, QAction, QMessageBox, QSpinBox, QCheckBox, QFileDialog
-from PyQt5.QtGui import QIcon, QPixmap, QImage
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-import cv2
+import math
+from PyQt5.QtWidgets import QApplication, QMainWindow, QGridLayout, QWidget, QLabel, QAction, QMessageBox
+from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from database import Database
+from widgets import VideoTile
 import logging
+import threading
 import os
-import datetime
-
-Database.start_database()
-
-class VideoThread(QThread):
-    '''Поток для обработки видеопотока и передачи кадров в основной поток'''
-    frame_update_signal = pyqtSignal(object)
-    '''Сигнал для передачи обновлений кадра в основной поток'''
-    reconnect_required_signal = pyqtSignal()
-    '''Сигнал для указания на необходимость реконнекта'''
-
-    def __init__(self, parent=None):
-        '''Инициализация объекта VideoThread'''
-        super().__init__(parent)
-        self.cap = None
-        self.running = False
-        self.reconnecting = False
-
-    def run(self):
-        '''Основной метод потока, обрабатывающий видеопоток'''
-        try:
-            while self.running:
-                ret, frame = self.cap.read()
-                if ret:
-                    self.frame_update_signal.emit(frame)
-                else:
-                    self.handle_error("Failed to read frame")
-        except Exception as e:
-            self.handle_error(f"Error in VideoThread: {str(e)}")
-
-    def handle_error(self, error_text):
-        '''Обработка ошибок и инициация процесса реконнекта'''
-        logging.error(error_text)
-        if not self.reconnecting:
-            self.reconnecting = True
-            print('Reconnect initiated')
-            self.reconnect_required_signal.emit()
-
-    def disconnect(self):
-        '''Остановка потока и освобождение ресурсов захвата видео'''
-        self.running = False
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
-        self.wait()
-
-    def reconnect(self):
-        '''Процесс реконнекта'''
-        if self.reconnecting:
-            logging.warning("Reconnecting to the video stream...")
-            self.disconnect()
-            time.sleep(5)
-            if self.cap is not None:
-                self.cap.release()
-                self.cap = None
-            self.frame_update_signal.emit(None)
-            self.connect_to_camera(*self.current_settings)
-            self.reconnecting = False
-
-    def connect_to_camera(self, ip, login, password):
-        '''Подключение камеры, выполнение в цикле с повторными попытками при неудаче'''
-        while True:
-            try:
-                self.cap = cv2.VideoCapture(f"rtsp://{login}:{password}@{ip}:554/onvif1")
-
-                if self.cap.isOpened():
-                    self.running = True
-                    self.current_settings = (ip, login, password)
-                    self.start()
-                else:
-                    self.reconnect_required_signal.emit()
-                break
-            except Exception as e:
-                self.handle_error(f"Error connecting to the camera: {str(e)}")
-                time.sleep(10)
-
-    def start_video_stream(self, ip, login, password):
-        '''Запуск видеопотока'''
-        try:
-            self.cap = cv2.VideoCapture(f"rtsp://{login}:{password}@{ip}:554/onvif1")
-
-            if self.cap.isOpened():
-                self.running = True
-                self.current_settings = (ip, login, password)
-                self.start()
-            else:
-                self.reconnect_required_signal.emit()
-        except Exception as e:
-            logging.error(f"Error starting video stream: {str(e)}")
-
-    def stop_video_stream(self):
-        '''Остановка видеопотока'''
-        self.running = False
-        self.wait()
-
-class CameraSettingsDialog(QMainWindow):
-    '''Диалоговое окно для настроек камеры'''
-    def __init__(self, video_thread, parent=None):
-        '''Инициализация диалогового окна'''
-        super().__init__(parent)
-        self.video_thread = video_thread
-        
-        self.setWindowTitle("Настройки камеры")
-        self.setGeometry(100, 100, 500, 300)
-        self.setFixedSize(300, 200)
-        
-        self.central_widget = QWidget(self)
-        self.setCentralWidget(self.central_widget)
-        
-        self.main_layout = QVBoxLayout()
-        
-        self.setup_camera_tab()
-        
-        self.central_widget.setLayout(self.main_layout)
-        
-        icon = QIcon('icons/settings_icon.ico')
-        self.setWindowIcon(icon)
-
-    def setup_camera_tab(self):
-        '''Настройка внешнего вида вкладки с настройками камеры'''
-        self.ip_label = QLabel("IP-адрес:")
-        self.ip_edit = QLineEdit()
-        self.login_label = QLabel("Логин:")
-        self.login_edit = QLineEdit()
-        self.password_label = QLabel("Пароль:")
-        self.password_edit = QLineEdit()
-        self.password_edit.setEchoMode(QLineEdit.Password)
-
-        self.connect_button = QPushButton("Подключиться", self)
-        self.connect_button.clicked.connect(self.connect_to_camera)
-        
-        self.main_layout.addWidget(self.ip_label)
-        self.main_layout.addWidget(self.ip_edit)
-        self.main_layout.addWidget(self.login_label)
-        self.main_layout.addWidget(self.login_edit)
-        self.main_layout.addWidget(self.password_label)
-        self.main_layout.addWidget(self.password_edit)
-        self.main_layout.addWidget(self.connect_button)
-
-    def connect_to_camera(self):
-        '''Метод для подключения камеры по указанным параметрам'''
-        try:
-            ip = self.ip_edit.text()
-            login = self.login_edit.text()
-            password = self.password_edit.text()
-            
-            if not ip or not login or not password:
-                QMessageBox.warning(self, "Предупреждение", "Введите IP, логин и пароль.")
-                return
-
-            self.video_thread.start_video_stream(ip, login, password)
-            self.hide()
-        except Exception as e:
-            logging.error(f"Unexpected error connecting to the camera: {str(e)}")
-            self.video_thread.reconnect()
 
-class RecordingSettingsDialog(QMainWindow):
-    '''Диалоговое окно для настроек записи видео'''
-    def __init__(self, parent=None):
-        '''Инициализация диалогового окна'''
-        super().__init__(parent)
-
-        self.setWindowTitle("Настройки записи")
-        self.setGeometry(100, 100, 500, 300)
-        self.setFixedSize(300, 300)
-
-        self.central_widget = QWidget(self)
-        self.setCentralWidget(self.central_widget)
-
-        self.main_layout = QVBoxLayout()
-
-        self.setup_recording_tab()
-
-        self.central_widget.setLayout(self.main_layout)
-
-        self.load_recording_settings()
-        icon = QIcon('icons/settings_icon.ico')
-        self.setWindowIcon(icon)
-
-    def setup_recording_tab(self):
-        '''Настройка внешнего вида вкладки с настройками записи видео'''
-        self.destination_label = QLabel("Место хранения:")
-        self.destination_edit = QLineEdit()
-        self.browse_button = QPushButton("Обзор", self)
-        self.browse_button.clicked.connect(self.browse_destination)
-
-        self.record_length_label = QLabel("Длительность видео (минуты):")
-        self.record_length_spinbox = QSpinBox()
-        self.record_length_spinbox.setMinimum(1)
-        self.record_length_spinbox.setMaximum(600)
-
-        self.auto_delete_checkbox = QCheckBox("Включить автоматическое удаление")
-        self.auto_delete_days_label = QLabel("Автоматическое удаление через (дни):")
-        self.auto_delete_days_spinbox = QSpinBox()
-        self.auto_delete_days_spinbox.setMinimum(1)
-        self.auto_delete_days_spinbox.setMaximum(365)
-
-        self.enable_record_checkbox = QCheckBox("Включить запись")
-
-        self.apply_button = QPushButton("Применить", self)
-        self.apply_button.clicked.connect(self.apply_recording_settings)
-
-        self.main_layout.addWidget(self.destination_label)
-        self.main_layout.addWidget(self.destination_edit)
-        self.main_layout.addWidget(self.browse_button)
-        self.main_layout.addWidget(self.record_length_label)
-        self.main_layout.addWidget(self.record_length_spinbox)
-        self.main_layout.addWidget(self.enable_record_checkbox)        
-        self.main_layout.addWidget(self.auto_delete_days_label)
-        self.main_layout.addWidget(self.auto_delete_days_spinbox)
-        self.main_layout.addWidget(self.auto_delete_checkbox)
-        self.main_layout.addWidget(self.apply_button)
-
-    def browse_destination(self):
-        '''Метод для выбора папки для сохранения записей'''
-        folder_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
-        if folder_path:
-            folder_path = folder_path.replace("/", "\\")  
-            self.destination_edit.setText(folder_path)
-
-    def apply_recording_settings(self):
-        '''Метод для применения настроек записи'''
-        try:
-            destination = self.destination_edit.text()
-
-            if not os.path.exists(destination):
-                QMessageBox.warning(self, "Ошибка", "Путь не существует или программа не имеет доступа.")
-                return
-
-            record_length = self.record_length_spinbox.value()
-            auto_delete = self.auto_delete_checkbox.isChecked()
-            auto_delete_days = self.auto_delete_days_spinbox.value()
-            enable_record = self.enable_record_checkbox.isChecked()
-
-            Database.insert_recording_settings(destination, record_length, auto_delete, auto_delete_days, enable_record)
-
-            QMessageBox.information(self, "Успешно!", "Настройки записи применены.")
-            self.close()
-        except Exception as e:
-            logging.error(f"Ошибка сохранения настроек: {str(e)}")
-            QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
-
-    def load_recording_settings(self):
-        '''Метод для загрузки текущих настроек записи'''
-        try:
-            destination, record_length, auto_delete, auto_delete_days, enable_record = Database.get_recording_settings()
-
-            self.destination_edit.setText(destination)
-            self.record_length_spinbox.setValue(record_length)
-            self.auto_delete_checkbox.setChecked(bool(auto_delete))
-            self.auto_delete_days_spinbox.setValue(auto_delete_days)
-            self.enable_record_checkbox.setChecked(bool(enable_record))
-        except Exception as e:
-            logging.error(f"Ошибка загрузки настроек записи: {str(e)}")
+APP_STARTED = time.monotonic()
+'''Момент загрузки модуля окна: от него отсчитывается время до первого окна и первого кадра'''
 
 class MainApplication(QMainWindow):
     '''Главное приложение'''
 
-    def __init__(self):
-        '''Инициализация главного окна приложения'''
+    camera_state_signal = pyqtSignal(int, str, str)
+    '''Сигнал о смене состояния подключения камеры из потока захвата'''
+    database_ready_signal = pyqtSignal()
+    '''Сигнал фонового запуска: база данных открыта, настройки загружены'''
+    engine_ready_signal = pyqtSignal(object)
+    '''Сигнал фонового запуска: движок создан и камеры запущены (передаётся движок)'''
+    startup_failed_signal = pyqtSignal(str)
+    '''Сигнал об ошибке фонового запуска'''
+    camera_restarted_signal = pyqtSignal(int, object)
+    '''Сигнал о перезапуске камеры в фоне (передаётся новый конвейер или None)'''
+
+    DISPLAY_FPS = 15
+    '''Частота обновления просмотра (кадров в секунду), не зависит от частоты камер'''
+
+    def __init__(self, use_processes=False, metrics_port=None, relay_port=None, relay_host='127.0.0.1'):
+        '''Инициализация главного окна приложения; use_processes запускает каждую камеру в отдельном процессе,
+        metrics_port открывает страницу метрик /metrics, relay_port и relay_host — ретрансляцию камер зрителям.
+        База данных и камеры запускаются в фоне, чтобы окно появилось сразу'''
         super().__init__()
 
         try:
@@ -284,140 +51,264 @@ class MainApplication(QMainWindow):
         menubar = self.menuBar()
         file_menu = menubar.addMenu("Файл")
 
-        camera_settings_action = QAction("Настройки камеры", self)
-        camera_settings_action.triggered.connect(self.show_camera_settings_dialog)
-        file_menu.addAction(camera_settings_action)
-
-        recording_settings_action = QAction("Настройки записи", self)
-        recording_settings_action.triggered.connect(self.show_recording_settings_dialog)
-        file_menu.addAction(recording_settings_action)
-
-        self.video_thread = VideoThread(self)
-        self.video_thread.frame_update_signal.connect(self.update_video_frame)
-        self.video_thread.reconnect_required_signal.connect(self.handle_reconnect_required)
-        self.cap = None
-
-        self.camera_settings_dialog = CameraSettingsDialog(self.video_thread, self)
-        self.recording_settings_dialog = RecordingSettingsDialog(self)
-
-        self.video_widget = QLabel(self)
-        self.video_widget.setAlignment(Qt.AlignCenter)
-        self.setCentralWidget(self.video_widget)
-
-        current_settings = Database.get_camera_settings()
-        if current_settings:
-            ip, login, password = current_settings
-            self.start_video_stream(ip, login, password)
-        else:
-            ip, login, password = "", "", ""
+        # Пункты меню доступны после фонового запуска: диалогам нужны база данных и движок
+        self.camera_settings_action = QAction("Настройки камеры", self)
+        self.camera_settings_action.triggered.connect(self.show_camera_settings_dialog)
+        self.camera_settings_action.setEnabled(False)
+        file_menu.addAction(self.camera_settings_action)
+
+        self.recording_settings_action = QAction("Настройки записи", self)
+        self.recording_settings_action.triggered.connect(self.show_recording_settings_dialog)
+        self.recording_settings_action.setEnabled(False)
+        file_menu.addAction(self.recording_settings_action)
+
+        self.playback_action = QAction("Архив записей", self)
+        self.playback_action.triggered.connect(self.show_playback_window)
+        self.playback_action.setEnabled(False)
+        file_menu.addAction(self.playback_action)
+
+        view_menu = menubar.addMenu("Вид")
+
+        self.show_stats = False
+        stats_action = QAction("Статистика на экране", self)
+        stats_action.setCheckable(True)
+        stats_action.toggled.connect(self.set_show_stats)
+        view_menu.addAction(stats_action)
+
+        self.tiles = {}
+        # Камеры, для которых ждём первый кадр: время отсчёта и текст сообщения в журнале
+        self.first_frame_pending = {}
+        self.first_window_logged = False
+
+        # Захват и запись выполняет движок, окно только показывает кадры и меняет настройки
+        self.engine = None
+        self.camera_state_signal.connect(self.on_camera_state_changed)
+        self.database_ready_signal.connect(self.on_database_ready)
+        self.engine_ready_signal.connect(self.on_engine_ready)
+        self.startup_failed_signal.connect(self.on_startup_failed)
+        self.camera_restarted_signal.connect(self.on_camera_restarted)
+        self.camera_threads = []
+
+        # Диалоги и окно архива создаются при первом открытии
+        self.camera_settings_dialog = None
+        self.recording_settings_dialog = None
+        self.playback_window = None
+
+        self.grid_widget = QWidget(self)
+        self.grid_layout = QGridLayout()
+        self.grid_layout.setContentsMargins(0, 0, 0, 0)
+        self.grid_layout.setSpacing(2)
+        self.grid_widget.setLayout(self.grid_layout)
+        self.setCentralWidget(self.grid_widget)
+
+        self.empty_label = QLabel("Загрузка...", self.grid_widget)
+        self.empty_label.setAlignment(Qt.AlignCenter)
+        self.update_grid()
+
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.refresh_tiles)
+        self.display_timer.start(int(1000 / self.DISPLAY_FPS))
+
+        self.startup_thread = threading.Thread(target=self.start_in_background,
+                                               args=(use_processes, metrics_port, relay_port, relay_host),
+                                               name='startup', daemon=True)
+        self.startup_thread.start()
+
+    def start_in_background(self, use_processes, metrics_port, relay_port, relay_host):
+        '''Открытие базы данных, загрузка движка и запуск камер вне потока интерфейса'''
+        try:
+            Database.start_database()
+            self.database_ready_signal.emit()
 
-        self.camera_settings_dialog.ip_edit.setText(ip)
-        self.camera_settings_dialog.login_edit.setText(login)
-        self.camera_settings_dialog.password_edit.setText(password)
+            # Движок тянет за собой OpenCV и PyAV, их загрузка не задерживает появление окна
+            from engine import Engine
 
-        self.recording_settings = Database.get_recording_settings()
+            engine = Engine(self.DISPLAY_FPS, use_processes=use_processes, metrics_port=metrics_port,
+                            relay_port=relay_port, relay_host=relay_host)
+            engine.state_listener = self.camera_state_signal.emit
+            engine.start()
+        except Exception as e:
+            logging.error(f"Ошибка запуска: {str(e)}")
+            self.startup_failed_signal.emit(str(e))
+            return
+        self.engine_ready_signal.emit(engine)
+
+    def on_database_ready(self):
+        '''Плитки-заглушки «Подключение...» для всех камер, пока их конвейеры запускаются'''
+        self.empty_label.setText("Добавьте камеру: Файл → Настройки камеры")
+        for camera in Database.get_cameras():
+            self.add_tile(camera)
+            self.first_frame_pending[camera.id] = (APP_STARTED, f"Startup: camera {camera.id} first frame")
+        self.update_grid()
+        self.recording_settings_action.setEnabled(True)
+        self.playback_action.setEnabled(True)
+        logging.info(f"Startup: settings loaded in {(time.monotonic() - APP_STARTED) * 1000:.0f} ms")
+
+    def on_engine_ready(self, engine):
+        '''Подключение плиток к запущенным конвейерам камер'''
+        self.engine = engine
+        for pipeline in engine.pipelines.values():
+            self.attach_tile(pipeline)
+        self.update_grid()
+        self.camera_settings_action.setEnabled(True)
+        logging.info(f"Startup: {len(engine.pipelines)} camera(s) started in "
+                     f"{(time.monotonic() - APP_STARTED) * 1000:.0f} ms")
+
+    def on_startup_failed(self, message):
+        '''Сообщение об ошибке фонового запуска'''
+        self.empty_label.setText("Не удалось запустить запись")
+        QMessageBox.critical(self, "Ошибка", f"Не удалось запустить запись: {message}")
+
+    def showEvent(self, event):
+        '''Запись в журнал времени до первого показа окна'''
+        super().showEvent(event)
+        if not self.first_window_logged:
+            self.first_window_logged = True
+            # Отложенный вызов выполняется после отрисовки окна в цикле событий
+            QTimer.singleShot(0, lambda: logging.info(
+                f"Startup: first window in {(time.monotonic() - APP_STARTED) * 1000:.0f} ms"))
 
     def show_camera_settings_dialog(self):
         '''Отображение диалога настроек камеры'''
+        if self.camera_settings_dialog is None:
+            from dialogs import CameraSettingsDialog
+
+            self.camera_settings_dialog = CameraSettingsDialog(self)
+            self.camera_settings_dialog.camera_saved_signal.connect(self.restart_camera)
+            self.camera_settings_dialog.camera_removed_signal.connect(self.remove_camera)
         self.camera_settings_dialog.show()
-        self.recording_settings_dialog.hide()
+        if self.recording_settings_dialog is not None:
+            self.recording_settings_dialog.hide()
 
     def show_recording_settings_dialog(self):
         '''Отображение диалога настроек записи'''
-        self.recording_settings_dialog.show()
-        self.camera_settings_dialog.hide()
-
-    def start_video_stream(self, ip, login, password):
-        '''Запуск видеопотока'''
-        try:
-            self.video_thread.start_video_stream(ip, login, password)
-        except Exception as e:
-            logging.error(f"Error starting video stream: {str(e)}")
-            self.handle_video_thread_error(str(e))  # Обработка ошибки
-
-    def update_video_frame(self, frame):
-        '''Обновление кадра на виджете'''
-        if frame is not None:
-            self.update_frame(frame)
-            self.record_video(frame)
-
-    def update_frame(self, frame):
-        '''Обновление виджета с кадром'''
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        h, w, ch = frame.shape
-
-        aspect_ratio = w / h
-
-        new_width = min(self.video_widget.width(), int(self.video_widget.height() * aspect_ratio))
-        new_height = min(self.video_widget.height(), int(self.video_widget.width() / aspect_ratio))
-
-        scaled_frame = cv2.resize(frame, (new_width, new_height))
-
-        bytes_per_line = ch * new_width
-
-        img = QImage(scaled_frame.data, new_width, new_height, bytes_per_line, QImage.Format_RGB888)
-
-        pixmap = QPixmap.fromImage(img)
+        if self.recording_settings_dialog is None:
+            from dialogs import RecordingSettingsDialog
 
-        self.video_widget.setPixmap(pixmap)
-
-    def record_video(self, frame):
-        '''Запись видео'''
-        try:
-            if True:
-                destination, record_length, auto_delete, auto_delete_days, enable_record = Database.get_recording_settings()
-                width = 1920
-                height = 1080
-
-                if enable_record:
-                    current_time = datetime.datetime.now()
-                    elapsed_time = current_time - self.start_time if hasattr(self, 'start_time') else datetime.timedelta(0)
-
-                    if not hasattr(self, 'out') or elapsed_time.total_seconds() >= 60 * record_length or self.out is None:
-                        if hasattr(self, 'out') and self.out:
-                            self.out.release()
-
-                        file_pattern = os.path.join(destination, '%d.%m.%Y_%H.%M.%S.avi')
-                        self.out = cv2.VideoWriter(current_time.strftime(file_pattern), cv2.VideoWriter_fourcc(*'XVID'), 20.0, (int(width), int(height)))
-                        self.start_time = datetime.datetime.now()
-
-                    self.out.write(frame)
-                else:
-                    self.out = None
-
-                if auto_delete:
-                    self.delete_old_videos(destination, auto_delete_days)
-        except Exception as e:
-            logging.error(f"Ошибка записи видео: {str(e)}")
-
-    def delete_old_videos(self, folder, days):
-        '''Удаление старых видеофайлов'''
+            self.recording_settings_dialog = RecordingSettingsDialog(self)
+        self.recording_settings_dialog.show()
+        if self.camera_settings_dialog is not None:
+            self.camera_settings_dialog.hide()
+
+    def show_playback_window(self):
+        '''Отображение окна архива записей'''
+        if self.playback_window is None:
+            from playback import PlaybackWindow
+
+            self.playback_window = PlaybackWindow(self)
+        self.playback_window.show()
+
+    def add_tile(self, camera):
+        '''Создание плитки камеры; видео появится после подключения к конвейеру (attach_tile)'''
+        tile = VideoTile(camera, parent=self.grid_widget)
+        tile.show_stats = self.show_stats
+        self.tiles[camera.id] = tile
+        return tile
+
+    def attach_tile(self, pipeline):
+        '''Подключение плитки к запущенному конвейеру камеры, при необходимости с созданием плитки'''
+        tile = self.tiles.get(pipeline.camera.id) or self.add_tile(pipeline.camera)
+        tile.attach(pipeline.mailbox, pipeline.get_metrics)
+
+    def set_show_stats(self, enabled):
+        '''Включение или отключение статистики на плитках камер'''
+        self.show_stats = enabled
+        for tile in self.tiles.values():
+            tile.show_stats = enabled
+
+    def on_camera_state_changed(self, camera_id, state, message):
+        '''Отображение состояния подключения камеры на её плитке'''
+        tile = self.tiles.get(camera_id)
+        if tile is not None:
+            tile.show_state(state, message)
+
+    def remove_tile(self, camera_id):
+        '''Удаление плитки камеры'''
+        self.first_frame_pending.pop(camera_id, None)
+        tile = self.tiles.pop(camera_id, None)
+        if tile is not None:
+            self.grid_layout.removeWidget(tile)
+            tile.deleteLater()
+
+    def run_camera_task(self, target, *args):
+        '''Остановка и запуск камер в фоне: остановка ждёт потоки захвата, а они могут ждать таймаута камеры'''
+        self.camera_threads = [thread for thread in self.camera_threads if thread.is_alive()]
+        thread = threading.Thread(target=target, args=args, name='camera-restart', daemon=True)
+        self.camera_threads.append(thread)
+        thread.start()
+
+    def restart_camera(self, camera_id):
+        '''Перезапуск камеры после изменения её настроек; до запуска нового конвейера плитка показывает заглушку'''
+        action = 'restart' if camera_id in self.tiles else 'start'
+        self.remove_tile(camera_id)
+        camera = Database.get_camera_settings(camera_id)
+        if camera is not None:
+            self.add_tile(camera)
+            self.first_frame_pending[camera_id] = (time.monotonic(), f"Camera {camera_id} first frame after {action}")
+        self.update_grid()
+        self.run_camera_task(self.restart_in_background, camera_id)
+
+    def restart_in_background(self, camera_id):
+        '''Перезапуск конвейера камеры вне потока интерфейса'''
         try:
-            current_time = datetime.datetime.now()
-
-            for file_name in os.listdir(folder):
-                file_path = os.path.join(folder, file_name)
-
-                file_time = datetime.datetime.fromtimestamp(os.path.getctime(file_path))
-
-                if (current_time - file_time).days >= days:
-                    os.remove(file_path)
+            pipeline = self.engine.restart_camera(camera_id)
         except Exception as e:
-            logging.error(f"Ошибка удаления старых видео: {str(e)}")
-
-    def handle_video_thread_error(self, error_text):
-        '''Обработка ошибки видеопотока'''
-        logging.error(f"Error in VideoThread: {error_text}")
-        self.video_thread.reconnect()
-
-    def handle_reconnect_required(self):
-        '''Обработка запроса на реконнект видеопотока'''
-        self.video_thread.reconnect()
+            logging.error(f"Ошибка перезапуска камеры {camera_id}: {str(e)}")
+            pipeline = None
+        self.camera_restarted_signal.emit(camera_id, pipeline)
+
+    def on_camera_restarted(self, camera_id, pipeline):
+        '''Подключение плитки к перезапущенному конвейеру, если камера не удалена за это время'''
+        if pipeline is not None and camera_id in self.tiles and self.engine.pipelines.get(camera_id) is pipeline:
+            self.attach_tile(pipeline)
+
+    def remove_camera(self, camera_id):
+        '''Остановка удалённой камеры'''
+        self.remove_tile(camera_id)
+        self.update_grid()
+        self.run_camera_task(self.engine.stop_camera, camera_id)
+
+    def update_grid(self):
+        '''Раскладка плиток камер в квадратную сетку'''
+        self.grid_layout.removeWidget(self.empty_label)
+        for tile in self.tiles.values():
+            self.grid_layout.removeWidget(tile)
+
+        if not self.tiles:
+            self.grid_layout.addWidget(self.empty_label, 0, 0)
+            self.empty_label.show()
+            return
+
+        self.empty_label.hide()
+        columns = math.ceil(math.sqrt(len(self.tiles)))
+        for index, camera_id in enumerate(sorted(self.tiles)):
+            self.grid_layout.addWidget(self.tiles[camera_id], index // columns, index % columns)
+
+    def refresh_tiles(self):
+        '''Отображение последних кадров всех камер с частотой DISPLAY_FPS'''
+        for camera_id, tile in self.tiles.items():
+            if tile.refresh() and camera_id in self.first_frame_pending:
+                started, message = self.first_frame_pending.pop(camera_id)
+                logging.info(f"{message} in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    def closeEvent(self, event):
+        '''Остановка видеопотоков и записи при закрытии окна'''
+        self.display_timer.stop()
+        # Камеры могут ещё запускаться в фоне, останавливать их можно только после запуска
+        self.startup_thread.join()
+        for thread in self.camera_threads:
+            thread.join()
+        if self.engine is None:
+            # Сигнал о готовности движка мог не успеть обработаться
+            QApplication.processEvents()
+        if self.engine is not None:
+            self.engine.stop()
+        Database.close()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     '''Запуск приложения'''
     app = QApplication(sys.argv)
     main_app = MainApplication()
     main_app.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
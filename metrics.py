@@ -0,0 +1,148 @@
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_PORT = 9180
+'''Порт HTTP-страницы метрик по умолчанию'''
+
+QUANTILES = (0.5, 0.9, 0.99)
+'''Квантили времени этапов, считаемые по последним замерам'''
+
+METRICS = {
+    'frames_read_total': ('counter', 'Frames read from the camera stream'),
+    'capture_connects_total': ('counter', 'Attempts to open the camera stream'),
+    'capture_read_seconds': ('summary', 'Time spent reading and decoding a frame'),
+    'motion_seconds': ('summary', 'Time spent on motion analysis of a frame'),
+    'display_prepare_seconds': ('summary', 'Time spent scaling and converting a frame for live view'),
+    'display_frames_total': ('counter', 'Live view frames by outcome'),
+    'record_frames_total': ('counter', 'Frames passed to the transcoding recorder by outcome'),
+    'record_queue_depth': ('gauge', 'Frames waiting in the recorder queue'),
+    'record_encode_seconds': ('summary', 'Time spent encoding and writing a frame'),
+    'stream_copy_packets_total': ('counter', 'Packets written without re-encoding'),
+    'stream_copy_segments_total': ('counter', 'Segments written without re-encoding'),
+    'stream_copy_mux_seconds': ('summary', 'Time spent muxing a packet'),
+    'retention_seconds': ('summary', 'Time spent in one retention pass'),
+    'retention_deleted_segments_total': ('counter', 'Segments deleted by retention'),
+    'retention_deleted_bytes_total': ('counter', 'Bytes deleted by retention'),
+    'preview_frames_encoded_total': ('counter', 'JPEG preview frames encoded for relay viewers'),
+    'relay_viewers': ('gauge', 'Viewers connected to the relay'),
+    'relay_packets_total': ('counter', 'Compressed packets relayed to viewers'),
+    'worker_restarts_total': ('counter', 'Restarts of crashed camera processes'),
+}
+'''Описание метрик: тип Prometheus и текст справки'''
+
+
+class StageTimer:
+    '''Накопитель времени этапа конвейера: число замеров, суммарное время и окно последних замеров
+    для квантилей (секунды по монотонным часам)'''
+
+    WINDOW = 1024
+    '''Число последних замеров, по которым считаются квантили'''
+
+    def __init__(self):
+        '''Инициализация накопителя'''
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=self.WINDOW)
+
+    def add(self, seconds):
+        '''Добавление замера'''
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        '''Число замеров, суммарное время и квантили QUANTILES по последним замерам'''
+        with self.lock:
+            count, total, recent = self.count, self.total, sorted(self.recent)
+        if not recent:
+            return count, total, {}
+        return count, total, {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in QUANTILES}
+
+
+def find_metric(samples, name, **labels):
+    '''Значение первой метрики с указанным именем и метками или 0'''
+    for sample_name, sample_labels, value in samples:
+        if sample_name == name and all(sample_labels.get(key) == label for key, label in labels.items()):
+            return value
+    return 0
+
+
+def render_metrics(samples, prefix='pydvr_'):
+    '''Текст метрик в формате Prometheus; samples — список (имя, метки, значение),
+    для summary значение — StageTimer.snapshot()'''
+    grouped = {}
+    for name, labels, value in samples:
+        grouped.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, values in grouped.items():
+        metric_type, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {prefix}{name} {help_text}')
+        lines.append(f'# TYPE {prefix}{name} {metric_type}')
+        for labels, value in values:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+            label_text = '{' + label_text + '}' if label_text else ''
+            if metric_type == 'summary':
+                count, total, quantiles = value
+                for quantile, seconds in quantiles.items():
+                    quantile_labels = ','.join(filter(None, (label_text[1:-1], f'quantile="{quantile}"')))
+                    lines.append(f'{prefix}{name}{{{quantile_labels}}} {seconds:.6f}')
+                lines.append(f'{prefix}{name}_count{label_text} {count}')
+                lines.append(f'{prefix}{name}_sum{label_text} {total:.6f}')
+            else:
+                lines.append(f'{prefix}{name}{label_text} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(threading.Thread):
+    '''Локальная HTTP-страница /metrics для Prometheus'''
+
+    def __init__(self, collect, port=DEFAULT_METRICS_PORT, host='127.0.0.1'):
+        '''Инициализация сервера; collect возвращает список метрик для render_metrics'''
+        super().__init__(daemon=True)
+        self.collect = collect
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = render_metrics(server.collect()).encode()
+                except Exception as e:
+                    logging.error(f"Ошибка сбора метрик: {str(e)}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        '''Порт, на котором принимаются запросы'''
+        return self.httpd.server_address[1]
+
+    def run(self):
+        '''Основной метод потока: обработка запросов'''
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def stop(self):
+        '''Остановка сервера'''
+        if self.is_alive():
+            self.httpd.shutdown()
+            self.join()
+        self.httpd.server_close()
@@ -0,0 +1,117 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from database import Database
+from metrics import StageTimer
+
+
+class MotionDetector:
+    '''Дешёвый детектор движения по разнице соседних уменьшенных кадров в оттенках серого'''
+
+    ANALYSIS_WIDTH = 160
+    '''Примерная ширина кадра, на котором ищется движение (пиксели)'''
+
+    def __init__(self):
+        '''Инициализация детектора'''
+        self.previous = None
+
+    def score(self, frame, sensitivity):
+        '''Доля изменившихся пикселей (проценты): пиксель считается изменившимся,
+        если его яркость отличается от предыдущего кадра больше чем на sensitivity'''
+        # Прореживание срезом почти ничего не стоит, дальше все операции идут по маленькому кадру
+        step = max(1, frame.shape[1] // self.ANALYSIS_WIDTH)
+        small = np.ascontiguousarray(frame[::step, ::step])
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return 0.0
+
+        diff = cv2.absdiff(gray, previous)
+        _, mask = cv2.threshold(diff, sensitivity, 255, cv2.THRESH_BINARY)
+        return 100.0 * cv2.countNonZero(mask) / mask.size
+
+
+class MotionGate:
+    '''Состояние записи по движению одной камеры: обновляется потоком захвата, читается потоками записи'''
+
+    def __init__(self):
+        '''Инициализация состояния'''
+        self.detector = MotionDetector()
+        self.last_motion = None
+        self.last_score = 0.0
+        self.analysis_timer = StageTimer()
+
+    def update(self, frame):
+        '''Анализ кадра, если включена запись по движению'''
+        settings = Database.get_recording_settings()
+        if settings is None or not settings.enable_record or not settings.motion_recording:
+            self.detector.previous = None
+            return
+
+        started = time.perf_counter()
+        self.last_score = self.detector.score(frame, settings.motion_sensitivity)
+        self.analysis_timer.add(time.perf_counter() - started)
+        if self.last_score >= settings.motion_threshold:
+            self.last_motion = time.monotonic()
+
+    def is_active(self, post_roll):
+        '''Есть ли движение сейчас или не прошло ли post_roll секунд после его окончания'''
+        return self.last_motion is not None and time.monotonic() - self.last_motion <= post_roll
+
+
+class PreRollBuffer:
+    '''Кольцевой буфер предзаписи: хранит последние кадры или пакеты, начиная всегда с ключевого кадра'''
+
+    def __init__(self, max_items=None, max_bytes=None, item_size=None):
+        '''Инициализация буфера; max_items ограничивает число хранимых элементов,
+        max_bytes — их суммарный размер, который считает item_size(элемент)'''
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.item_size = item_size
+        self.gops = deque()
+        self.count = 0
+        self.size = 0
+
+    def append(self, item, timestamp, keyframe, duration):
+        '''Добавление элемента и удаление групп кадров старше duration секунд или сверх ограничений'''
+        if not keyframe and not self.gops:
+            # Без предшествующего ключевого кадра элемент не декодируется
+            return
+
+        if keyframe:
+            self.gops.append((timestamp, []))
+        self.gops[-1][1].append(item)
+        self.count += 1
+        if self.item_size is not None:
+            self.size += self.item_size(item)
+
+        while len(self.gops) > 1 and (self.gops[1][0] <= timestamp - duration or self.over_limit()):
+            group = self.gops.popleft()[1]
+            self.count -= len(group)
+            if self.item_size is not None:
+                self.size -= sum(self.item_size(buffered) for buffered in group)
+
+        if duration <= 0:
+            self.clear()
+
+    def over_limit(self):
+        '''Превышено ли ограничение числа или размера элементов'''
+        return ((self.max_items is not None and self.count > self.max_items)
+                or (self.max_bytes is not None and self.size > self.max_bytes))
+
+    def drain(self):
+        '''Извлечение всех элементов буфера по порядку'''
+        items = [item for timestamp, group in self.gops for item in group]
+        self.clear()
+        return items
+
+    def clear(self):
+        '''Очистка буфера'''
+        self.gops.clear()
+        self.count = 0
+        self.size = 0
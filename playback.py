@@ -0,0 +1,296 @@
+import datetime
+import logging
+import os
+import threading
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QHBoxLayout, QDateTimeEdit, QWidget, QLabel, QPushButton, QMessageBox, QFileDialog, QComboBox, QListWidget, QListWidgetItem, QSizePolicy, QSlider
+from PyQt5.QtGui import QIcon, QPixmap, QImage
+from PyQt5.QtCore import Qt, QTimer, QDateTime, pyqtSignal
+import cv2
+from database import Database
+from catalog import find_recordings, resolve_position, next_segment, keyframe_position, thumbnail_at
+from display import prepare_display_frame
+from widgets import show_rgb_frame
+
+def show_frame(label, frame):
+    '''Уменьшение кадра BGR до размера виджета с сохранением пропорций и отображение'''
+    show_rgb_frame(label, prepare_display_frame(frame, label.width(), label.height()))
+
+class PlaybackWindow(QMainWindow):
+    '''Окно архива: поиск записей по интервалу времени и воспроизведение с перемоткой между сегментами'''
+
+    export_finished_signal = pyqtSignal(bool, str)
+    '''Сигнал о завершении выгрузки из фонового потока: успех и текст сообщения'''
+
+    def __init__(self, parent=None):
+        '''Инициализация окна архива'''
+        super().__init__(parent)
+
+        self.setWindowTitle("Архив записей")
+        self.setGeometry(100, 100, 900, 650)
+
+        self.central_widget = QWidget(self)
+        self.setCentralWidget(self.central_widget)
+
+        self.main_layout = QVBoxLayout()
+
+        self.setup_playback_tab()
+
+        self.central_widget.setLayout(self.main_layout)
+
+        self.cap = None
+        self.segment = None
+        self.timeline_camera_id = None
+        self.timeline_start = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.next_frame)
+        self.export_finished_signal.connect(self.on_export_finished)
+
+        icon = QIcon('icons/main_icon.ico')
+        self.setWindowIcon(icon)
+
+    def setup_playback_tab(self):
+        '''Настройка внешнего вида окна архива'''
+        self.camera_combobox = QComboBox()
+
+        now = QDateTime.currentDateTime()
+        self.from_edit = QDateTimeEdit(now.addSecs(-3600))
+        self.from_edit.setDisplayFormat("dd.MM.yyyy HH:mm:ss")
+        self.from_edit.setCalendarPopup(True)
+        self.to_edit = QDateTimeEdit(now)
+        self.to_edit.setDisplayFormat("dd.MM.yyyy HH:mm:ss")
+        self.to_edit.setCalendarPopup(True)
+
+        self.search_button = QPushButton("Найти", self)
+        self.search_button.clicked.connect(self.search_recordings)
+
+        self.play_button = QPushButton("Воспроизвести с начала интервала", self)
+        self.play_button.clicked.connect(self.play_from_start)
+
+        self.pause_button = QPushButton("Пауза", self)
+        self.pause_button.clicked.connect(self.toggle_pause)
+
+        self.export_button = QPushButton("Экспорт интервала...", self)
+        self.export_button.clicked.connect(self.export_interval)
+
+        self.segment_list = QListWidget()
+        self.segment_list.setMaximumHeight(150)
+        self.segment_list.itemDoubleClicked.connect(self.play_segment_item)
+
+        self.position_label = QLabel()
+
+        # Шкала интервала поиска: при перетаскивании показываются сохранённые миниатюры без декодирования видео
+        self.timeline_slider = QSlider(Qt.Horizontal, self)
+        self.timeline_slider.setEnabled(False)
+        self.timeline_slider.sliderMoved.connect(self.scrub_timeline)
+        self.timeline_slider.sliderReleased.connect(self.seek_timeline)
+
+        self.video_widget = QLabel()
+        self.video_widget.setAlignment(Qt.AlignCenter)
+        self.video_widget.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.video_widget.setStyleSheet("background-color: black; color: white;")
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(QLabel("Камера:"))
+        controls_layout.addWidget(self.camera_combobox)
+        controls_layout.addWidget(QLabel("С:"))
+        controls_layout.addWidget(self.from_edit)
+        controls_layout.addWidget(QLabel("По:"))
+        controls_layout.addWidget(self.to_edit)
+        controls_layout.addWidget(self.search_button)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.play_button)
+        buttons_layout.addWidget(self.pause_button)
+        buttons_layout.addWidget(self.export_button)
+        buttons_layout.addWidget(self.position_label)
+
+        self.main_layout.addLayout(controls_layout)
+        self.main_layout.addWidget(self.segment_list)
+        self.main_layout.addLayout(buttons_layout)
+        self.main_layout.addWidget(self.timeline_slider)
+        self.main_layout.addWidget(self.video_widget, 1)
+
+    def showEvent(self, event):
+        '''Обновление списка камер при открытии окна'''
+        self.load_cameras()
+        super().showEvent(event)
+
+    def load_cameras(self):
+        '''Заполнение списка камер из базы данных'''
+        camera_id = self.camera_combobox.currentData()
+        self.camera_combobox.clear()
+        for camera in Database.get_cameras():
+            self.camera_combobox.addItem(camera.name or camera.ip, camera.id)
+        self.camera_combobox.setCurrentIndex(max(0, self.camera_combobox.findData(camera_id)))
+
+    def search_recordings(self):
+        '''Поиск сегментов выбранной камеры в интервале времени'''
+        camera_id = self.camera_combobox.currentData()
+        if camera_id is None:
+            return
+
+        self.segment_list.clear()
+        start_time = self.from_edit.dateTime().toSecsSinceEpoch()
+        end_time = self.to_edit.dateTime().toSecsSinceEpoch()
+        for segment in find_recordings(camera_id, start_time, end_time):
+            item = QListWidgetItem(f"{format_timestamp(segment.start_time)} — {format_timestamp(segment.end_time)}    {os.path.basename(segment.path)}")
+            item.setData(Qt.UserRole, segment)
+            self.segment_list.addItem(item)
+
+        self.timeline_camera_id = camera_id
+        self.timeline_start = start_time
+        self.timeline_slider.setRange(0, max(0, end_time - start_time))
+        self.timeline_slider.setValue(0)
+        self.timeline_slider.setEnabled(self.segment_list.count() > 0)
+
+        if self.segment_list.count() == 0:
+            QMessageBox.information(self, "Архив", "За указанный интервал записей нет.")
+
+    def play_from_start(self):
+        '''Воспроизведение с момента начала интервала'''
+        camera_id = self.camera_combobox.currentData()
+        if camera_id is None:
+            return
+
+        position = resolve_position(camera_id, self.from_edit.dateTime().toSecsSinceEpoch())
+        if position is None:
+            QMessageBox.information(self, "Архив", "После указанного момента записей нет.")
+            return
+        self.open_segment(position.segment, position.offset)
+
+    def scrub_timeline(self, value):
+        '''Показ миниатюры момента под ползунком шкалы; воспроизведение на время перетаскивания приостанавливается'''
+        self.timer.stop()
+        timestamp = self.timeline_start + value
+        self.position_label.setText(format_timestamp(timestamp))
+
+        thumbnail = thumbnail_at(self.timeline_camera_id, timestamp)
+        if thumbnail is None:
+            self.video_widget.setText("Нет записи")
+            return
+        image = QImage.fromData(thumbnail[1], 'JPG')
+        self.video_widget.setPixmap(QPixmap.fromImage(image).scaled(
+            self.video_widget.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def seek_timeline(self):
+        '''Воспроизведение с ключевого кадра, ближайшего к выбранному на шкале моменту'''
+        timestamp = self.timeline_start + self.timeline_slider.value()
+        position = resolve_position(self.timeline_camera_id, timestamp)
+        if position is None:
+            QMessageBox.information(self, "Архив", "После указанного момента записей нет.")
+            return
+        position = keyframe_position(position)
+        self.open_segment(position.segment, position.offset)
+
+    def play_segment_item(self, item):
+        '''Воспроизведение выбранного в списке сегмента с начала'''
+        self.open_segment(item.data(Qt.UserRole), 0.0)
+
+    def open_segment(self, segment, offset):
+        '''Открытие сегмента и перемотка на смещение (секунды от начала файла)'''
+        self.release()
+
+        while segment is not None:
+            self.cap = cv2.VideoCapture(segment.path)
+            if self.cap.isOpened():
+                break
+            logging.error(f"Не удалось открыть запись {segment.path}")
+            self.cap.release()
+            self.cap = None
+            segment, offset = next_segment(segment), 0.0
+
+        self.segment = segment
+        if segment is None:
+            return
+
+        if offset > 0:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, offset * 1000)
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 25
+        self.timer.start(max(1, int(1000 / fps)))
+        self.pause_button.setText("Пауза")
+
+    def next_frame(self):
+        '''Отображение следующего кадра с переходом к следующему сегменту в конце файла'''
+        ret, frame = self.cap.read()
+        if not ret:
+            self.open_segment(next_segment(self.segment), 0.0)
+            return
+
+        position = self.segment.start_time + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        self.position_label.setText(format_timestamp(position))
+        if self.timeline_start is not None and self.segment.camera_id == self.timeline_camera_id \
+                and not self.timeline_slider.isSliderDown():
+            self.timeline_slider.setValue(int(position - self.timeline_start))
+        show_frame(self.video_widget, frame)
+
+    def export_interval(self):
+        '''Выгрузка записей выбранной камеры за интервал в файл; выполняется в фоновом потоке'''
+        camera_id = self.camera_combobox.currentData()
+        if camera_id is None:
+            return
+
+        start_time = self.from_edit.dateTime().toSecsSinceEpoch()
+        end_time = self.to_edit.dateTime().toSecsSinceEpoch()
+        default_name = f"camera{camera_id}_{datetime.datetime.fromtimestamp(start_time).strftime('%Y%m%d_%H%M%S')}.mkv"
+        output_path, _ = QFileDialog.getSaveFileName(self, "Экспорт интервала", default_name,
+                                                     "Matroska (*.mkv);;MP4 (*.mp4);;MPEG-TS (*.ts)")
+        if not output_path:
+            return
+
+        self.export_button.setEnabled(False)
+        self.export_button.setText("Экспорт...")
+        threading.Thread(target=self.run_export, args=(camera_id, start_time, end_time, output_path),
+                         name='export', daemon=True).start()
+
+    def run_export(self, camera_id, start_time, end_time, output_path):
+        '''Выгрузка в фоновом потоке с передачей результата в окно через сигнал'''
+        from export import export_clip, ExportError
+
+        try:
+            result = export_clip(camera_id, start_time, end_time, output_path)
+        except ExportError as e:
+            self.export_finished_signal.emit(False, str(e))
+        except Exception as e:
+            logging.error(f"Ошибка выгрузки {output_path}: {str(e)}")
+            self.export_finished_signal.emit(False, str(e))
+        else:
+            self.export_finished_signal.emit(True, f"Сохранено: {result.path}\n"
+                                                   f"{format_timestamp(result.start_time)} — {format_timestamp(result.end_time)}")
+
+    def on_export_finished(self, success, message):
+        '''Сообщение о результате выгрузки'''
+        self.export_button.setEnabled(True)
+        self.export_button.setText("Экспорт интервала...")
+        if success:
+            QMessageBox.information(self, "Экспорт", message)
+        else:
+            QMessageBox.warning(self, "Экспорт", f"Не удалось выгрузить фрагмент: {message}")
+
+    def toggle_pause(self):
+        '''Пауза и продолжение воспроизведения'''
+        if self.cap is None:
+            return
+        if self.timer.isActive():
+            self.timer.stop()
+            self.pause_button.setText("Продолжить")
+        else:
+            self.timer.start()
+            self.pause_button.setText("Пауза")
+
+    def release(self):
+        '''Остановка воспроизведения и закрытие файла'''
+        self.timer.stop()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self.segment = None
+
+    def closeEvent(self, event):
+        '''Остановка воспроизведения при закрытии окна'''
+        self.release()
+        super().closeEvent(event)
+
+def format_timestamp(timestamp):
+    '''Форматирование времени Unix для отображения'''
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%d.%m.%Y %H:%M:%S')
@@ -0,0 +1,142 @@
+import argparse
+import datetime
+import logging
+import signal
+import sys
+import threading
+
+import database
+from database import Database
+
+# Модули движка (OpenCV, PyAV) загружаются внутри команд: запуск интерфейса не должен их ждать
+
+
+def run_recorder(args):
+    '''Запуск записи без интерфейса до получения SIGINT или SIGTERM'''
+    from engine import Engine
+
+    Database.start_database()
+    engine = Engine(use_processes=args.processes, metrics_port=args.metrics_port, relay_port=args.relay_port,
+                    relay_host=args.relay_host)
+    stop_event = threading.Event()
+
+    def on_signal(signum, frame):
+        logging.info(f"Received signal {signum}, stopping recorder")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    engine.start()
+    logging.info(f"Recorder started: {len(engine.pipelines)} camera(s)")
+    try:
+        # Ожидание с таймаутом, чтобы сигналы обрабатывались и на Windows
+        while not stop_event.wait(1):
+            pass
+    finally:
+        engine.stop()
+        Database.close()
+    return 0
+
+
+def run_bench(args):
+    '''Замер производительности конвейера без интерфейса на тестовых источниках'''
+    from benchmark import run_benchmark
+
+    run_benchmark(args.cameras, args.source, args.duration, args.warmup, args.processes, args.display_fps, args.json)
+    return 0
+
+
+def parse_time(value):
+    '''Время из командной строки: секунды Unix или дата в формате ГГГГ-ММ-ДД ЧЧ:ММ:СС / ДД.ММ.ГГГГ ЧЧ:ММ:СС'''
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d.%m.%Y %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, time_format).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"неверный формат времени: {value}")
+
+
+def run_export(args):
+    '''Выгрузка записей камеры за интервал в один файл без перекодирования'''
+    from export import export_clip, ExportError
+
+    Database.start_database()
+    try:
+        result = export_clip(args.camera, args.start, args.end, args.output)
+    except ExportError as e:
+        logging.error(f"Export failed: {str(e)}")
+        return 1
+    finally:
+        Database.close()
+
+    print(f"{result.path}: {result.segments} segment(s), {result.packets} packets, "
+          f"{result.end_time - result.start_time:.1f} s from "
+          f"{datetime.datetime.fromtimestamp(result.start_time).strftime('%Y-%m-%d %H:%M:%S')}")
+    return 0
+
+
+def run_gui(args):
+    '''Запуск приложения Qt'''
+    from PyQt5.QtWidgets import QApplication
+    from main import MainApplication
+
+    app = QApplication(sys.argv[:1])
+    main_app = MainApplication(use_processes=args.processes, metrics_port=args.metrics_port, relay_port=args.relay_port,
+                               relay_host=args.relay_host)
+    main_app.show()
+    return app.exec_()
+
+
+def main(argv=None):
+    '''Разбор аргументов командной строки и запуск выбранной команды'''
+    parser = argparse.ArgumentParser(prog='pydvr', description='PyDVR — запись IP-камер')
+    parser.add_argument('--database', default=database.DATABASE_PATH, help='путь к файлу базы данных')
+    parser.add_argument('--log-level', default='INFO', help='уровень журналирования (DEBUG, INFO, WARNING, ERROR)')
+    parser.add_argument('--processes', action='store_true', help='запускать каждую камеру в отдельном процессе')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='открыть страницу метрик Prometheus http://127.0.0.1:PORT/metrics (например, 9180)')
+    parser.add_argument('--relay-port', type=int, default=None,
+                        help='раздавать потоки камер зрителям по HTTP на этом порту (например, 8554)')
+    parser.add_argument('--relay-host', default='127.0.0.1',
+                        help='адрес ретрансляции; 0.0.0.0 открывает её всем в сети без пароля (по умолчанию 127.0.0.1)')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    record_parser = subparsers.add_parser('record', help='запись всех камер без интерфейса')
+    record_parser.set_defaults(handler=run_recorder)
+
+    bench_parser = subparsers.add_parser('bench', help='замер производительности на синтетических или файловых источниках')
+    bench_parser.add_argument('--cameras', type=int, nargs='+', default=[1, 4, 16], help='число камер в сценариях')
+    bench_parser.add_argument('--source', default='synthetic://1920x1080@25',
+                              help='источник кадров: synthetic://ШИРИНАxВЫСОТА@FPS или file:///путь/к/видео.mp4')
+    bench_parser.add_argument('--duration', type=float, default=30, help='длительность замера (секунды)')
+    bench_parser.add_argument('--warmup', type=float, default=5, help='прогрев перед замером (секунды)')
+    bench_parser.add_argument('--display-fps', type=int, default=15, help='частота просмотра (0 — без просмотра)')
+    bench_parser.add_argument('--json', help='сохранить результаты в файл JSON')
+    bench_parser.set_defaults(handler=run_bench)
+
+    export_parser = subparsers.add_parser('export', help='выгрузка фрагмента архива в файл без перекодирования')
+    export_parser.add_argument('--camera', type=int, required=True, help='номер камеры')
+    export_parser.add_argument('--start', type=parse_time, required=True,
+                               help='начало: "ГГГГ-ММ-ДД ЧЧ:ММ:СС" или секунды Unix')
+    export_parser.add_argument('--end', type=parse_time, required=True,
+                               help='конец: "ГГГГ-ММ-ДД ЧЧ:ММ:СС" или секунды Unix')
+    export_parser.add_argument('-o', '--output', required=True, help='выходной файл .mkv, .mp4 или .ts')
+    export_parser.set_defaults(handler=run_export)
+
+    gui_parser = subparsers.add_parser('gui', help='запуск приложения с интерфейсом')
+    gui_parser.set_defaults(handler=run_gui)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(threadName)s: %(message)s')
+    database.DATABASE_PATH = args.database
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
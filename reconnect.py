@@ -0,0 +1,38 @@
+import random
+
+STATE_CONNECTING = 'connecting'
+'''Идёт попытка открыть поток'''
+STATE_STREAMING = 'streaming'
+'''Поток открыт, кадры читаются'''
+STATE_BACKOFF = 'backoff'
+'''Ожидание перед следующей попыткой подключения'''
+STATE_FAILED = 'failed'
+'''Попытки подключения исчерпаны'''
+STATE_STOPPED = 'stopped'
+'''Поток остановлен'''
+
+
+class Backoff:
+    '''Экспоненциальная задержка между попытками подключения со случайным разбросом'''
+
+    def __init__(self, base=1.0, maximum=60.0, max_attempts=0):
+        '''Инициализация; max_attempts=0 означает неограниченное число попыток'''
+        self.base = base
+        self.maximum = maximum
+        self.max_attempts = max_attempts
+        self.attempts = 0
+
+    def reset(self):
+        '''Сброс после успешного подключения'''
+        self.attempts = 0
+
+    def exhausted(self):
+        '''Исчерпаны ли попытки подключения'''
+        return self.max_attempts > 0 and self.attempts >= self.max_attempts
+
+    def next_delay(self):
+        '''Задержка перед следующей попыткой (секунды): base * 2^n, не больше maximum,
+        случайно уменьшенная до половины, чтобы камеры не переподключались одновременно'''
+        delay = min(self.maximum, self.base * 2 ** self.attempts)
+        self.attempts += 1
+        return delay * random.uniform(0.5, 1.0)
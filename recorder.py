@@ -0,0 +1,430 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from database import Database
+from motion import PreRollBuffer
+from metrics import StageTimer
+from thumbnails import SegmentIndex, read_avi_keyframes
+
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+'''При переполнении очереди выбрасывается самый старый кадр'''
+OVERFLOW_BLOCK = 'block'
+'''При переполнении очереди поток захвата ждёт освобождения места'''
+
+RECORDING_MODE_TRANSCODE = 'transcode'
+'''Декодирование кадров и перекодирование в MPEG-4 Part 2 (MKV через PyAV, без PyAV — XVID AVI через OpenCV)'''
+RECORDING_MODE_STREAM_COPY = 'stream_copy'
+'''Запись сжатых пакетов камеры без декодирования и перекодирования'''
+
+DEFAULT_FPS = 20.0
+'''Частота кадров сегмента, пока частота потока неизвестна'''
+
+
+class FrameRateEstimator:
+    '''Фактическая частота кадров потока по времени захвата: медиана интервалов между последними кадрами'''
+
+    WINDOW = 50
+    '''Число последних интервалов в оценке'''
+    MIN_INTERVALS = 10
+    '''Число интервалов, после которого оценке можно доверять'''
+
+    def __init__(self, window=WINDOW):
+        '''Инициализация оценки'''
+        self.intervals = deque(maxlen=window)
+        self.last_timestamp = None
+
+    def add(self, timestamp):
+        '''Учёт кадра с временем захвата timestamp (секунды Unix)'''
+        if self.last_timestamp is not None and timestamp > self.last_timestamp:
+            self.intervals.append(timestamp - self.last_timestamp)
+        self.last_timestamp = timestamp
+
+    def fps(self):
+        '''Частота кадров (кадров в секунду) или None, пока кадров мало'''
+        if len(self.intervals) < self.MIN_INTERVALS:
+            return None
+        # Медиана не реагирует на разовые задержки и пачки кадров после них
+        interval = sorted(self.intervals)[len(self.intervals) // 2]
+        return 1.0 / interval if interval > 0 else None
+
+
+class TimestampWriter:
+    '''Сегмент MKV с переменной частотой кадров через PyAV: время кадра в файле — время его захвата,
+    поэтому пропуски кадров не требуют ни повторного кодирования, ни сдвига шкалы времени'''
+
+    extension = 'mkv'
+    TIME_BASE = Fraction(1, 1000)
+    '''Шкала времени кадров (миллисекунды)'''
+    BITS_PER_PIXEL = 0.1
+    '''Битрейт на пиксель кадра при частоте потока'''
+    KEYFRAME_INTERVAL = 2
+    '''Период ключевых кадров (секунды): от него зависит точность перехода по шкале времени'''
+
+    def __init__(self, path, width, height, fps):
+        '''Открытие файла; fps — частота потока для битрейта и периода ключевых кадров'''
+        self.output = av.open(path, mode='w')
+        self.stream = self.output.add_stream('mpeg4', rate=Fraction(fps).limit_denominator(1001))
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = 'yuv420p'
+        self.stream.bit_rate = int(width * height * fps * self.BITS_PER_PIXEL)
+        self.stream.codec_context.time_base = self.TIME_BASE
+        self.stream.codec_context.gop_size = max(1, int(round(fps * self.KEYFRAME_INTERVAL)))
+        self.frame_duration = 1.0 / fps
+        self.last_pts = None
+        self.keyframes = []
+
+    @property
+    def duration(self):
+        '''Длительность записанного (секунды): до конца последнего кадра'''
+        return 0.0 if self.last_pts is None else float(self.last_pts * self.TIME_BASE) + self.frame_duration
+
+    def write(self, frame, offset):
+        '''Кодирование кадра BGR со смещением offset от начала сегмента (секунды); False, если время кадра не позже предыдущего'''
+        pts = int(round(offset / self.TIME_BASE))
+        if self.last_pts is not None and pts <= self.last_pts:
+            return False
+        video_frame = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        video_frame.pts = pts
+        video_frame.time_base = self.TIME_BASE
+        self.mux(self.stream.encode(video_frame))
+        self.last_pts = pts
+        return True
+
+    def mux(self, packets):
+        '''Запись пакетов кодировщика с учётом ключевых кадров'''
+        for packet in packets:
+            if packet.is_keyframe:
+                # Время пакета берётся до записи: мультиплексор переводит его в шкалу контейнера
+                self.keyframes.append(float(packet.pts * packet.time_base))
+            self.output.mux(packet)
+
+    def close(self):
+        '''Закрытие файла; возвращает смещения ключевых кадров (секунды)'''
+        try:
+            self.mux(self.stream.encode(None))
+        finally:
+            self.output.close()
+        return self.keyframes
+
+
+class ConstantRateWriter:
+    '''Сегмент XVID AVI через OpenCV с постоянной частотой кадров (если PyAV не установлен).
+    Каждый кадр кодируется один раз: потерянные кадры не восполняются, поэтому при расхождении
+    длительности файла с временем захвата сегмент завершается'''
+
+    extension = 'avi'
+
+    def __init__(self, path, width, height, fps):
+        '''Открытие файла с частотой потока fps'''
+        self.path = path
+        self.fps = fps
+        self.frames = 0
+        self.out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
+
+    @property
+    def duration(self):
+        '''Длительность записанного (секунды)'''
+        return self.frames / self.fps
+
+    def write(self, frame, offset):
+        '''Запись кадра; False, если файл уже опережает время захвата кадра offset'''
+        if offset < self.duration - 0.5 / self.fps:
+            return False
+        self.out.write(frame)
+        self.frames += 1
+        return True
+
+    def close(self):
+        '''Закрытие файла; возвращает смещения ключевых кадров (секунды)'''
+        self.out.release()
+        try:
+            # Кодировщик сам выбирает ключевые кадры, их положение известно только из индекса закрытого файла
+            return read_avi_keyframes(self.path, self.fps)
+        except OSError as e:
+            logging.error(f"Ошибка чтения индекса {self.path}: {str(e)}")
+            return []
+
+
+class RecorderWorker(threading.Thread):
+    '''Поток записи видео, получающий кадры от потока захвата через ограниченную очередь'''
+
+    PRE_ROLL_JPEG_QUALITY = 90
+    '''Качество JPEG кадров в буфере предзаписи: несжатый кадр 1080p занимает около 6 МБ, сжатый — в 20–30 раз меньше'''
+    PRE_ROLL_MAX_BYTES = 256 * 1024 ** 2
+    '''Предельный объём сжатых кадров в буфере предзаписи (байты) на случай очень больших кадров или долгой предзаписи'''
+    MAX_FRAME_GAP = 2.0
+    '''Отставание записанного от времени захвата (секунды), после которого запись продолжается в новый сегмент'''
+    NOMINAL_FPS_TOLERANCE = 0.1
+    '''Допустимое отклонение измеренной частоты от заявленной потоком, при котором используется заявленная'''
+
+    def __init__(self, camera_id, max_queue_size=50, overflow_policy=OVERFLOW_DROP_OLDEST):
+        '''Инициализация потока записи'''
+        super().__init__(daemon=True)
+        if overflow_policy not in (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.camera_id = camera_id
+        self.frame_queue = queue.Queue(maxsize=max_queue_size)
+        self.overflow_policy = overflow_policy
+        self.running = False
+        self.out = None
+        self.start_time = None
+        self.segment_path = None
+        self.segment_fps = None
+        self.segment_size = None
+        self.segment_deadline = None
+        self.nominal_fps = None
+        self.frame_rate = FrameRateEstimator()
+        self.index = SegmentIndex(camera_id)
+        self.motion_gate = None
+        self.pre_roll = PreRollBuffer(max_bytes=self.PRE_ROLL_MAX_BYTES, item_size=lambda item: len(item[1]))
+
+        self.recording_settings = Database.get_recording_settings()
+        Database.subscribe('recording_settings', self.on_recording_settings_changed)
+
+        self.counters_lock = threading.Lock()
+        self.frames_enqueued = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.encode_timer = StageTimer()
+
+    def start(self):
+        '''Запуск потока записи'''
+        self.running = True
+        super().start()
+
+    def stop(self):
+        '''Остановка потока записи: дописывает оставшиеся в очереди кадры и закрывает файл'''
+        self.running = False
+        if self.is_alive():
+            self.join()
+        Database.unsubscribe('recording_settings', self.on_recording_settings_changed)
+
+    def on_recording_settings_changed(self, settings):
+        '''Получение новых настроек записи от хранилища настроек'''
+        self.recording_settings = settings
+
+    def is_enabled(self):
+        '''Проверка, должна ли сейчас вестись запись с перекодированием'''
+        settings = self.recording_settings
+        return settings is not None and bool(settings.enable_record) and settings.recording_mode == RECORDING_MODE_TRANSCODE
+
+    def enqueue(self, frame, timestamp=None):
+        '''Передача кадра на запись, вызывается из потока захвата; timestamp — время захвата (секунды Unix)'''
+        if not self.running or not self.is_enabled():
+            return False
+
+        if not self.put_item((time.time() if timestamp is None else timestamp, frame)):
+            return False
+
+        with self.counters_lock:
+            self.frames_enqueued += 1
+        return True
+
+    def set_nominal_fps(self, fps):
+        '''Частота кадров, заявленная потоком при подключении (None, если неизвестна); вызывается из потока захвата'''
+        self.nominal_fps = fps
+
+    def end_segment(self):
+        '''Завершение текущего сегмента после уже поставленных в очередь кадров (например, при разрыве связи)'''
+        if self.running:
+            self.put_item((time.time(), None))
+
+    def put_item(self, item):
+        '''Постановка элемента в очередь согласно политике переполнения; False, если поток записи остановлен'''
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            while self.running:
+                try:
+                    self.frame_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        else:
+            while True:
+                try:
+                    self.frame_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.frame_queue.get_nowait()
+                        with self.counters_lock:
+                            self.frames_dropped += 1
+                    except queue.Empty:
+                        pass
+            return True
+
+    def get_counters(self):
+        '''Получение счётчиков кадров: поставлено в очередь, записано, выброшено при переполнении,
+        пропущено из-за времени захвата не позже уже записанного'''
+        with self.counters_lock:
+            return {
+                'enqueued': self.frames_enqueued,
+                'written': self.frames_written,
+                'dropped': self.frames_dropped,
+                'skipped': self.frames_skipped,
+                'queued': self.frame_queue.qsize(),
+            }
+
+    def run(self):
+        '''Основной метод потока, записывающий кадры из очереди'''
+        try:
+            while self.running or not self.frame_queue.empty():
+                try:
+                    timestamp, frame = self.frame_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if not self.is_enabled():
+                        self.release()
+                        self.pre_roll.clear()
+                    elif self.segment_deadline is not None and time.time() >= self.segment_deadline:
+                        # Кадры не поступают, но сегмент закрывается вовремя
+                        self.release()
+                    continue
+                if frame is None:
+                    self.release()
+                    self.pre_roll.clear()
+                    continue
+                self.frame_rate.add(timestamp)
+                self.record_video(timestamp, frame)
+        finally:
+            self.release()
+
+    def record_video(self, timestamp, frame):
+        '''Запись кадра с учётом записи по движению: без движения кадры копятся в буфере предзаписи'''
+        try:
+            settings = self.recording_settings
+
+            if not self.is_enabled():
+                self.release()
+                self.pre_roll.clear()
+                return
+
+            if settings.motion_recording and self.motion_gate is not None and not self.motion_gate.is_active(settings.post_roll):
+                self.release()
+                if settings.pre_roll > 0:
+                    self.pre_roll.append((timestamp, self.compress_frame(frame)), timestamp, True, settings.pre_roll)
+                return
+
+            for frame_timestamp, encoded in self.pre_roll.drain():
+                buffered_frame = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+                if buffered_frame is not None:
+                    self.write_frame(frame_timestamp, buffered_frame)
+            self.write_frame(timestamp, frame)
+        except Exception as e:
+            logging.error(f"Ошибка записи видео: {str(e)}")
+
+    def compress_frame(self, frame):
+        '''Кадр BGR в JPEG для буфера предзаписи, чтобы предзапись в несколько секунд помещалась в памяти'''
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.PRE_ROLL_JPEG_QUALITY])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return encoded.tobytes()
+
+    def write_frame(self, timestamp, frame):
+        '''Запись кадра со временем захвата с переходом на новый файл по истечении длительности записи,
+        после перерыва или при смене разрешения'''
+        height, width = frame.shape[:2]
+        if self.out is not None and (timestamp >= self.segment_deadline or (width, height) != self.segment_size
+                                     or timestamp - self.start_time - self.out.duration > self.MAX_FRAME_GAP):
+            self.release()
+        if self.out is None:
+            self.open_segment(timestamp, width, height)
+
+        started = time.perf_counter()
+        written = self.out.write(frame, timestamp - self.start_time)
+        if not written:
+            with self.counters_lock:
+                self.frames_skipped += 1
+            return
+        self.encode_timer.add(time.perf_counter() - started)
+        if self.index.thumbnail_due(timestamp):
+            self.index.add_thumbnail(timestamp, frame)
+        with self.counters_lock:
+            self.frames_written += 1
+
+    def open_segment(self, timestamp, width, height):
+        '''Открытие нового файла с разрешением первого кадра и частотой потока; срок сегмента задаётся при открытии'''
+        settings = self.recording_settings
+        writer_class = TimestampWriter if av is not None else ConstantRateWriter
+        self.segment_path = new_segment_path(settings.destination, self.camera_id, writer_class.extension, timestamp)
+        self.segment_fps = self.stream_fps()
+        self.segment_size = (width, height)
+        self.out = writer_class(self.segment_path, width, height, self.segment_fps)
+        self.start_time = timestamp
+        self.segment_deadline = timestamp + 60 * settings.record_length
+        logging.info(f"Camera {self.camera_id} segment {os.path.basename(self.segment_path)}: "
+                     f"{width}x{height} @ {self.segment_fps:.2f} fps")
+
+    def stream_fps(self):
+        '''Частота кадров для нового сегмента: заявленная потоком, если фактическая с ней совпадает,
+        иначе фактическая (например, камера отдаёт меньше кадров под нагрузкой)'''
+        measured = self.frame_rate.fps()
+        if measured is None:
+            return self.nominal_fps or DEFAULT_FPS
+        if self.nominal_fps and abs(measured - self.nominal_fps) <= self.NOMINAL_FPS_TOLERANCE * self.nominal_fps:
+            return self.nominal_fps
+        return round(measured, 2)
+
+    def release(self):
+        '''Закрытие текущего файла записи и добавление его в индекс сегментов вместе с ключевыми кадрами и миниатюрами'''
+        if self.out is not None:
+            try:
+                for offset in self.out.close():
+                    self.index.add_keyframe(offset)
+            except Exception as e:
+                logging.error(f"Ошибка закрытия сегмента {self.segment_path}: {str(e)}")
+            end_time = self.start_time + self.out.duration
+            register_segment(self.camera_id, self.segment_path, self.start_time, end_time, self.index)
+            self.out = None
+            self.start_time = None
+            self.segment_path = None
+            self.segment_size = None
+            self.segment_deadline = None
+
+
+def segment_file_pattern(camera_id, extension, sequence=0):
+    '''Шаблон имени файла сегмента для strftime: камера, дата и время начала, номер сегмента внутри секунды'''
+    suffix = f'_{sequence}' if sequence else ''
+    return f'cam{camera_id}_%d.%m.%Y_%H.%M.%S{suffix}.{extension}'
+
+
+def new_segment_path(destination, camera_id, extension, start_time):
+    '''Путь файла нового сегмента. Сегмент, начатый в ту же секунду, что и предыдущий (движение снова началось,
+    камера переподключилась), получает номер, чтобы не перезаписать файл и запись индекса предыдущего'''
+    moment = datetime.datetime.fromtimestamp(start_time)
+    sequence = 0
+    while True:
+        path = os.path.join(destination, moment.strftime(segment_file_pattern(camera_id, extension, sequence)))
+        if not os.path.exists(path) and not Database.has_segment(path):
+            return path
+        sequence += 1
+
+
+def register_segment(camera_id, path, start_time, end_time, index=None):
+    '''Добавление закрытого сегмента в индекс для службы хранения и архива; start_time и end_time — время
+    первого кадра и конца последнего по времени захвата (секунды Unix), index — ключевые кадры и миниатюры'''
+    try:
+        Database.insert_segment(camera_id, path, start_time, end_time, os.path.getsize(path))
+    except Exception as e:
+        logging.error(f"Ошибка индексации сегмента {path}: {str(e)}")
+        if index is not None:
+            index.clear()
+        return
+    if index is not None:
+        index.save(path)
@@ -0,0 +1,312 @@
+import logging
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+try:
+    import av
+except ImportError:
+    av = None
+
+DEFAULT_RELAY_PORT = 8554
+'''Порт HTTP-ретранслятора по умолчанию'''
+DEFAULT_RELAY_HOST = '127.0.0.1'
+'''Адрес ретранслятора по умолчанию: ретрансляция не защищена паролем, поэтому доступна только с этого компьютера'''
+
+MJPEG_BOUNDARY = 'pydvrframe'
+'''Разделитель кадров в потоке multipart/x-mixed-replace'''
+
+
+class JpegPreview:
+    '''Общий для всех зрителей поток JPEG одной камеры: каждый кадр сжимается один раз,
+    и только пока есть хотя бы один зритель'''
+
+    PREVIEW_FPS = 5
+    '''Частота кадров предпросмотра'''
+    PREVIEW_WIDTH = 640
+    '''Ширина кадра предпросмотра (пиксели)'''
+    JPEG_QUALITY = 70
+
+    def __init__(self, preview_fps=PREVIEW_FPS):
+        '''Инициализация предпросмотра'''
+        self.min_interval = 1.0 / preview_fps
+        self.condition = threading.Condition()
+        self.viewers = 0
+        self.jpeg = None
+        self.seq = 0
+        self.last_encoded = 0.0
+        self.frames_encoded = 0
+        self.on_viewers_changed = None
+        '''Вызывается при подключении и отключении зрителей (вне блокировки)'''
+
+    def offer(self, frame):
+        '''Кадр BGR из потока захвата; сжимается, только если есть зрители и пришло время следующего кадра'''
+        now = time.monotonic()
+        if self.viewers == 0 or now - self.last_encoded < self.min_interval:
+            return False
+        self.last_encoded = now
+
+        h, w = frame.shape[:2]
+        if w > self.PREVIEW_WIDTH:
+            frame = cv2.resize(frame, (self.PREVIEW_WIDTH, max(1, h * self.PREVIEW_WIDTH // w)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.JPEG_QUALITY])
+        if not ok:
+            return False
+
+        with self.condition:
+            self.jpeg = encoded.tobytes()
+            self.seq += 1
+            self.frames_encoded += 1
+            self.condition.notify_all()
+        return True
+
+    def clear(self):
+        '''Сброс последнего кадра при потере связи'''
+        with self.condition:
+            self.jpeg = None
+
+    def add_viewer(self):
+        '''Регистрация зрителя'''
+        with self.condition:
+            self.viewers += 1
+        if self.on_viewers_changed is not None:
+            self.on_viewers_changed()
+
+    def remove_viewer(self):
+        '''Отключение зрителя'''
+        with self.condition:
+            self.viewers -= 1
+        if self.on_viewers_changed is not None:
+            self.on_viewers_changed()
+
+    def wait_frame(self, last_seq, timeout):
+        '''Ожидание кадра новее last_seq: (номер, JPEG) или (last_seq, None) по таймауту'''
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != last_seq and self.jpeg is not None, timeout)
+            if self.seq == last_seq or self.jpeg is None:
+                return last_seq, None
+            return self.seq, self.jpeg
+
+
+class RelayClient:
+    '''Очередь пакетов одного зрителя сжатого потока'''
+
+    def __init__(self, template, max_packets):
+        '''Инициализация очереди'''
+        self.template = template
+        self.packets = queue.Queue(maxsize=max_packets)
+        self.closed = False
+
+
+class PacketRelay:
+    '''Раздача сжатых пакетов, полученных одним подключением к камере, любому числу зрителей без перекодирования'''
+
+    CLIENT_QUEUE_SIZE = 300
+    '''Число пакетов, которое может отстать зритель, прежде чем он будет отключён'''
+
+    def __init__(self):
+        '''Инициализация ретранслятора'''
+        self.lock = threading.Lock()
+        self.clients = []
+        self.template = None
+        self.packets_relayed = 0
+
+    def set_stream(self, in_stream):
+        '''Новое подключение к камере: зрители старого потока отключаются, новые получат параметры нового'''
+        with self.lock:
+            self.template = in_stream
+            clients, self.clients = self.clients, []
+        for client in clients:
+            self.close_client(client)
+
+    def publish(self, packet):
+        '''Передача пакета из потока записи всем зрителям; без зрителей ничего не делает'''
+        if not self.clients:
+            return
+        item = (bytes(packet), packet.pts, packet.dts, packet.is_keyframe, packet.time_base)
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.packets.put_nowait(item)
+                except queue.Full:
+                    logging.warning("Зритель не успевает получать поток и будет отключён")
+                    self.clients.remove(client)
+                    client.closed = True
+            self.packets_relayed += 1
+
+    def subscribe(self):
+        '''Подключение зрителя; None, если поток камеры ещё не открыт'''
+        with self.lock:
+            if self.template is None:
+                return None
+            client = RelayClient(self.template, self.CLIENT_QUEUE_SIZE)
+            self.clients.append(client)
+            return client
+
+    def unsubscribe(self, client):
+        '''Отключение зрителя'''
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def close_client(self, client):
+        '''Завершение потока зрителя после уже полученных пакетов'''
+        client.closed = True
+        try:
+            client.packets.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+def relay_mpegts(client, output_file, timeout=10):
+    '''Перепаковка пакетов зрителя в MPEG-TS и запись в output_file, начиная с ключевого кадра'''
+    output = av.open(output_file, mode='w', format='mpegts')
+    try:
+        if hasattr(output, 'add_stream_from_template'):
+            out_stream = output.add_stream_from_template(client.template)
+        else:
+            out_stream = output.add_stream(template=client.template)
+
+        offset = None
+        while True:
+            try:
+                item = client.packets.get(timeout=timeout)
+            except queue.Empty:
+                if client.closed:
+                    return
+                continue
+            if item is None:
+                return
+
+            data, pts, dts, keyframe, time_base = item
+            if offset is None:
+                if not keyframe:
+                    continue
+                offset = min(pts, dts)
+
+            packet = av.Packet(data)
+            packet.pts = pts - offset
+            packet.dts = dts - offset
+            packet.time_base = time_base
+            packet.is_keyframe = keyframe
+            packet.stream = out_stream
+            output.mux(packet)
+    finally:
+        try:
+            output.close()
+        except Exception:
+            pass
+
+
+class RelayServer(threading.Thread):
+    '''HTTP-ретранслятор камер: сжатый поток MPEG-TS и общий предпросмотр MJPEG.
+    Зрители не открывают новых подключений к камере'''
+
+    ROUTE_RE = re.compile(r'^/cameras/(?P<camera_id>\d+)/(?P<resource>stream\.ts|preview\.mjpg|snapshot\.jpg)$')
+    FRAME_TIMEOUT = 10
+    '''Время ожидания кадра, после которого зритель отключается (секунды)'''
+
+    def __init__(self, get_pipeline, port=DEFAULT_RELAY_PORT, host=DEFAULT_RELAY_HOST):
+        '''Инициализация сервера; get_pipeline(camera_id) возвращает конвейер камеры или None'''
+        super().__init__(daemon=True)
+        self.get_pipeline = get_pipeline
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = server.ROUTE_RE.match(self.path.split('?')[0])
+                pipeline = server.get_pipeline(int(match.group('camera_id'))) if match else None
+                if pipeline is None:
+                    self.send_error(404)
+                    return
+
+                resource = match.group('resource')
+                try:
+                    if resource == 'stream.ts':
+                        server.serve_stream(self, pipeline.packet_relay)
+                    elif resource == 'preview.mjpg':
+                        server.serve_mjpeg(self, pipeline.preview)
+                    else:
+                        server.serve_snapshot(self, pipeline.preview)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                except Exception as e:
+                    logging.error(f"Ошибка ретрансляции {self.path}: {str(e)}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        '''Порт, на котором принимаются запросы'''
+        return self.httpd.server_address[1]
+
+    def serve_stream(self, handler, relay):
+        '''Сжатый поток камеры в MPEG-TS (доступен, пока запись ведётся без перекодирования)'''
+        client = relay.subscribe() if av is not None else None
+        if client is None:
+            handler.send_error(503, 'Stream is relayed only while recording without re-encoding')
+            return
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'video/mp2t')
+            handler.send_header('Cache-Control', 'no-cache')
+            handler.end_headers()
+            relay_mpegts(client, handler.wfile, self.FRAME_TIMEOUT)
+        finally:
+            relay.unsubscribe(client)
+
+    def serve_mjpeg(self, handler, preview):
+        '''Предпросмотр MJPEG: все зрители получают одни и те же сжатые кадры'''
+        preview.add_viewer()
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}')
+            handler.send_header('Cache-Control', 'no-cache')
+            handler.end_headers()
+            seq = preview.seq
+            while True:
+                seq, jpeg = preview.wait_frame(seq, self.FRAME_TIMEOUT)
+                if jpeg is None:
+                    return
+                handler.wfile.write(f'--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                                    f'Content-Length: {len(jpeg)}\r\n\r\n'.encode())
+                handler.wfile.write(jpeg)
+                handler.wfile.write(b'\r\n')
+        finally:
+            preview.remove_viewer()
+
+    def serve_snapshot(self, handler, preview):
+        '''Один кадр JPEG'''
+        preview.add_viewer()
+        try:
+            _, jpeg = preview.wait_frame(preview.seq, self.FRAME_TIMEOUT)
+        finally:
+            preview.remove_viewer()
+        if jpeg is None:
+            handler.send_error(503, 'No video')
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'image/jpeg')
+        handler.send_header('Content-Length', str(len(jpeg)))
+        handler.end_headers()
+        handler.wfile.write(jpeg)
+
+    def run(self):
+        '''Основной метод потока: обработка запросов'''
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def stop(self):
+        '''Остановка сервера'''
+        if self.is_alive():
+            self.httpd.shutdown()
+            self.join()
+        self.httpd.server_close()
@@ -0,0 +1,305 @@
+import datetime
+import logging
+import threading
+import time
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from database import Database
+from recorder import RECORDING_MODE_STREAM_COPY, new_segment_path, register_segment
+from motion import PreRollBuffer
+from reconnect import Backoff, STATE_CONNECTING, STATE_STREAMING, STATE_BACKOFF
+from metrics import StageTimer
+from thumbnails import SegmentIndex, decode_keyframe
+from capture import DEFAULT_CAPTURE_OPTIONS, ffmpeg_options
+
+STREAM_COPY_CONTAINERS = ('mp4', 'mkv')
+'''Поддерживаемые контейнеры для записи без перекодирования'''
+STREAM_COPY_AVAILABLE = av is not None
+'''Доступна ли запись без перекодирования (установлен PyAV)'''
+
+
+class PacketDecoder:
+    '''Декодирование пакетов, уже полученных для записи, в кадры BGR: просмотр, предпросмотр зрителям
+    и детектор движения не открывают второго подключения к камере'''
+
+    def __init__(self, in_stream):
+        '''Декодер входного потока (сам он при записи без перекодирования не используется)'''
+        self.codec = in_stream.codec_context
+        self.codec.thread_type = 'AUTO'
+        self.keyframe_seen = False
+
+    def decode(self, packet):
+        '''Кадры BGR из пакета; до первого ключевого кадра пакеты пропускаются'''
+        if not self.keyframe_seen:
+            if not packet.is_keyframe:
+                return []
+            self.keyframe_seen = True
+        return [frame.to_ndarray(format='bgr24') for frame in self.codec.decode(packet)]
+
+    def reset(self):
+        '''Пропуск пакетов до следующего ключевого кадра (после паузы в декодировании или ошибки)'''
+        self.keyframe_seen = False
+
+
+class StreamCopyRecorder(threading.Thread):
+    '''Поток записи без перекодирования: копирует пакеты H.264/H.265 камеры в сегменты MP4/MKV'''
+
+    BACKOFF_BASE = 1
+    '''Начальная пауза перед повторным подключением к камере (секунды)'''
+    BACKOFF_MAX = 60
+    '''Максимальная пауза перед повторным подключением к камере (секунды)'''
+    IDLE_DELAY = 0.5
+    '''Пауза между проверками настроек, пока запись выключена (секунды)'''
+
+    def __init__(self, camera_id, options=DEFAULT_CAPTURE_OPTIONS):
+        '''Инициализация потока записи без перекодирования; options — параметры подключения камеры'''
+        super().__init__(daemon=True)
+        self.camera_id = camera_id
+        self.options = options
+        self.running = False
+        self.stop_event = threading.Event()
+        self.backoff = Backoff(self.BACKOFF_BASE, self.BACKOFF_MAX)
+        self.url = None
+        self.input = None
+        self.output = None
+        self.out_stream = None
+        self.segment_start = None
+        self.segment_offset = None
+        self.segment_end = None
+        self.segment_path = None
+        self.motion_gate = None
+        self.relay = None
+        self.frame_sink = None
+        '''Получатель декодированных кадров: frames_needed(), offer_frame(frame) и clear_frames()'''
+        self.on_state_changed = None
+        '''Вызывается как on_state_changed(state, message), если состояние камеры показывает эта запись'''
+        self.pre_roll = PreRollBuffer()
+        self.index = SegmentIndex(camera_id)
+
+        self.recording_settings = Database.get_recording_settings()
+        Database.subscribe('recording_settings', self.on_recording_settings_changed)
+
+        self.counters_lock = threading.Lock()
+        self.packets_written = 0
+        self.segments_written = 0
+        self.mux_timer = StageTimer()
+
+    def start(self):
+        '''Запуск потока записи'''
+        self.running = True
+        super().start()
+
+    def stop(self):
+        '''Остановка потока записи и закрытие текущего сегмента'''
+        self.running = False
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        Database.unsubscribe('recording_settings', self.on_recording_settings_changed)
+
+    def set_state(self, state, message=""):
+        '''Уведомление о состоянии подключения'''
+        if self.on_state_changed is not None:
+            self.on_state_changed(state, message)
+
+    def set_url(self, url):
+        '''Смена адреса потока, из которого ведётся запись'''
+        self.url = url
+
+    def on_recording_settings_changed(self, settings):
+        '''Получение новых настроек записи от хранилища настроек'''
+        self.recording_settings = settings
+
+    def is_enabled(self):
+        '''Проверка, должна ли сейчас вестись запись без перекодирования'''
+        settings = self.recording_settings
+        return (self.url is not None and settings is not None and bool(settings.enable_record)
+                and settings.recording_mode == RECORDING_MODE_STREAM_COPY)
+
+    def get_counters(self):
+        '''Получение счётчиков: записано пакетов и сегментов'''
+        with self.counters_lock:
+            return {'packets_written': self.packets_written, 'segments_written': self.segments_written}
+
+    def run(self):
+        '''Основной метод потока: подключение к камере и копирование пакетов с повторными попытками'''
+        try:
+            while self.running:
+                if not self.is_enabled():
+                    self.backoff.reset()
+                    self.stop_event.wait(self.IDLE_DELAY)
+                    continue
+
+                if av is None:
+                    logging.error("Запись без перекодирования требует пакет PyAV (pip install av)")
+                    self.stop_event.wait(self.BACKOFF_MAX)
+                    continue
+
+                url = self.url
+                try:
+                    self.set_state(STATE_CONNECTING, "Подключение...")
+                    self.copy_stream(url)
+                    if not (self.running and self.is_enabled() and self.url == url):
+                        continue
+                    logging.warning("Поток камеры для записи завершился")
+                except Exception as e:
+                    logging.error(f"Ошибка записи без перекодирования: {str(e)}")
+                    self.close_input()
+
+                delay = self.backoff.next_delay()
+                logging.warning(f"Повторное подключение потока записи через {delay:.1f} с...")
+                self.set_state(STATE_BACKOFF, f"Нет сигнала, повтор через {delay:.0f} с")
+                self.stop_event.wait(delay)
+        finally:
+            self.close_input()
+
+    def copy_stream(self, url):
+        '''Копирование пакетов видеопотока в сегменты, пока запись включена и адрес не изменился'''
+        # Для записи задержка не важна, поэтому буферизация демультиплексора не отключается
+        self.input = av.open(url, options=ffmpeg_options(self.options, low_latency=False),
+                             timeout=(self.options.open_timeout, self.options.read_timeout))
+        in_stream = self.input.streams.video[0]
+        self.backoff.reset()
+        self.set_state(STATE_STREAMING)
+        if self.relay is not None:
+            self.relay.set_stream(in_stream)
+        decoder = PacketDecoder(in_stream) if self.frame_sink is not None else None
+
+        for packet in self.input.demux(in_stream):
+            if not self.running or not self.is_enabled() or self.url != url:
+                break
+            if packet.dts is None or packet.pts is None:
+                continue
+            if decoder is not None:
+                # До записи: при записи у пакета меняются время и поток
+                self.decode_frames(decoder, packet)
+            if self.relay is not None:
+                # Зрители получают поток независимо от записи по движению
+                self.relay.publish(packet)
+
+            settings = self.recording_settings
+            packet_time = float(packet.pts * packet.time_base)
+            if settings.motion_recording and self.motion_gate is not None and not self.motion_gate.is_active(settings.post_roll):
+                # Движения нет: сегмент закрывается, пакеты копятся в буфере предзаписи
+                self.close_segment()
+                self.pre_roll.append(packet, packet_time, packet.is_keyframe, settings.pre_roll)
+                continue
+
+            packets = self.pre_roll.drain()
+            packets.append(packet)
+            for buffered in packets:
+                self.write_packet(in_stream, buffered, packet_time)
+
+        self.close_input()
+
+    def decode_frames(self, decoder, packet):
+        '''Декодирование пакета, только пока кадры кому-то нужны'''
+        if not self.frame_sink.frames_needed():
+            decoder.reset()
+            return
+        try:
+            for frame in decoder.decode(packet):
+                self.frame_sink.offer_frame(frame)
+        except Exception as e:
+            logging.debug(f"Ошибка декодирования кадра для просмотра: {str(e)}")
+            decoder.reset()
+
+    def write_packet(self, in_stream, packet, latest_time):
+        '''Запись пакета в текущий сегмент; latest_time — время последнего полученного пакета в потоке'''
+        if packet.is_keyframe and self.segment_expired(packet):
+            # Пакеты из буфера предзаписи старше текущего момента на разницу времён в потоке
+            delay = latest_time - float(packet.pts * packet.time_base)
+            self.open_segment(in_stream, packet, time.time() - delay)
+        if self.output is None:
+            # Сегмент может начинаться только с ключевого кадра
+            return
+        if packet.is_keyframe:
+            self.index_keyframe(in_stream, packet)
+
+        packet.pts -= self.segment_offset
+        packet.dts -= self.segment_offset
+        # Конец сегмента — по времени последнего пакета в потоке, а не по времени закрытия файла
+        packet_end = float((packet.pts + (packet.duration or 0)) * packet.time_base)
+        self.segment_end = max(self.segment_end, packet_end)
+        packet.stream = self.out_stream
+        started = time.perf_counter()
+        self.output.mux(packet)
+        self.mux_timer.add(time.perf_counter() - started)
+        with self.counters_lock:
+            self.packets_written += 1
+
+    def index_keyframe(self, in_stream, packet):
+        '''Учёт ключевого кадра в таблице сегмента; раз в интервал он декодируется для миниатюры'''
+        offset = float((packet.pts - self.segment_offset) * packet.time_base)
+        self.index.add_keyframe(offset)
+        timestamp = self.segment_start.timestamp() + offset
+        if not self.index.thumbnail_due(timestamp):
+            return
+        frame = None
+        try:
+            frame = decode_keyframe(in_stream, packet)
+        except Exception as e:
+            logging.warning(f"Не удалось декодировать кадр для миниатюры: {str(e)}")
+        self.index.add_thumbnail(timestamp, frame)
+
+    def segment_expired(self, packet):
+        '''Проверка, пора ли начинать новый сегмент (проверяется только на ключевых кадрах)'''
+        if self.output is None:
+            return True
+        elapsed = float((packet.pts - self.segment_offset) * packet.time_base)
+        return elapsed >= 60 * self.recording_settings.record_length
+
+    def open_segment(self, in_stream, packet, start_time):
+        '''Закрытие текущего сегмента и открытие нового, начинающегося с ключевого кадра (start_time — секунды Unix)'''
+        self.close_segment()
+
+        settings = self.recording_settings
+        container = settings.container if settings.container in STREAM_COPY_CONTAINERS else STREAM_COPY_CONTAINERS[0]
+        current_time = datetime.datetime.fromtimestamp(start_time)
+
+        self.segment_path = new_segment_path(settings.destination, self.camera_id, container, start_time)
+        self.output = av.open(self.segment_path, mode='w')
+        if hasattr(self.output, 'add_stream_from_template'):
+            self.out_stream = self.output.add_stream_from_template(in_stream)
+        else:
+            self.out_stream = self.output.add_stream(template=in_stream)
+        self.segment_start = current_time
+        self.segment_offset = min(packet.pts, packet.dts)
+        self.segment_end = 0.0
+
+    def close_segment(self):
+        '''Закрытие текущего сегмента и добавление его в индекс сегментов'''
+        if self.output is not None:
+            try:
+                self.output.close()
+            except Exception as e:
+                logging.error(f"Ошибка закрытия сегмента: {str(e)}")
+            start_time = self.segment_start.timestamp()
+            register_segment(self.camera_id, self.segment_path, start_time, start_time + self.segment_end, self.index)
+            self.output = None
+            self.out_stream = None
+            self.segment_start = None
+            self.segment_offset = None
+            self.segment_end = None
+            self.segment_path = None
+            with self.counters_lock:
+                self.segments_written += 1
+
+    def close_input(self):
+        '''Закрытие сегмента и входного потока'''
+        self.close_segment()
+        self.pre_roll.clear()
+        if self.relay is not None:
+            self.relay.set_stream(None)
+        if self.frame_sink is not None:
+            self.frame_sink.clear_frames()
+        if self.input is not None:
+            try:
+                self.input.close()
+            except Exception as e:
+                logging.error(f"Ошибка закрытия потока камеры: {str(e)}")
+            self.input = None
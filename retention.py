@@ -0,0 +1,167 @@
+import datetime
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from database import Database
+from metrics import StageTimer
+
+GIGABYTE = 1024 ** 3
+
+SEGMENT_FILE_RE = re.compile(r'^(?:cam(?P<camera_id>\d+)_)?(?P<timestamp>\d{2}\.\d{2}\.\d{4}_\d{2}\.\d{2}\.\d{2})(?:_\d+)?\.(?:avi|mp4|mkv)$')
+'''Имя файла сегмента: необязательный префикс камеры, дата/время начала записи и номер сегмента внутри секунды'''
+
+
+class RetentionService(threading.Thread):
+    '''Фоновая служба удаления старых записей по индексу сегментов'''
+
+    INTERVAL = 60
+    '''Период проверки (секунды)'''
+    BATCH_SIZE = 100
+    '''Число сегментов, удаляемых за один запрос к индексу'''
+    ACTIVE_FILE_AGE = 120
+    '''Файл, изменённый позже этого срока (секунды), может ещё записываться и не индексируется при обходе'''
+
+    def __init__(self, interval=INTERVAL):
+        '''Инициализация службы'''
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.indexed_destination = None
+        self.indexed_until = None
+
+        self.recording_settings = Database.get_recording_settings()
+        Database.subscribe('recording_settings', self.on_recording_settings_changed)
+
+        self.counters_lock = threading.Lock()
+        self.segments_deleted = 0
+        self.bytes_deleted = 0
+        self.pass_timer = StageTimer()
+
+    def stop(self):
+        '''Остановка службы'''
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        Database.unsubscribe('recording_settings', self.on_recording_settings_changed)
+
+    def on_recording_settings_changed(self, settings):
+        '''Получение новых настроек записи от хранилища настроек'''
+        self.recording_settings = settings
+
+    def get_counters(self):
+        '''Получение счётчиков удалённых сегментов и байт'''
+        with self.counters_lock:
+            return {'segments_deleted': self.segments_deleted, 'bytes_deleted': self.bytes_deleted}
+
+    def run(self):
+        '''Основной метод потока: периодическое применение правил хранения'''
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                self.apply_retention()
+            except Exception as e:
+                logging.error(f"Ошибка удаления старых видео: {str(e)}")
+            self.pass_timer.add(time.perf_counter() - started)
+            self.stop_event.wait(self.interval)
+
+    def apply_retention(self):
+        '''Удаление сегментов по сроку хранения, объёму записей и свободному месту'''
+        settings = self.recording_settings
+        if settings is None:
+            return
+
+        if self.indexed_destination != settings.destination:
+            self.indexed_destination = settings.destination
+            self.indexed_until = None
+        # Каждый проход добавляет файлы, изменённые после прошлого обхода: сегмент, оставшийся от упавшего
+        # процесса камеры, не регистрируется записью и иначе никогда не попал бы в индекс
+        scan_until = time.time() - self.ACTIVE_FILE_AGE
+        index_existing_segments(settings.destination, self.indexed_until, scan_until)
+        self.indexed_until = scan_until
+
+        if settings.auto_delete:
+            threshold = time.time() - settings.auto_delete_days * 86400
+            self.delete_while(lambda: Database.get_segments_ended_before(threshold, self.BATCH_SIZE))
+
+        if settings.max_storage_gb > 0:
+            def over_quota():
+                excess = Database.get_segments_total_size() - settings.max_storage_gb * GIGABYTE
+                if excess <= 0:
+                    return []
+                segments = Database.get_oldest_segments(self.BATCH_SIZE)
+                # Удаляем только столько старых сегментов, сколько нужно, чтобы уложиться в квоту
+                selected = []
+                for segment in segments:
+                    if excess <= 0:
+                        break
+                    selected.append(segment)
+                    excess -= segment.size
+                return selected
+
+            self.delete_while(over_quota)
+
+        if settings.min_free_gb > 0 and os.path.isdir(settings.destination):
+            def low_on_space():
+                if shutil.disk_usage(settings.destination).free >= settings.min_free_gb * GIGABYTE:
+                    return []
+                return Database.get_oldest_segments(1)
+
+            self.delete_while(low_on_space)
+
+    def delete_while(self, select_segments):
+        '''Удаление сегментов, пока select_segments возвращает непустой список'''
+        while not self.stop_event.is_set():
+            segments = select_segments()
+            if not segments or not self.delete_segments(segments):
+                return
+
+    def delete_segments(self, segments):
+        '''Удаление файлов сегментов и их записей в индексе, возвращает идентификаторы удалённых'''
+        deleted = []
+        deleted_bytes = 0
+        for segment in segments:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Ошибка удаления {segment.path}: {str(e)}")
+                continue
+            deleted.append(segment.id)
+            deleted_bytes += segment.size
+
+        Database.delete_segments(deleted)
+        with self.counters_lock:
+            self.segments_deleted += len(deleted)
+            self.bytes_deleted += deleted_bytes
+        return deleted
+
+
+def index_existing_segments(folder, modified_after=None, modified_before=None):
+    '''Добавление в индекс файлов записей, которых в нём нет: созданных до появления индекса или оставшихся
+    от упавшего процесса камеры. Учитываются только файлы со временем изменения в [modified_after, modified_before)'''
+    try:
+        segments = []
+        for entry in os.scandir(folder):
+            match = SEGMENT_FILE_RE.match(entry.name)
+            if match is None:
+                continue
+
+            stat = entry.stat()
+            if modified_after is not None and stat.st_mtime < modified_after:
+                continue
+            if modified_before is not None and stat.st_mtime >= modified_before:
+                continue
+            start_time = datetime.datetime.strptime(match.group('timestamp'), '%d.%m.%Y_%H.%M.%S').timestamp()
+            camera_id = int(match.group('camera_id')) if match.group('camera_id') else None
+            segments.append((camera_id, entry.path, start_time, max(start_time, stat.st_mtime), stat.st_size))
+
+        Database.index_segments(segments)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Ошибка индексации записей: {str(e)}")
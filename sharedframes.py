@@ -0,0 +1,166 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from display import FrameMailbox
+
+HEADER_FIELDS = 4
+'''Заголовок кольца: номер последнего кадра, ширина и высота области просмотра, резерв'''
+SLOT_FIELDS = 4
+'''Заголовок ячейки: номер кадра в ячейке (-1 — идёт запись), высота, ширина, число каналов'''
+
+
+class SharedFrameRing:
+    '''Кольцевой буфер кадров просмотра в разделяемой памяти: процесс камеры пишет, процесс интерфейса читает.
+    Кадры копируются в память напрямую, без сериализации'''
+
+    SLOTS = 3
+    '''Число ячеек: читатель копирует одну, пока писатель заполняет другие'''
+    MAX_WIDTH = 1920
+    '''Максимальная ширина кадра просмотра (пиксели)'''
+    MAX_HEIGHT = 1080
+    '''Максимальная высота кадра просмотра (пиксели)'''
+    CHANNELS = 3
+
+    def __init__(self, name=None, slots=SLOTS):
+        '''Создание нового буфера (name=None) или подключение к существующему по имени'''
+        self.slots = slots
+        self.frame_bytes = self.MAX_WIDTH * self.MAX_HEIGHT * self.CHANNELS
+        header_bytes = 8 * (HEADER_FIELDS + slots * SLOT_FIELDS)
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * self.frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        self.slot_headers = np.ndarray((slots, SLOT_FIELDS), dtype=np.int64, buffer=buf, offset=8 * HEADER_FIELDS)
+        self.data = np.ndarray((slots, self.frame_bytes), dtype=np.uint8, buffer=buf, offset=header_bytes)
+
+        if self.owner:
+            self.header[:] = 0
+            self.slot_headers[:] = 0
+
+    @property
+    def name(self):
+        '''Имя разделяемой памяти для подключения из другого процесса'''
+        return self.shm.name
+
+    def set_target_size(self, width, height):
+        '''Размер области просмотра, под который процесс камеры готовит кадры'''
+        self.header[1] = max(1, min(width, self.MAX_WIDTH))
+        self.header[2] = max(1, min(height, self.MAX_HEIGHT))
+
+    def get_target_size(self):
+        '''Текущий размер области просмотра или None, если он ещё не задан'''
+        width, height = int(self.header[1]), int(self.header[2])
+        if width <= 0 or height <= 0:
+            return None
+        return width, height
+
+    def write(self, frame):
+        '''Запись кадра в следующую ячейку'''
+        h, w = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        size = h * w * channels
+        if size > self.frame_bytes:
+            raise ValueError(f"Frame {w}x{h} does not fit into the shared ring")
+
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+        meta = self.slot_headers[slot]
+        # Номер -1 на время записи не даёт читателю взять наполовину записанный кадр
+        meta[0] = -1
+        self.data[slot, :size] = frame.reshape(-1)
+        meta[1], meta[2], meta[3] = h, w, channels
+        meta[0] = seq
+        self.header[0] = seq
+
+    def read(self, last_seq):
+        '''Копия последнего кадра и его номер, если он новее last_seq, иначе (None, last_seq)'''
+        seq = int(self.header[0])
+        if seq == last_seq or seq == 0:
+            return None, last_seq
+
+        meta = self.slot_headers[seq % self.slots]
+        if meta[0] != seq:
+            return None, last_seq
+        h, w, channels = int(meta[1]), int(meta[2]), int(meta[3])
+        frame = self.data[seq % self.slots, :h * w * channels].copy().reshape(h, w, channels)
+        if meta[0] != seq:
+            # Писатель успел обогнать читателя на целое кольцо — кадр испорчен
+            return None, last_seq
+        return frame, seq
+
+    def latest_seq(self):
+        '''Номер последнего записанного кадра'''
+        return int(self.header[0])
+
+    def close(self):
+        '''Отключение от буфера; создатель буфера также удаляет его'''
+        self.header = self.slot_headers = self.data = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedFrameMailbox(FrameMailbox):
+    '''Ячейка просмотра процесса камеры: готовые кадры RGB отправляются в разделяемое кольцо'''
+
+    def __init__(self, ring, display_fps=15):
+        '''Инициализация ячейки поверх кольца'''
+        self.ring = ring
+        super().__init__(display_fps)
+
+    @property
+    def target_size(self):
+        '''Размер области просмотра, заданный процессом интерфейса'''
+        return self.ring.get_target_size() or (640, 360)
+
+    @target_size.setter
+    def target_size(self, size):
+        # Размер задаёт только процесс интерфейса, иначе перезапущенный процесс камеры сбросил бы его
+        pass
+
+    def put(self, frame):
+        '''Запись готового кадра RGB в кольцо'''
+        self.ring.write(frame)
+        with self.lock:
+            self.frames_put += 1
+
+
+class SharedFrameReader:
+    '''Чтение кадров просмотра из разделяемого кольца в процессе интерфейса (интерфейс FrameMailbox)'''
+
+    def __init__(self, ring):
+        '''Инициализация читателя'''
+        self.ring = ring
+        self.last_seq = 0
+        self.frames_taken = 0
+        self.frames_missed = 0
+
+    def set_target_size(self, width, height):
+        '''Размер области просмотра для процесса камеры'''
+        self.ring.set_target_size(width, height)
+
+    def take(self):
+        '''Получение последнего кадра или None, если нового кадра нет'''
+        previous = self.last_seq
+        frame, self.last_seq = self.ring.read(self.last_seq)
+        if frame is not None:
+            self.frames_taken += 1
+            self.frames_missed += max(0, self.last_seq - previous - 1)
+        return frame
+
+    def clear(self):
+        '''Пропуск непрочитанного кадра'''
+        self.last_seq = self.ring.latest_seq()
+
+    def get_counters(self):
+        '''Получение счётчиков: показано кадров и пропущено кадров, заменённых более новыми'''
+        return {'taken': self.frames_taken, 'missed': self.frames_missed}
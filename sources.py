@@ -0,0 +1,138 @@
+import time
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import cv2
+import numpy as np
+
+SYNTHETIC_SCHEME = 'synthetic'
+'''Синтетический поток: synthetic://1280x720@25'''
+FILE_SCHEME = 'file'
+'''Воспроизведение файла с частотой кадров файла: file:///path/video.mp4'''
+
+
+class FrameSource:
+    '''Источник кадров с интерфейсом cv2.VideoCapture (isOpened, read, release) для потока захвата'''
+
+    def __init__(self, fps, realtime=True):
+        '''Инициализация; realtime выдаёт кадры с частотой fps, иначе так быстро, как их забирают'''
+        self.fps = fps
+        self.realtime = realtime
+        self.next_time = None
+        self.opened = True
+
+    def isOpened(self):
+        '''Открыт ли источник'''
+        return self.opened
+
+    def read(self):
+        '''Следующий кадр: (True, кадр) или (False, None), если кадров больше нет'''
+        if not self.opened:
+            return False, None
+        if self.realtime and self.fps > 0:
+            self.wait_next_frame()
+        frame = self.next_frame()
+        return frame is not None, frame
+
+    def wait_next_frame(self):
+        '''Ожидание момента следующего кадра, как у живой камеры'''
+        now = time.monotonic()
+        if self.next_time is None or now - self.next_time > 1.0:
+            # После долгой задержки не выдаём накопившиеся кадры пачкой
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += 1.0 / self.fps
+
+    def next_frame(self):
+        '''Получение следующего кадра BGR или None'''
+        raise NotImplementedError
+
+    def get(self, prop):
+        '''Свойства источника в терминах cv2.CAP_PROP_*'''
+        return 0.0
+
+    def release(self):
+        '''Закрытие источника'''
+        self.opened = False
+
+
+class SyntheticSource(FrameSource):
+    '''Генератор кадров заданного размера: неподвижный шумовой фон и движущийся прямоугольник'''
+
+    def __init__(self, width, height, fps, realtime=True):
+        '''Инициализация генератора'''
+        super().__init__(fps, realtime)
+        self.width = width
+        self.height = height
+        self.index = 0
+        rng = np.random.default_rng(0)
+        self.background = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+
+    def next_frame(self):
+        '''Фон с прямоугольником, смещающимся на каждом кадре'''
+        frame = self.background.copy()
+        size = max(8, min(self.width, self.height) // 6)
+        x = (self.index * 8) % max(1, self.width - size)
+        y = (self.index * 4) % max(1, self.height - size)
+        frame[y:y + size, x:x + size] = (0, 200, 255)
+        self.index += 1
+        return frame
+
+    def get(self, prop):
+        '''Размер и частота кадров генератора'''
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: self.fps}.get(prop, 0.0)
+
+
+class FileSource(FrameSource):
+    '''Воспроизведение видеофайла как потока камеры, по умолчанию по кругу'''
+
+    def __init__(self, path, fps=None, loop=True, realtime=True):
+        '''Открытие файла; без fps используется частота кадров файла'''
+        self.capture = cv2.VideoCapture(path)
+        super().__init__(fps or self.capture.get(cv2.CAP_PROP_FPS) or 25, realtime)
+        self.loop = loop
+        self.opened = self.capture.isOpened()
+
+    def next_frame(self):
+        '''Следующий кадр файла; в конце файла воспроизведение начинается сначала'''
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def get(self, prop):
+        '''Свойства файла'''
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.capture.get(prop)
+
+    def release(self):
+        '''Закрытие файла'''
+        super().release()
+        self.capture.release()
+
+
+def open_source(url):
+    '''Открытие синтетического или файлового источника по адресу; для остальных адресов None.
+    Параметры: ?realtime=0 — без ограничения частоты, ?loop=0 — файл без повтора, ?fps=N — своя частота'''
+    parts = urlsplit(url)
+    if parts.scheme not in (SYNTHETIC_SCHEME, FILE_SCHEME):
+        return None
+
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    realtime = query.get('realtime', '1') != '0'
+    fps = float(query['fps']) if 'fps' in query else None
+
+    if parts.scheme == SYNTHETIC_SCHEME:
+        # synthetic://ШИРИНАxВЫСОТА@FPS
+        size, _, rate = parts.netloc.partition('@')
+        width, _, height = size.partition('x')
+        return SyntheticSource(int(width or 1280), int(height or 720), fps or float(rate or 25), realtime)
+
+    path = unquote(parts.netloc + parts.path)
+    if len(path) > 2 and path[0] == '/' and path[2] == ':':
+        # file:///C:/video.mp4 на Windows
+        path = path[1:]
+    return FileSource(path, fps, query.get('loop', '1') != '0', realtime)
@@ -0,0 +1,142 @@
+import bisect
+import logging
+import os
+import struct
+from array import array
+
+import cv2
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from database import Database
+
+THUMBNAIL_INTERVAL = 10
+'''Период миниатюр шкалы времени (секунды записи)'''
+THUMBNAIL_WIDTH = 160
+'''Ширина миниатюры (пиксели)'''
+THUMBNAIL_QUALITY = 60
+'''Качество JPEG миниатюр'''
+
+AVIIF_KEYFRAME = 0x10
+'''Флаг ключевого кадра в индексе idx1 файла AVI'''
+
+
+class SegmentIndex:
+    '''Ключевые кадры и миниатюры записываемого сегмента; сохраняются в базу данных вместе с сегментом'''
+
+    def __init__(self, camera_id, interval=THUMBNAIL_INTERVAL):
+        '''Инициализация индекса сегмента'''
+        self.camera_id = camera_id
+        self.interval = interval
+        self.keyframes = []
+        self.thumbnails = []
+        self.last_thumbnail = None
+
+    def add_keyframe(self, offset):
+        '''Ключевой кадр на смещении offset от начала файла (секунды)'''
+        self.keyframes.append(offset)
+
+    def thumbnail_due(self, timestamp):
+        '''Пора ли сохранять следующую миниатюру (timestamp — секунды Unix)'''
+        return self.last_thumbnail is None or timestamp - self.last_thumbnail >= self.interval
+
+    def add_thumbnail(self, timestamp, frame):
+        '''Уменьшение кадра BGR и сохранение миниатюры в JPEG; при frame=None следующая попытка через интервал'''
+        self.last_thumbnail = timestamp
+        if frame is None:
+            return
+        try:
+            self.thumbnails.append((timestamp, encode_thumbnail(frame)))
+        except Exception as e:
+            logging.error(f"Ошибка создания миниатюры: {str(e)}")
+
+    def save(self, path):
+        '''Запись индекса закрытого сегмента в базу данных и очистка'''
+        try:
+            Database.insert_segment_index(self.camera_id, path, pack_offsets(self.keyframes), self.thumbnails)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения миниатюр сегмента {path}: {str(e)}")
+        self.clear()
+
+    def clear(self):
+        '''Сброс индекса перед новым сегментом'''
+        self.keyframes = []
+        self.thumbnails = []
+        self.last_thumbnail = None
+
+
+def encode_thumbnail(frame):
+    '''Миниатюра кадра BGR в JPEG шириной THUMBNAIL_WIDTH'''
+    h, w = frame.shape[:2]
+    if w > THUMBNAIL_WIDTH:
+        frame = cv2.resize(frame, (THUMBNAIL_WIDTH, max(1, h * THUMBNAIL_WIDTH // w)), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return encoded.tobytes()
+
+
+def decode_keyframe(in_stream, packet):
+    '''Декодирование одного ключевого кадра потока без перекодирования в кадр BGR; None, если не удалось.
+    Используется отдельный декодер, чтобы не хранить состояние между редкими миниатюрами'''
+    codec = in_stream.codec_context
+    decoder = av.CodecContext.create(codec.name, 'r')
+    if codec.extradata:
+        decoder.extradata = codec.extradata
+    frames = decoder.decode(av.Packet(bytes(packet))) + decoder.decode(None)
+    if not frames:
+        return None
+    return frames[0].to_ndarray(format='bgr24')
+
+
+def read_avi_keyframes(path, fps):
+    '''Смещения ключевых кадров (секунды) из индекса idx1 файла AVI без чтения видеоданных; [] без индекса'''
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'AVI ':
+            return []
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return []
+            chunk_id, size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'idx1':
+                data = f.read(size)
+                break
+            # Блоки выровнены по двум байтам
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+    offsets = []
+    frame_index = 0
+    for chunk_id, flags, _, _ in struct.iter_unpack('<4sIII', data[:len(data) // 16 * 16]):
+        # Видеокадры первого потока: 00dc (сжатые) или 00db (несжатые)
+        if chunk_id[:2] != b'00' or chunk_id[2:] not in (b'dc', b'db'):
+            continue
+        if flags & AVIIF_KEYFRAME:
+            offsets.append(frame_index / fps)
+        frame_index += 1
+    return offsets
+
+
+def pack_offsets(offsets):
+    '''Компактное представление таблицы ключевых кадров для базы данных'''
+    return array('d', offsets).tobytes()
+
+
+def unpack_offsets(data):
+    '''Таблица ключевых кадров из базы данных'''
+    offsets = array('d')
+    if data:
+        offsets.frombytes(data)
+    return list(offsets)
+
+
+def find_keyframe(offsets, offset):
+    '''Смещение последнего ключевого кадра не позже offset; offset, если таблица пуста'''
+    if not offsets:
+        return offset
+    index = bisect.bisect_right(offsets, offset)
+    return offsets[index - 1] if index > 0 else 0.0
@@ -0,0 +1,97 @@
+import time
+from PyQt5.QtWidgets import QLabel, QSizePolicy
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor
+from PyQt5.QtCore import Qt
+from reconnect import STATE_STREAMING
+
+def show_rgb_frame(label, frame, overlay_text=None):
+    '''Отображение готового кадра RGB на виджете; overlay_text выводится поверх кадра'''
+    h, w, ch = frame.shape
+
+    bytes_per_line = ch * w
+
+    img = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
+
+    pixmap = QPixmap.fromImage(img)
+
+    if overlay_text:
+        painter = QPainter(pixmap)
+        painter.setPen(QColor(255, 255, 0))
+        painter.drawText(8, 20, overlay_text)
+        painter.end()
+
+    label.setPixmap(pixmap)
+
+class VideoTile(QLabel):
+    '''Плитка сетки просмотра с видео одной камеры'''
+
+    STATS_INTERVAL = 1.0
+    '''Период обновления статистики на экране (секунды)'''
+
+    def __init__(self, camera, mailbox=None, get_metrics=None, parent=None):
+        '''Инициализация плитки; get_metrics возвращает метрики конвейера камеры для статистики на экране.
+        Без mailbox плитка показывает заглушку, пока конвейер камеры не запущен (см. attach)'''
+        super().__init__(parent)
+        self.camera = camera
+        self.mailbox = mailbox
+        self.get_metrics = get_metrics
+        self.show_stats = False
+        self.stats_text = ""
+        self.stats_time = None
+        self.stats_frames = 0
+        self.setAlignment(Qt.AlignCenter)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.setStyleSheet("background-color: black; color: white;")
+        self.show_placeholder("Подключение...")
+
+    def show_placeholder(self, text):
+        '''Отображение названия камеры и текста вместо видео'''
+        self.setText(f"{self.camera.name or self.camera.ip}\n{text}")
+
+    def show_state(self, state, message):
+        '''Отображение состояния подключения, пока нет видео'''
+        if state != STATE_STREAMING and message:
+            self.show_placeholder(message)
+
+    def attach(self, mailbox, get_metrics=None):
+        '''Подключение плитки к запущенному конвейеру камеры'''
+        self.mailbox = mailbox
+        self.get_metrics = get_metrics
+        if mailbox is not None:
+            mailbox.set_target_size(self.width(), self.height())
+
+    def resizeEvent(self, event):
+        '''Передача нового размера плитки потоку захвата, который готовит кадры под этот размер'''
+        if self.mailbox is not None:
+            self.mailbox.set_target_size(self.width(), self.height())
+        super().resizeEvent(event)
+
+    def refresh(self):
+        '''Отображение последнего кадра, если он появился с прошлого обновления; True, если кадр показан'''
+        frame = self.mailbox.take() if self.mailbox is not None else None
+        if frame is None:
+            return False
+        overlay_text = None
+        if self.show_stats and self.get_metrics is not None:
+            self.update_stats()
+            overlay_text = self.stats_text
+        show_rgb_frame(self, frame, overlay_text)
+        return True
+
+    def update_stats(self):
+        '''Пересчёт статистики на экране не чаще раза в STATS_INTERVAL: частота кадров, очередь записи, потери'''
+        # Модуль метрик загружается вместе с движком, к моменту показа статистики он уже импортирован
+        from metrics import find_metric
+
+        now = time.monotonic()
+        if self.stats_time is not None and now - self.stats_time < self.STATS_INTERVAL:
+            return
+
+        samples = self.get_metrics()
+        frames = find_metric(samples, 'frames_read_total')
+        fps = (frames - self.stats_frames) / (now - self.stats_time) if self.stats_time is not None else 0.0
+        self.stats_time, self.stats_frames = now, frames
+
+        queued = find_metric(samples, 'record_queue_depth')
+        dropped = find_metric(samples, 'record_frames_total', outcome='dropped')
+        self.stats_text = f"FPS {fps:.1f}  queue {queued}  dropped {dropped}"
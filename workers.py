@@ -0,0 +1,224 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+import database
+from database import Database
+from reconnect import Backoff, STATE_FAILED
+from sharedframes import SharedFrameRing, SharedFrameMailbox, SharedFrameReader
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(processName)s/%(threadName)s: %(message)s'
+'''Формат журнала процессов камер'''
+
+METRICS_INTERVAL = 1.0
+'''Период отправки метрик процессом камеры (секунды)'''
+
+MESSAGE_STATE = 'state'
+'''Сообщение процесса камеры о смене состояния подключения: (состояние, текст)'''
+MESSAGE_METRICS = 'metrics'
+'''Сообщение процесса камеры с метриками конвейера'''
+
+
+class CameraProcess:
+    '''Конвейер камеры в отдельном процессе: захват, декодирование и запись не делят GIL с другими камерами.
+    Кадры просмотра приходят через разделяемое кольцо, состояние подключения и метрики — через общую очередь'''
+
+    STOP_TIMEOUT = 15
+    '''Время на корректное завершение процесса до принудительной остановки (секунды)'''
+    RESTART_BASE = 1
+    '''Начальная задержка перед перезапуском упавшего процесса (секунды)'''
+    RESTART_MAX = 60
+    '''Максимальная задержка перед перезапуском упавшего процесса (секунды)'''
+
+    def __init__(self, camera, queue_size, overflow_policy, display_fps, state_queue, context):
+        '''Подготовка процесса камеры; кольцо кадров создаётся, только если нужен просмотр'''
+        self.camera = camera
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.display_fps = display_fps
+        self.state_queue = state_queue
+        self.context = context
+        self.lock = threading.Lock()
+
+        self.ring = SharedFrameRing() if display_fps else None
+        self.mailbox = SharedFrameReader(self.ring) if self.ring is not None else None
+
+        self.process = None
+        self.control_queue = None
+        self.stopping = False
+        self.backoff = Backoff(self.RESTART_BASE, self.RESTART_MAX)
+        self.restart_at = None
+        self.started_at = None
+        self.restarts = 0
+        self.metrics = []
+
+    def start(self):
+        '''Запуск процесса камеры'''
+        Database.subscribe('recording_settings', self.on_recording_settings_changed)
+        with self.lock:
+            self.spawn()
+
+    def spawn(self):
+        '''Создание и запуск процесса (под self.lock)'''
+        self.control_queue = self.context.Queue()
+        self.process = self.context.Process(
+            target=run_camera_worker,
+            args=(self.camera, database.DATABASE_PATH, logging.getLogger().level, self.queue_size,
+                  self.overflow_policy, self.display_fps, self.ring.name if self.ring is not None else None,
+                  self.control_queue, self.state_queue),
+            name=f'camera-{self.camera.id}',
+            daemon=True,
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        self.restart_at = None
+
+    def on_recording_settings_changed(self, settings):
+        '''Передача новых настроек записи в процесс камеры, у которого своя копия кэша настроек'''
+        with self.lock:
+            if not self.stopping and self.control_queue is not None:
+                self.control_queue.put(settings)
+
+    def check(self):
+        '''Проверка процесса супервизором: перезапуск упавшего процесса с растущей задержкой'''
+        with self.lock:
+            if self.stopping or self.process is None:
+                return
+            if self.process.is_alive():
+                if self.started_at is not None and time.monotonic() - self.started_at > self.RESTART_MAX:
+                    # Процесс проработал достаточно долго — следующее падение не считается повторным
+                    self.backoff.reset()
+                return
+
+            now = time.monotonic()
+            if self.restart_at is None:
+                delay = self.backoff.next_delay()
+                logging.error(f"Camera {self.camera.id} worker exited with code {self.process.exitcode}, "
+                              f"restarting in {delay:.1f} s")
+                self.state_queue.put((MESSAGE_STATE, self.camera.id, (STATE_FAILED, "Процесс камеры перезапускается...")))
+                self.restart_at = now + delay
+            elif now >= self.restart_at:
+                self.restarts += 1
+                self.spawn()
+
+    def get_metrics(self):
+        '''Последние метрики, полученные от процесса камеры, и число его перезапусков'''
+        return self.metrics + [('worker_restarts_total', {'camera': str(self.camera.id)}, self.restarts)]
+
+    def request_stop(self):
+        '''Запрос остановки процесса без ожидания'''
+        with self.lock:
+            self.stopping = True
+            if self.process is not None and self.process.is_alive():
+                self.control_queue.put(None)
+
+    def stop(self):
+        '''Остановка процесса камеры и освобождение кольца кадров'''
+        Database.unsubscribe('recording_settings', self.on_recording_settings_changed)
+        self.request_stop()
+        with self.lock:
+            if self.process is not None:
+                self.process.join(self.STOP_TIMEOUT)
+                if self.process.is_alive():
+                    logging.error(f"Camera {self.camera.id} worker did not stop, terminating")
+                    self.process.terminate()
+                    self.process.join()
+                self.process = None
+            if self.control_queue is not None:
+                self.control_queue.close()
+                self.control_queue = None
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+        logging.info(f"Camera {self.camera.id} worker restarts: {self.restarts}")
+        if self.mailbox is not None:
+            logging.info(f"Camera {self.camera.id} display counters: {self.mailbox.get_counters()}")
+
+
+class WorkerSupervisor(threading.Thread):
+    '''Поток, принимающий состояния и метрики процессов камер и перезапускающий упавшие процессы'''
+
+    INTERVAL = 0.5
+    '''Период проверки процессов (секунды)'''
+
+    def __init__(self, state_queue, get_workers, on_state_changed=None):
+        '''Инициализация супервизора; get_workers возвращает текущие процессы камер'''
+        super().__init__(daemon=True)
+        self.state_queue = state_queue
+        self.get_workers = get_workers
+        self.on_state_changed = on_state_changed
+        self.stop_event = threading.Event()
+
+    def run(self):
+        '''Основной метод потока'''
+        while not self.stop_event.is_set():
+            deadline = time.monotonic() + self.INTERVAL
+            while not self.stop_event.is_set():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    kind, camera_id, payload = self.state_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if kind == MESSAGE_STATE and self.on_state_changed is not None:
+                    self.on_state_changed(camera_id, *payload)
+                elif kind == MESSAGE_METRICS:
+                    for worker in self.get_workers():
+                        if worker.camera.id == camera_id:
+                            worker.metrics = payload
+
+            for worker in self.get_workers():
+                try:
+                    worker.check()
+                except Exception as e:
+                    logging.error(f"Ошибка перезапуска процесса камеры {worker.camera.id}: {str(e)}")
+
+    def stop(self):
+        '''Остановка супервизора'''
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+def run_camera_worker(camera, database_path, log_level, queue_size, overflow_policy, display_fps, ring_name,
+                      control_queue, state_queue):
+    '''Точка входа процесса камеры: конвейер работает, пока процесс интерфейса или демона не попросит остановиться'''
+    # Импорт здесь: engine создаёт процессы камер и сам импортирует этот модуль
+    from engine import CameraPipeline
+
+    # Ctrl+C получает вся группа процессов, остановкой управляет родительский процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    database.DATABASE_PATH = database_path
+    Database.start_database()
+
+    ring = SharedFrameRing(ring_name) if ring_name else None
+    mailbox = SharedFrameMailbox(ring, display_fps) if ring is not None else None
+
+    def on_state_changed(state, message):
+        state_queue.put((MESSAGE_STATE, camera.id, (state, message)))
+
+    pipeline = CameraPipeline(camera, queue_size, overflow_policy, display_fps, on_state_changed, mailbox=mailbox)
+    pipeline.start()
+    try:
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                settings = control_queue.get(timeout=METRICS_INTERVAL)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    break
+                state_queue.put((MESSAGE_METRICS, camera.id, pipeline.get_metrics()))
+                continue
+            if settings is None:
+                break
+            Database.notify('recording_settings', settings)
+    finally:
+        pipeline.stop()
+        if ring is not None:
+            ring.close()
+        Database.close()